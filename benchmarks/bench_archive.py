@@ -0,0 +1,135 @@
+"""
+冷数据归档基准：写入跨度约两年的脚本（默认 20 万条），执行一次归档 + 主库整理，
+输出主库/归档库大小、压缩率、归档耗时，以及归档前后历史分页的延迟与结果一致性。
+
+用法：
+    python benchmarks/bench_archive.py --scripts 200000 --days 730 --archive-after-days 90
+
+延迟分首页（主要在主库）和翻到归档区的页两类；完整字段需解压 payload，摘要字段不解压。
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HOOKS = ["家人们看过来", "这款真的绝了", "黄皮姐妹闭眼入", "熬夜党救星", "学生党也能冲", "回购无数次"]
+SHOTS = ["主播手持产品近景特写", "产品质地上手试色", "对比使用前后效果", "展示包装与赠品", "直播间价格牌特写"]
+
+
+def build_content(rng: random.Random, i: int) -> str:
+    lines = [f"标题: 好物推荐第{i}期 {rng.choice(HOOKS)}"]
+    for n in range(1, rng.choice([4, 6, 8]) + 1):
+        lines.append(f"镜头{n}: {rng.choice(SHOTS)}，画面{rng.randrange(1000)}")
+        lines.append(f"台词{n}: {rng.choice(HOOKS)}，{rng.choice(HOOKS)}，今天直播间专属价只要{rng.randrange(50, 500)}元")
+        lines.append("")
+    lines.append("配乐建议: 轻快流行")
+    return "\n".join(lines)
+
+
+def file_bytes(app_main, schema: str = "main") -> int:
+    conn = app_main.get_db_conn()
+    try:
+        page_size = conn.execute(f"PRAGMA {schema}.page_size").fetchone()[0]
+        page_count = conn.execute(f"PRAGMA {schema}.page_count").fetchone()[0]
+        return page_size * page_count
+    finally:
+        conn.close()
+
+
+def mb(value: int) -> str:
+    return f"{value / 1024 / 1024:.1f} MB"
+
+
+def percentiles(samples: list) -> str:
+    if not samples:
+        return "-"
+    samples = sorted(samples)
+    return f"{statistics.median(samples):.2f} / {samples[int(len(samples) * 0.95) - 1]:.2f} / {samples[int(len(samples) * 0.99) - 1]:.2f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scripts", type=int, default=200000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--days", type=int, default=730, help="脚本创建时间的跨度（天）")
+    parser.add_argument("--archive-after-days", type=int, default=90)
+    parser.add_argument("--samples", type=int, default=300)
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="archive_bench_")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    os.environ["SCRIPT_ARCHIVE_ENABLED"] = "True"
+    os.environ["SCRIPT_ARCHIVE_AFTER_DAYS"] = str(args.archive_after_days)
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+
+    rng = random.Random(15)
+    now = datetime.now()
+    step = args.days * 86400 / args.scripts
+    rows = []
+    for i in range(args.scripts):
+        content = build_content(rng, i)
+        create_time = (now - timedelta(seconds=(args.scripts - i) * step)).strftime("%Y-%m-%d %H:%M:%S")
+        req = app_main.CreateScriptRequest(user_id=f"user_{rng.randrange(args.users)}", scene="美妆", key_info=f"商品{i}")
+        rows.append(app_main._script_row(f"s{i:08d}", req, [content], create_time, [app_main._parse_script_content(content)]))
+        if len(rows) >= 5000:
+            app_main._save_script_records(rows)
+            rows = []
+    app_main._save_script_records(rows)
+
+    users = [f"user_{n}" for n in rng.sample(range(args.users), min(args.samples, args.users))]
+
+    def walk(user_id: str, fields: str) -> tuple:
+        """逐页翻完，返回 (全部记录, 首页耗时, 进入归档区后的各页耗时)"""
+        records, first_ms, deep_ms = [], 0.0, []
+        cursor = None
+        while True:
+            t0 = time.perf_counter()
+            payload = app_main._history_payload(user_id, 20, cursor, fields)
+            elapsed = (time.perf_counter() - t0) * 1000
+            if cursor is None:
+                first_ms = elapsed
+            elif payload["data"] and payload["data"][0]["create_time"] < cutoff:
+                deep_ms.append(elapsed)
+            records.extend(payload["data"])
+            cursor = payload["next_cursor"]
+            if not cursor:
+                return records, first_ms, deep_ms
+
+    cutoff = (now - timedelta(days=args.archive_after_days)).strftime("%Y-%m-%d %H:%M:%S")
+    before_full = {user_id: walk(user_id, "full") for user_id in users}
+    before_summary = {user_id: walk(user_id, "summary") for user_id in users}
+    main_before = file_bytes(app_main)
+
+    started = time.perf_counter()
+    result = app_main._run_archive_maintenance()
+    archive_elapsed = time.perf_counter() - started
+
+    after_full = {user_id: walk(user_id, "full") for user_id in users}
+    after_summary = {user_id: walk(user_id, "summary") for user_id in users}
+    consistent = all(before_full[u][0] == after_full[u][0] and before_summary[u][0] == after_summary[u][0] for u in users)
+    stats = app_main.get_storage_stats()["data"]["archive"]
+
+    print(f"脚本: {args.scripts}  跨度: {args.days} 天  归档: 早于 {args.archive_after_days} 天，共 {result['archived']} 条")
+    print(f"归档 + 整理耗时: {archive_elapsed:.1f}s  (全文索引合并 {result['fts_merge_steps']} 步，回收 {result['freed_pages']} 页)")
+    print(f"主库: {mb(main_before)} -> {mb(file_bytes(app_main))}  归档库: {mb(stats['db_bytes'])}")
+    print(f"归档正文压缩: {mb(stats['raw_bytes'])} -> {mb(stats['compressed_bytes'])}（压缩比 {stats['compress_ratio']}）")
+    print(f"分页结果与归档前一致: {consistent}（抽样 {len(users)} 个用户）")
+    print("分页延迟 p50/p95/p99 (ms):")
+    for label, before, after in (("完整字段", before_full, after_full), ("摘要字段", before_summary, after_summary)):
+        first_before = [before[u][1] for u in users]
+        first_after = [after[u][1] for u in users]
+        deep_before = [ms for u in users for ms in before[u][2]]
+        deep_after = [ms for u in users for ms in after[u][2]]
+        print(f"  {label} 首页: {percentiles(first_before)} -> {percentiles(first_after)}")
+        print(f"  {label} 归档区: {percentiles(deep_before)} -> {percentiles(deep_after)}")
+
+
+if __name__ == "__main__":
+    main()
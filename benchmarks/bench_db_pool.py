@@ -0,0 +1,108 @@
+"""
+SQLite 连接池微基准：对比 /api/video/quota 与 /api/scripts/history 在
+“每次新建连接 + 回滚日志”（旧）和“连接池 + WAL + 调优参数”（新）下的吞吐。
+
+用法：
+    python benchmarks/bench_db_pool.py --requests 4000 --concurrency 16
+
+每种模式在独立子进程、独立临时数据目录中运行，读请求并发执行的同时
+有一个写线程持续插入脚本记录，模拟生成接口与查询接口争用数据库。
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = [
+    ("旧：每次新建连接 + 回滚日志", {
+        "DB_POOL_SIZE": "0",
+        "DB_JOURNAL_MODE": "DELETE",
+        "DB_SYNCHRONOUS": "FULL",
+        "DB_MMAP_SIZE": "0",
+        "DB_CACHE_SIZE_KB": "2000"
+    }),
+    ("新：连接池 + WAL + 调优参数", {}),
+]
+
+USER_ID = "bench_user"
+
+
+def run_worker(total_requests: int, concurrency: int) -> None:
+    sys.path.insert(0, ROOT_DIR)
+    import main
+
+    for i in range(200):
+        req = main.CreateScriptRequest(user_id=USER_ID, scene="美妆", key_info=f"商品{i}")
+        main._save_script_record(f"seed_{i}", req, [f"标题: 商品{i}\n镜头1: 开场\n台词1: 家人们"], main._now_str())
+
+    stop = threading.Event()
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            req = main.CreateScriptRequest(user_id="writer", scene="美食", key_info=f"写入{i}")
+            main._save_script_record(f"w_{i}", req, ["标题: 写入"], main._now_str())
+            i += 1
+
+    endpoints = {
+        "/api/video/quota": lambda: main.get_video_quota(user_id=USER_ID),
+        "/api/scripts/history": lambda: main._history_payload(user_id=USER_ID, limit=20),
+    }
+
+    results = {}
+    writer_thread = threading.Thread(target=writer, daemon=True)
+    writer_thread.start()
+    try:
+        for name, call in endpoints.items():
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                list(executor.map(lambda _: call(), range(total_requests)))
+            elapsed = time.perf_counter() - started
+            results[name] = round(total_requests / elapsed, 1)
+    finally:
+        stop.set()
+        writer_thread.join()
+
+    print(json.dumps(results))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--worker", action="store_true")
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.requests, args.concurrency)
+        return
+
+    summary = []
+    for label, overrides in MODES:
+        with tempfile.TemporaryDirectory() as data_dir:
+            env = dict(os.environ, DATA_DIR=data_dir, DEEPSEEK_API_KEY=os.getenv("DEEPSEEK_API_KEY", "bench"))
+            env.update(overrides)
+            output = subprocess.check_output(
+                [sys.executable, os.path.abspath(__file__), "--worker",
+                 "--requests", str(args.requests), "--concurrency", str(args.concurrency)],
+                env=env,
+                cwd=ROOT_DIR
+            )
+        summary.append((label, json.loads(output.decode("utf-8").strip().splitlines()[-1])))
+
+    print(f"请求数: {args.requests}  并发: {args.concurrency}")
+    for label, result in summary:
+        print(f"\n{label}")
+        for endpoint, rps in result.items():
+            print(f"  {endpoint:<24} {rps:>10.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
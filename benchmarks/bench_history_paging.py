@@ -0,0 +1,94 @@
+"""
+历史记录分页基准：单用户 10 万条脚本时，对比旧的
+“单列 user_id 索引 + ORDER BY create_time + OFFSET” 与新的
+“(user_id, create_time, id) 复合索引 + 游标分页”。
+
+用法：
+    python benchmarks/bench_history_paging.py --rows 100000 --page-size 20
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+USER_ID = "heavy_user"
+
+
+def timed(func, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - started) / repeat * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--page-size", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="history_bench_")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+
+    print(f"写入 {args.rows} 条脚本（另有同量其他用户数据）...")
+    base = datetime(2025, 1, 1)
+    content = "标题: 基准测试\n" + "镜头1: 开场画面\n台词1: 家人们今天给大家推荐一款好物\n" * 6
+    conn = app_main.get_db_conn()
+    cursor = conn.cursor()
+    for user_id in (USER_ID, "other_user"):
+        rows = []
+        for i in range(args.rows):
+            create_time = (base + timedelta(seconds=i * 37)).strftime("%Y-%m-%d %H:%M:%S")
+            rows.append((f"{user_id}_{i}", user_id, "美妆", "口红", "口语化", "30秒", content, None, create_time, create_time))
+        cursor.executemany(
+            "INSERT INTO scripts (id, user_id, scene, key_info, style, duration, content, schemes, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+    conn.commit()
+    cursor.execute("ANALYZE")
+    conn.commit()
+
+    deep_offset = args.rows // 2
+    legacy_sql = "SELECT id, scene, key_info, style, duration, content, schemes, create_time FROM scripts WHERE user_id = ? ORDER BY create_time DESC LIMIT ? OFFSET ?"
+
+    def legacy_page(offset):
+        cursor.execute(legacy_sql, (USER_ID, args.page_size, offset)).fetchall()
+
+    # 旧方案：仅有单列 user_id 索引
+    cursor.execute("DROP INDEX IF EXISTS idx_scripts_user_time")
+    cursor.execute("CREATE INDEX idx_scripts_user ON scripts(user_id)")
+    legacy_first = timed(lambda: legacy_page(0), args.repeat)
+    legacy_deep = timed(lambda: legacy_page(deep_offset), args.repeat)
+
+    # 新方案：复合索引 + 游标
+    cursor.execute("DROP INDEX idx_scripts_user")
+    cursor.execute("CREATE INDEX idx_scripts_user_time ON scripts(user_id, create_time DESC, id DESC)")
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    conn = app_main.get_db_conn()
+    deep_row = conn.execute(
+        "SELECT create_time, id FROM scripts WHERE user_id = ? ORDER BY create_time DESC, id DESC LIMIT 1 OFFSET ?",
+        (USER_ID, deep_offset - 1)
+    ).fetchone()
+    conn.close()
+    deep_cursor = app_main._encode_cursor(deep_row["create_time"], deep_row["id"])
+
+    keyset_first = timed(lambda: app_main._history_payload(user_id=USER_ID, limit=args.page_size), args.repeat)
+    keyset_deep = timed(lambda: app_main._history_payload(user_id=USER_ID, limit=args.page_size, cursor=deep_cursor), args.repeat)
+
+    print(f"\n每页 {args.page_size} 条，深翻页位置：第 {deep_offset} 条")
+    print(f"{'':<28}{'首页(ms)':>12}{'深翻页(ms)':>14}")
+    print(f"{'旧：user_id 索引 + OFFSET':<28}{legacy_first:>12.2f}{legacy_deep:>14.2f}")
+    print(f"{'新：复合索引 + 游标':<28}{keyset_first:>12.2f}{keyset_deep:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
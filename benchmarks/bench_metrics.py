@@ -0,0 +1,132 @@
+"""
+运行指标开销基准：分别测量
+- 直方图/计数器单次记录耗时（单线程与多线程并发）
+- 同一数据库上 PooledConnection 与 TimedConnection 的主键查询耗时
+- 同一个最简路由在挂/不挂指标中间件时的单次 ASGI 调用耗时（不经过网络，只放大中间件本身的开销）
+
+用法：
+    python benchmarks/bench_metrics.py --ops 200000 --queries 50000 --requests 20000
+"""
+import argparse
+import asyncio
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def per_op_ns(fn, ops: int) -> float:
+    started = time.perf_counter()
+    fn(ops)
+    return (time.perf_counter() - started) / ops * 1e9
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--ops", type=int, default=200000)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=50000)
+    parser.add_argument("--requests", type=int, default=20000)
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="metrics_bench_")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+    from metrics import MetricsMiddleware, MetricsRegistry
+    from starlette.applications import Starlette
+    from starlette.responses import PlainTextResponse
+    from starlette.routing import Route
+
+    registry = MetricsRegistry()
+    histogram = registry.histogram("bench_seconds", "bench", ("route",))
+    counter = registry.counter("bench_total", "bench", ("type",))
+
+    def observe_loop(n: int) -> None:
+        child = histogram.labels("/api/bench")
+        for i in range(n):
+            child.observe(i * 1e-6)
+
+    def labelled_loop(n: int) -> None:
+        for _ in range(n):
+            histogram.labels("/api/bench").observe(0.003)
+
+    def counter_loop(n: int) -> None:
+        for _ in range(n):
+            counter.labels("timeout").inc()
+
+    print(f"单次记录 (ns)，{args.ops} 次:")
+    print(f"  直方图 observe:          {per_op_ns(observe_loop, args.ops):.0f}")
+    print(f"  直方图 labels + observe: {per_op_ns(labelled_loop, args.ops):.0f}")
+    print(f"  计数器 labels + inc:     {per_op_ns(counter_loop, args.ops):.0f}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.threads) as executor:
+        list(executor.map(labelled_loop, [args.ops // args.threads] * args.threads))
+    contended = (time.perf_counter() - started) / (args.ops // args.threads * args.threads) * 1e9
+    print(f"  {args.threads} 线程并发 labels + observe: {contended:.0f}")
+
+    # 数据库：同一文件分别用两种连接类型做主键查询
+    rows = []
+    for i in range(10000):
+        req = app_main.CreateScriptRequest(user_id=f"u{i % 100}", scene="美妆", key_info=f"商品{i}")
+        rows.append(app_main._script_row(f"s{i}", req, [f"标题: 第{i}期"], "2025-01-01 00:00:00"))
+    app_main._save_script_records(rows)
+
+    def query_us(factory) -> float:
+        db = sqlite3.connect(app_main.DB_PATH, factory=factory, check_same_thread=False)
+        db.row_factory = sqlite3.Row
+        started = time.perf_counter()
+        for i in range(args.queries):
+            db.execute("SELECT id, user_id FROM scripts WHERE id = ?", (f"s{i % 10000}",)).fetchone()
+            cursor = db.cursor()
+            cursor.execute("SELECT id FROM scripts WHERE user_id = ? LIMIT 5", (f"u{i % 100}",))
+            cursor.fetchall()
+            cursor.close()
+        elapsed = (time.perf_counter() - started) / args.queries * 1e6
+        sqlite3.Connection.close(db)
+        return elapsed
+
+    plain = min(query_us(app_main.PooledConnection) for _ in range(3))
+    timed = min(query_us(app_main.TimedConnection) for _ in range(3))
+    print(f"\n数据库（每轮一次主键查询 + 一次 fetchall），{args.queries} 轮:")
+    print(f"  PooledConnection: {plain:.1f} µs  TimedConnection: {timed:.1f} µs  (+{timed - plain:.1f} µs, {(timed / plain - 1) * 100:.1f}%)")
+
+    # 中间件：最简路由直接走 ASGI 调用
+    async def ping(request):
+        return PlainTextResponse("ok")
+
+    def build(with_metrics: bool):
+        app = Starlette(routes=[Route("/api/ping/{item}", ping)])
+        if with_metrics:
+            app.add_middleware(MetricsMiddleware, latency=registry.histogram("bench_http_seconds", "bench", ("method", "route", "status")),
+                               inflight=registry.gauge("bench_inflight", "bench"))
+        return app
+
+    async def call(app, n: int) -> float:
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            pass
+
+        started = time.perf_counter()
+        for i in range(n):
+            scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+                     "path": f"/api/ping/{i}", "raw_path": f"/api/ping/{i}".encode(), "query_string": b"", "root_path": "",
+                     "headers": [], "client": ("127.0.0.1", 1), "server": ("127.0.0.1", 80)}
+            await app(scope, receive, send)
+        return (time.perf_counter() - started) / n * 1e6
+
+    plain_app, metrics_app = build(False), build(True)
+    plain_req = min(asyncio.run(call(plain_app, args.requests)) for _ in range(3))
+    metrics_req = min(asyncio.run(call(metrics_app, args.requests)) for _ in range(3))
+    print(f"\nASGI 调用，{args.requests} 次:")
+    print(f"  无中间件: {plain_req:.1f} µs  有指标中间件: {metrics_req:.1f} µs  (+{metrics_req - plain_req:.1f} µs)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+"""
+配额快照缓存基准：同一进程内分别在关闭/开启缓存时并发轮询 /api/video/quota，
+同时有线程持续扣减次数、开通会员，输出轮询吞吐、延迟分位、每次轮询借用数据库连接的次数，
+最后逐个用户把缓存快照与数据库现值比对，确认写入时同步更新后没有读到旧数据。
+
+用法：
+    python benchmarks/bench_quota_cache.py --users 2000 --polls 40000 --concurrency 16
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--polls", type=int, default=40000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=2)
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="quota_cache_bench_")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+    from fastapi import HTTPException
+
+    users = [f"cache_user_{i}" for i in range(args.users)]
+    cache = app_main.quota_snapshot_cache
+    max_entries = cache.max_entries
+
+    # 统计借用数据库连接的次数
+    acquired = [0]
+    original_acquire = app_main.db_pool.acquire
+
+    def counting_acquire():
+        acquired[0] += 1
+        return original_acquire()
+
+    app_main.db_pool.acquire = counting_acquire
+
+    def run(label: str, entries: int) -> None:
+        cache.max_entries = entries
+        cache.entries.clear()
+        cache.hits = cache.misses = 0
+        stop = threading.Event()
+        writes = [0] * args.writers
+
+        def writer(slot: int) -> None:
+            rng = random.Random(slot)
+            while not stop.is_set():
+                conn = app_main.get_db_conn()
+                try:
+                    user_id = rng.choice(users)
+                    if rng.random() < 0.05:
+                        app_main._activate_membership(conn, user_id, 1)
+                    else:
+                        app_main._consume_video_quota(conn, user_id, rng.choice(app_main.VIDEO_MODELS))
+                except HTTPException:
+                    pass
+                finally:
+                    conn.close()
+                writes[slot] += 1
+                time.sleep(0.001)
+
+        def poll(i: int) -> float:
+            t0 = time.perf_counter()
+            app_main.get_video_quota(user_id=users[i % len(users)])
+            return (time.perf_counter() - t0) * 1000
+
+        threads = [threading.Thread(target=writer, args=(slot,), daemon=True) for slot in range(args.writers)]
+        for thread in threads:
+            thread.start()
+        acquired_before = acquired[0]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            latencies = sorted(executor.map(poll, range(args.polls)))
+        elapsed = time.perf_counter() - started
+        stop.set()
+        for thread in threads:
+            thread.join()
+        # 写线程也会借用连接，按写入次数扣除
+        poll_acquired = acquired[0] - acquired_before - sum(writes)
+
+        print(f"\n{label}")
+        print(f"  轮询吞吐: {args.polls / elapsed:,.0f} req/s  (同期扣减/充值 {sum(writes)} 次)")
+        print(f"  轮询延迟 p50/p95/p99 (ms): {statistics.median(latencies):.3f} / "
+              f"{latencies[int(len(latencies) * 0.95) - 1]:.3f} / {latencies[int(len(latencies) * 0.99) - 1]:.3f}")
+        print(f"  每次轮询借用连接: {poll_acquired / args.polls:.3f}  命中率: {cache.stats()['hit_ratio']}")
+
+    print(f"用户: {args.users}  轮询: {args.polls}  并发: {args.concurrency}  写线程: {args.writers}")
+    run("关闭缓存", 0)
+    run("开启缓存", max_entries)
+
+    # 一致性：缓存中的快照应与数据库现值相同
+    stale = 0
+    conn = app_main.get_db_conn()
+    try:
+        cursor = conn.cursor()
+        for user_id in users:
+            cached, _ = cache.get(user_id)
+            if cached is not None and cached != app_main._read_video_quota_snapshot(cursor, user_id, app_main._today_str()):
+                stale += 1
+        cursor.close()
+    finally:
+        conn.close()
+    print(f"\n缓存快照与数据库不一致的用户: {stale}/{len(users)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+视频配额并发扣减压测：大量线程同时对同一批用户扣减配额，校验成功次数
+永远不超过当日上限，并输出扣减吞吐。
+
+用法：
+    python benchmarks/bench_quota_concurrency.py --users 50 --attempts 40 --concurrency 32
+
+出现超发时以非零状态码退出，可直接用于回归检查。
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--attempts", type=int, default=40, help="每个用户每个模型的扣减尝试次数")
+    parser.add_argument("--concurrency", type=int, default=32)
+    args = parser.parse_args()
+
+    data_dir = tempfile.mkdtemp(prefix="quota_bench_")
+    os.environ["DATA_DIR"] = data_dir
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+    from fastapi import HTTPException
+
+    users = [f"quota_user_{i}" for i in range(args.users)]
+    members = set(users[::2])
+    conn = app_main.get_db_conn()
+    try:
+        for user_id in members:
+            app_main._activate_membership(conn, user_id, 1)
+    finally:
+        conn.close()
+
+    def consume(task):
+        user_id, model = task
+        conn = app_main.get_db_conn()
+        try:
+            app_main._consume_video_quota(conn, user_id, model)
+            return task, True
+        except HTTPException:
+            return task, False
+        finally:
+            conn.close()
+
+    tasks = [(user_id, model) for user_id in users for model in app_main.VIDEO_MODELS for _ in range(args.attempts)]
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        results = list(executor.map(consume, tasks))
+    elapsed = time.perf_counter() - started
+
+    granted = Counter(task for task, ok in results if ok)
+    over_issued = 0
+    for user_id in users:
+        limits = app_main.VIDEO_LIMITS_MEMBER if user_id in members else app_main.VIDEO_LIMITS_FREE
+        for model in app_main.VIDEO_MODELS:
+            expected = min(limits[model], args.attempts)
+            if granted[(user_id, model)] != expected:
+                over_issued += 1
+                print(f"❌ {user_id} {model}: 成功 {granted[(user_id, model)]} 次，期望 {expected} 次")
+
+    print(f"扣减尝试: {len(tasks)}  并发: {args.concurrency}  耗时: {elapsed:.2f}s  吞吐: {len(tasks) / elapsed:.1f} 次/s")
+    print(f"成功扣减: {sum(granted.values())}  异常配额: {over_issued}")
+    return 1 if over_issued else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
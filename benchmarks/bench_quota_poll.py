@@ -0,0 +1,86 @@
+"""
+配额轮询基准：大量用户并发轮询 /api/video/quota，同时有线程持续扣减次数、开通会员，
+输出轮询吞吐与延迟分位、扣减吞吐，以及轮询结束后会员表的行数（只读路径不应创建记录）。
+
+用法：
+    python benchmarks/bench_quota_poll.py --users 5000 --polls 40000 --concurrency 16
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--polls", type=int, default=40000)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--writers", type=int, default=2)
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="quota_poll_bench_")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+    from fastapi import HTTPException
+
+    users = [f"poll_user_{i}" for i in range(args.users)]
+    stop = threading.Event()
+    writes = [0] * args.writers
+
+    def writer(slot: int) -> None:
+        rng = random.Random(slot)
+        while not stop.is_set():
+            conn = app_main.get_db_conn()
+            try:
+                user_id = f"writer_{slot}_{rng.randrange(1000)}"
+                if rng.random() < 0.1:
+                    app_main._activate_membership(conn, user_id, 1)
+                else:
+                    app_main._consume_video_quota(conn, user_id, rng.choice(app_main.VIDEO_MODELS))
+                writes[slot] += 1
+            except HTTPException:
+                writes[slot] += 1
+            finally:
+                conn.close()
+
+    def poll(i: int) -> float:
+        t0 = time.perf_counter()
+        app_main.get_video_quota(user_id=users[i % len(users)])
+        return (time.perf_counter() - t0) * 1000
+
+    threads = [threading.Thread(target=writer, args=(slot,), daemon=True) for slot in range(args.writers)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        latencies = sorted(executor.map(poll, range(args.polls)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    conn = app_main.get_db_conn()
+    try:
+        poll_rows = conn.execute("SELECT COUNT(*) FROM video_memberships WHERE user_id LIKE 'poll_user_%'").fetchone()[0]
+    finally:
+        conn.close()
+
+    print(f"用户: {args.users}  轮询: {args.polls}  并发: {args.concurrency}  写线程: {args.writers}")
+    print(f"轮询吞吐: {args.polls / elapsed:,.0f} req/s")
+    print(f"轮询延迟 p50/p95/p99 (ms): {statistics.median(latencies):.2f} / "
+          f"{latencies[int(len(latencies) * 0.95) - 1]:.2f} / {latencies[int(len(latencies) * 0.99) - 1]:.2f}")
+    print(f"同期扣减/充值: {sum(writes) / elapsed:,.0f} 次/s")
+    print(f"轮询用户的会员记录数: {poll_rows}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+脚本结构化解析基准：批量解析已存储的脚本（默认 10 万条），分别测量
+纯解析吞吐与旧库升级时 _backfill_script_fields 的端到端回填耗时。
+
+用法：
+    python benchmarks/bench_script_parse.py --rows 100000
+
+样本中约两成为格式不规范的模型输出（Markdown 加粗、全角数字、缺台词、
+多余说明文字、空内容），用于确认解析器在异常输入下不会出错。
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def build_content(rng: random.Random, i: int) -> str:
+    shots = rng.choice([3, 5, 8])
+    lines = [f"标题: 好物推荐第{i}期"]
+    for n in range(1, shots + 1):
+        lines.append(f"镜头{n}: 主播手持产品近景特写，展示细节{n}")
+        lines.append(f"台词{n}: 家人们看过来，这款真的绝了，今天直播间专属价{n}")
+        lines.append("")
+    lines.append("配乐建议: 轻快流行")
+    variant = rng.random()
+    if variant < 0.05:
+        return "\n".join(f"**{line.replace(':', '**：', 1)}" if line else line for line in lines)
+    if variant < 0.10:
+        return "\n".join(line.replace("1", "１").replace("2", "２") for line in lines)
+    if variant < 0.15:
+        return "以下是为您生成的脚本：\n" + "\n".join(line for line in lines if not line.startswith("台词3"))
+    if variant < 0.18:
+        return ""
+    if variant < 0.20:
+        return "抱歉，我无法完成这个请求。"
+    return "\n".join(lines)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="parse_bench_")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+
+    rng = random.Random(7)
+    contents = [build_content(rng, i) for i in range(args.rows)]
+
+    started = time.perf_counter()
+    parsed = [app_main._parse_script_content(content) for content in contents]
+    parse_elapsed = time.perf_counter() - started
+    warnings = Counter(bool(item["warnings"]) for item in parsed)
+
+    # 模拟旧库：只有原始文本，没有标题与结构化列
+    base = datetime(2025, 1, 1)
+    conn = app_main.get_db_conn()
+    cursor = conn.cursor()
+    rows = []
+    for i, content in enumerate(contents):
+        create_time = (base + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")
+        rows.append((f"s{i}", f"user_{i % 100}", "美妆", "口红", "口语化", "30秒", content, json.dumps([content], ensure_ascii=False), create_time, create_time))
+    cursor.executemany(
+        "INSERT INTO scripts (id, user_id, scene, key_info, style, duration, content, schemes, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        rows
+    )
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+    started = time.perf_counter()
+    updated = app_main._backfill_script_fields()
+    backfill_elapsed = time.perf_counter() - started
+
+    print(f"脚本数: {args.rows}  含格式告警: {warnings[True]}")
+    print(f"纯解析: {parse_elapsed:.2f}s  ({args.rows / parse_elapsed:,.0f} 条/s)")
+    print(f"回填（读取 + 解析 + 写回）: {backfill_elapsed:.2f}s  ({updated / backfill_elapsed:,.0f} 条/s)，更新 {updated} 条")
+
+
+if __name__ == "__main__":
+    main()
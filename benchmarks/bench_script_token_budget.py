@@ -0,0 +1,84 @@
+"""
+脚本 max_tokens 估算收敛检查：每镜头 token 数的初始值故意设得偏低，连续生成脚本（上游为本地模拟服务），
+按轮输出首次调用被截断的次数、续写次数和估值变化，确认估值能从截断结果中抬升、之后不再截断。
+
+用法：
+    python benchmarks/bench_script_token_budget.py --initial-per-shot 30 --requests 60 --shot-chars 300
+
+最后一轮仍有首次调用被截断，或估值始终没有完整样本时以非零状态码退出，可直接用于回归检查。
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DURATIONS = ["15秒", "30秒", "60秒"]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--initial-per-shot", type=float, default=30.0, help="SCRIPT_TOKENS_PER_SHOT 初始值")
+    parser.add_argument("--requests", type=int, default=60)
+    parser.add_argument("--rounds", type=int, default=6, help="把请求均分为几轮统计")
+    parser.add_argument("--shot-chars", type=int, default=300, help="模拟服务每个镜头追加的台词字数上限")
+    parser.add_argument("--stream-every", type=int, default=3, help="每隔几个请求走一次流式接口，0 为不走")
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="token_budget_bench_")
+    os.environ["DEEPSEEK_API_KEY"] = "bench"
+    os.environ["DEEPSEEK_API_URL"] = "http://fake/v1/chat/completions"
+    os.environ["SCRIPT_TOKENS_PER_SHOT"] = str(args.initial_per_shot)
+    os.environ["SCRIPT_CACHE_ENABLED"] = "false"
+    os.environ["SCRIPT_SIMILAR_ENABLED"] = "false"
+    sys.path.insert(0, ROOT_DIR)
+    sys.path.insert(0, os.path.join(ROOT_DIR, "benchmarks"))
+    import httpx
+    from fastapi.testclient import TestClient
+
+    import fake_upstreams
+    import main as app_main
+
+    fake_parser = argparse.ArgumentParser()
+    fake_upstreams.add_arguments(fake_parser)
+    fake_options = fake_parser.parse_args([
+        "--deepseek-latency", "0", "--deepseek-first-token", "0", "--deepseek-chunk-interval", "0",
+        "--deepseek-shot-chars", str(args.shot_chars)
+    ])
+    app_main.get_deepseek_client = lambda: httpx.AsyncClient(transport=httpx.ASGITransport(app=fake_upstreams.create_app(fake_options)))
+    estimator = app_main.script_token_estimator
+    continuations = app_main.SCRIPT_CONTINUATIONS
+
+    def continuation_count() -> float:
+        return sum(continuations.labels(mode).value for mode in ("chat", "stream"))
+
+    per_round = max(args.requests // max(args.rounds, 1), 1)
+    last_round_truncations = 0
+    incomplete = 0
+    print(f"初始每镜头 token 数: {estimator.stats()['tokens_per_shot']}")
+    with TestClient(app_main.app) as client:
+        for round_index in range(args.rounds):
+            truncations_before, continuations_before = estimator.truncations, continuation_count()
+            for n in range(per_round):
+                seq = round_index * per_round + n
+                payload = {"user_id": "bench", "scene": "美妆", "key_info": f"口红{seq}", "duration": DURATIONS[seq % len(DURATIONS)]}
+                if args.stream_every and seq % args.stream_every == 0:
+                    body = client.post("/api/script/create/stream", json=payload).text
+                    incomplete += '"truncated": true' in body
+                else:
+                    incomplete += bool(client.post("/api/script/create", json=payload).json()["data"].get("truncated"))
+            last_round_truncations = estimator.truncations - truncations_before
+            stats = estimator.stats()
+            print(f"第 {round_index + 1} 轮: 首次截断 {last_round_truncations:3d}  续写 {continuation_count() - continuations_before:4.0f}"
+                  f"  每镜头 token 数 {stats['tokens_per_shot']:6.1f}  完整样本 {stats['samples']}")
+
+    stats = estimator.stats()
+    print(f"累计首次截断: {stats['truncations']}  完整样本: {stats['samples']}  续写后仍不完整: {incomplete}")
+    if last_round_truncations or not stats["samples"]:
+        print("❌ 估值没有从偏低的初始值收敛")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
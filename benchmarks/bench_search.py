@@ -0,0 +1,91 @@
+"""
+全文检索基准：大量脚本（默认 100 万条，分布在 1000 个用户下）时
+/api/scripts/search 的延迟分布。
+
+用法：
+    python benchmarks/bench_search.py --rows 1000000 --users 1000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BRANDS = ["雅诗兰黛", "兰蔻", "迪奥", "香奈儿", "完美日记", "花西子", "珀莱雅", "薇诺娜", "欧莱雅", "资生堂"]
+PRODUCTS = ["小棕瓶精华", "粉水", "口红999", "气垫粉底", "防晒霜", "卸妆油", "面膜", "眼霜", "散粉", "洗面奶"]
+HOOKS = ["家人们", "绝了", "黄皮显白", "熬夜救星", "学生党必入", "平价好物", "回购无数次", "闭眼入"]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="search_bench_")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+
+    rng = random.Random(42)
+    base = datetime(2025, 1, 1)
+    print(f"写入 {args.rows} 条脚本（含 FTS 索引）...")
+    started = time.perf_counter()
+    conn = app_main.get_db_conn()
+    cursor = conn.cursor()
+    batch = []
+    for i in range(args.rows):
+        key_info = f"{rng.choice(BRANDS)}{rng.choice(PRODUCTS)} 款号{i:07d}"
+        content = f"标题: {key_info}{rng.choice(HOOKS)}\n镜头1: 产品特写\n台词1: {rng.choice(HOOKS)}，今天推荐{key_info}"
+        create_time = (base + timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")
+        batch.append((f"s{i}", f"user_{i % args.users}", "美妆", key_info, "口语化", "30秒", content, None, create_time, create_time))
+        if len(batch) >= 20000:
+            cursor.executemany(
+                "INSERT INTO scripts (id, user_id, scene, key_info, style, duration, content, schemes, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                batch
+            )
+            conn.commit()
+            batch = []
+    if batch:
+        cursor.executemany(
+            "INSERT INTO scripts (id, user_id, scene, key_info, style, duration, content, schemes, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            batch
+        )
+        conn.commit()
+    cursor.close()
+    conn.close()
+    print(f"写入耗时 {time.perf_counter() - started:.1f}s，FTS5 可用: {app_main.FTS_ENABLED}")
+
+    # 三类查询：高频商品词、品牌 + 卖点组合、只命中一条的款号
+    workloads = {
+        "高频商品词": lambda: (rng.choice(PRODUCTS), rng.randrange(args.rows)),
+        "品牌 + 卖点": lambda: (f"{rng.choice(BRANDS)} {rng.choice(HOOKS)}", rng.randrange(args.rows)),
+        "精确款号": lambda: (None, rng.randrange(args.rows)),
+    }
+
+    print(f"\n每类查询 {args.queries} 次")
+    print(f"{'查询类型':<14}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for name, make_query in workloads.items():
+        latencies = []
+        for _ in range(args.queries):
+            q, row_no = make_query()
+            user_id = f"user_{row_no % args.users}"
+            if q is None:
+                q = f"款号{row_no:07d}"
+            t0 = time.perf_counter()
+            app_main.search_scripts(user_id=user_id, q=q, limit=20)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        latencies.sort()
+        p95 = latencies[int(len(latencies) * 0.95) - 1]
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"{name:<14}{statistics.median(latencies):>10.2f}{p95:>10.2f}{p99:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
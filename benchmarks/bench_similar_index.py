@@ -0,0 +1,120 @@
+"""
+近似请求索引基准：对大量历史请求（默认 100 万条）构建 MinHash/LSH 索引，
+输出构建耗时、索引数组占用、查询延迟，以及“只改了表情/语序/个别词”的
+变体请求的召回率和不相关请求的误报率。
+
+用法：
+    python benchmarks/bench_similar_index.py --rows 1000000 --queries 2000
+
+只测索引本身（不经过数据库），复核使用与线上相同的 shingle_jaccard。
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+
+from minhash_index import MinHashLSHIndex, shingle_jaccard, shingles  # noqa: E402
+
+BRANDS = ["雅诗兰黛", "兰蔻", "迪奥", "香奈儿", "完美日记", "花西子", "珀莱雅", "薇诺娜", "欧莱雅", "资生堂"]
+PRODUCTS = ["小棕瓶精华", "粉水", "口红", "气垫粉底", "防晒霜", "卸妆油", "面膜", "眼霜", "散粉", "洗面奶"]
+HOOKS = ["熬夜救星", "黄皮显白", "学生党必入", "平价好物", "回购无数次", "敏感肌可用", "持久不脱妆", "清爽不油腻"]
+EMOJIS = ["🔥", "✨", "💄", "!!", "~", "👍"]
+GROUPS = ["美妆\x1f口语化\x1f30秒", "美妆\x1f专业\x1f60秒", "美食\x1f口语化\x1f15秒"]
+
+
+# 商品名从常用字中随机组合，保证不同记录之间大多不相似
+NAME_CHARS = "光润泽水感丝绒雾面柔焦修护舒缓净透亮肤保湿补水控油遮瑕持妆玫瑰樱花柠檬薄荷茶树积雪草烟酰胺玻尿酸胶原蛋白维生素精油乳霜露液膏粉笔盘刷棉片喷雾"
+
+
+def make_key_info(rng: random.Random, i: int) -> str:
+    name = "".join(rng.choice(NAME_CHARS) for _ in range(rng.randint(4, 7)))
+    return f"{rng.choice(BRANDS)}{name}{rng.choice(PRODUCTS)} {rng.choice(HOOKS)} {rng.choice(HOOKS)}"
+
+
+def perturb(rng: random.Random, key_info: str) -> str:
+    words = key_info.split(" ")
+    choice = rng.random()
+    if choice < 0.4:
+        rng.shuffle(words)
+    elif choice < 0.7:
+        words.append(rng.choice(EMOJIS))
+    else:
+        words.insert(1, rng.choice(EMOJIS))
+        words[0], words[-1] = words[-1], words[0]
+    return " ".join(words)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--threshold", type=float, default=0.8)
+    parser.add_argument("--bands", type=int, default=10)
+    parser.add_argument("--rows-per-band", type=int, default=4)
+    args = parser.parse_args()
+
+    rng = random.Random(3)
+    index = MinHashLSHIndex(bands=args.bands, rows=args.rows_per_band)
+    key_infos = []
+    groups = []
+
+    started = time.perf_counter()
+    batch = []
+    for i in range(args.rows):
+        key_info = make_key_info(rng, i)
+        group = GROUPS[i % len(GROUPS)]
+        key_infos.append(key_info)
+        groups.append(group)
+        batch.append((i, group, shingles(key_info)))
+        if len(batch) >= 5000:
+            index.add_many(batch)
+            batch = []
+    index.add_many(batch)
+    build_elapsed = time.perf_counter() - started
+
+    def best_match(group, key_info):
+        query = shingles(key_info)
+        best_id, best_score = None, 0.0
+        for record_id in index.query(group, query):
+            if groups[record_id] != group:
+                continue
+            score = shingle_jaccard(query, shingles(key_infos[record_id]))
+            if score > best_score:
+                best_id, best_score = record_id, score
+        return best_id, best_score
+
+    latencies = []
+    recalled = 0
+    for _ in range(args.queries):
+        target = rng.randrange(args.rows)
+        query = perturb(rng, key_infos[target])
+        t0 = time.perf_counter()
+        best_id, best_score = best_match(groups[target], query)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if best_id is not None and best_score >= args.threshold and (
+                best_id == target or shingles(key_infos[best_id]) == shingles(key_infos[target])):
+            recalled += 1
+
+    false_hits = 0
+    for i in range(args.queries):
+        query = f"{rng.choice(BRANDS)}蓝牙耳机 降噪长续航 型号X{i:06d}"
+        _, best_score = best_match(GROUPS[0], query)
+        if best_score >= args.threshold:
+            false_hits += 1
+
+    latencies.sort()
+    print(f"记录数: {args.rows}  分段: {args.bands} x {args.rows_per_band}  阈值: {args.threshold}")
+    print(f"构建耗时: {build_elapsed:.1f}s  ({args.rows / build_elapsed:,.0f} 条/s)")
+    print(f"索引数组占用: {index.memory_bytes() / 1024 / 1024:.1f} MB")
+    print(f"查询延迟 p50/p95/p99 (ms): {statistics.median(latencies):.2f} / "
+          f"{latencies[int(len(latencies) * 0.95) - 1]:.2f} / {latencies[int(len(latencies) * 0.99) - 1]:.2f}")
+    print(f"变体请求召回: {recalled}/{args.queries}  不相关请求误报: {false_hits}/{args.queries}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+正文去重存储基准：按旧布局写入一批脚本和收藏（正文内联在 content 列，
+schemes/structured 再各存一份），然后执行迁移，对比 VACUUM 后的数据库大小。
+
+数据分布：
+- 一部分生成结果来自缓存/近似复用，热门脚本按 Zipf 分布被反复命中
+- 一部分脚本被收藏，收藏时完整复制正文
+
+用法：
+    python benchmarks/bench_text_blobs.py --scripts 100000 --reuse-ratio 0.3 --favorite-ratio 0.2
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HOOKS = ["家人们看过来", "这款真的绝了", "黄皮姐妹闭眼入", "熬夜党救星", "学生党也能冲", "回购无数次"]
+SHOTS = ["主播手持产品近景特写", "产品质地上手试色", "对比使用前后效果", "展示包装与赠品", "直播间价格牌特写"]
+
+
+def build_content(rng: random.Random, i: int) -> str:
+    lines = [f"标题: 好物推荐第{i}期 {rng.choice(HOOKS)}"]
+    for n in range(1, rng.choice([4, 6, 8]) + 1):
+        lines.append(f"镜头{n}: {rng.choice(SHOTS)}，画面{rng.randrange(1000)}")
+        lines.append(f"台词{n}: {rng.choice(HOOKS)}，{rng.choice(HOOKS)}，今天直播间专属价只要{rng.randrange(50, 500)}元")
+        lines.append("")
+    lines.append("配乐建议: 轻快流行")
+    return "\n".join(lines)
+
+
+def db_size(app_main) -> tuple:
+    """合并全文索引并 VACUUM 后返回 (总字节数, 全文索引字节数)；SQLite 未编译 dbstat 时后者为 None"""
+    conn = app_main.get_db_conn()
+    try:
+        # 合并全文索引段，避免迁移时逐行更新留下的碎片影响对比
+        if app_main.FTS_ENABLED:
+            for fts_table in app_main.FTS_TABLES.values():
+                conn.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('optimize')")
+            conn.commit()
+        conn.execute("VACUUM")
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+        try:
+            fts_bytes = conn.execute("SELECT COALESCE(SUM(pgsize), 0) FROM dbstat WHERE name LIKE '%\\_fts\\_%' ESCAPE '\\'").fetchone()[0]
+        except Exception:
+            fts_bytes = None
+        return page_size * page_count, fts_bytes
+    finally:
+        conn.close()
+
+
+def mb(value: int) -> str:
+    return f"{value / 1024 / 1024:.1f} MB"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scripts", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--popular", type=int, default=2000, help="被反复复用的热门脚本数")
+    parser.add_argument("--reuse-ratio", type=float, default=0.3)
+    parser.add_argument("--favorite-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    os.environ["DATA_DIR"] = tempfile.mkdtemp(prefix="blob_bench_")
+    os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+    sys.path.insert(0, ROOT_DIR)
+    import main as app_main
+
+    rng = random.Random(11)
+    popular = [build_content(rng, i) for i in range(args.popular)]
+    weights = [1 / (rank + 1) for rank in range(args.popular)]
+    base = datetime(2025, 1, 1)
+
+    scripts = []
+    favorites = []
+    for i in range(args.scripts):
+        if rng.random() < args.reuse_ratio:
+            content = rng.choices(popular, weights=weights)[0]
+        else:
+            content = build_content(rng, args.popular + i)
+        create_time = (base + timedelta(seconds=i * 13)).strftime("%Y-%m-%d %H:%M:%S")
+        user_id = f"user_{rng.randrange(args.users)}"
+        structured = [app_main._parse_script_content(content)]
+        scripts.append((
+            f"s{i}", user_id, "美妆", f"商品{i}", "口语化", "30秒", structured[0]["title"], content,
+            json.dumps([content], ensure_ascii=False), json.dumps(structured, ensure_ascii=False), create_time, create_time
+        ))
+        if rng.random() < args.favorite_ratio:
+            favorites.append((f"f{i}", user_id, "美妆", "口语化", "30秒", f"商品{i}", structured[0]["title"], content, 0, "方案1", create_time))
+
+    # 旧布局：正文内联，content_hash 为空
+    conn = app_main.get_db_conn()
+    cursor = conn.cursor()
+    cursor.executemany(
+        "INSERT INTO scripts (id, user_id, scene, key_info, style, duration, title, content, schemes, structured, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        scripts
+    )
+    cursor.executemany(
+        "INSERT INTO favorites (id, user_id, scene, style, duration, key_info, title, content, scheme_index, scheme_name, create_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        favorites
+    )
+    conn.commit()
+    cursor.close()
+    conn.close()
+    before = db_size(app_main)
+
+    started = time.perf_counter()
+    app_main._backfill_script_fields()
+    migrate_elapsed = time.perf_counter() - started
+    after = db_size(app_main)
+    stats = app_main.get_storage_stats()["data"]
+
+    print(f"脚本: {len(scripts)}  收藏: {len(favorites)}  复用比例: {args.reuse_ratio}")
+    print(f"去重后正文: {stats['text_blobs']} 份，被引用 {stats['text_references']} 次")
+    # 基准中 FTS 触发器已是新版，迁移时会逐行重建全文索引；真实升级时先删除旧索引、迁移后一次性重建
+    print(f"迁移耗时（含逐行更新全文索引）: {migrate_elapsed:.1f}s")
+    print(f"数据库大小（VACUUM 后）: {mb(before[0])} -> {mb(after[0])}（减少 {(1 - after[0] / before[0]) * 100:.1f}%）")
+    if before[1] is not None:
+        text_before, text_after = before[0] - before[1], after[0] - after[1]
+        print(f"  其中全文索引: {mb(before[1])} -> {mb(after[1])}")
+        print(f"  其余表与索引: {mb(text_before)} -> {mb(text_after)}（减少 {(1 - text_after / text_before) * 100:.1f}%）")
+
+
+if __name__ == "__main__":
+    main()
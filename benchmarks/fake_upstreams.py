@@ -0,0 +1,219 @@
+"""
+压测用的本地 DeepSeek / Seedance 模拟服务，延迟、流式节奏和错误率均可配置。
+
+- POST /v1/chat/completions：兼容 DeepSeek 接口，stream=true 时按 SSE 分片返回，
+  首个分片前等待 --deepseek-first-token，之后每个分片间隔 --deepseek-chunk-interval
+- POST /sedance/generate：返回 task_id 与带签名有效期的 video_url
+- GET /_stats：各接口按结果统计的调用次数
+
+镜头数取自提示词中的"镜头数量：N个"（没有时用 --deepseek-shots），每个镜头的长度按 --deepseek-shot-chars 随机波动；
+输出超过请求的 max_tokens（按 2 字 1 token 计）时截断并返回 finish_reason=length，续写请求（"从镜头N开始"）只输出剩余镜头。
+usage 模拟 DeepSeek 的上下文缓存：按 --cache-block-chars 个字符为一块，与此前请求相同的前缀块计为 prompt_cache_hit_tokens。
+
+错误注入按顺序抽签：返回 500、返回 429（带 Retry-After）、挂起 --hang-seconds 后再响应（用于触发客户端超时）；
+流式请求还可按 --deepseek-stream-abort-rate 在输出一半时断开连接。同一 --seed 下结果序列可复现。
+
+用法：
+    python benchmarks/fake_upstreams.py --port 9100 --deepseek-latency 1.5 --deepseek-error-rate 0.02
+    DEEPSEEK_API_URL=http://127.0.0.1:9100/v1/chat/completions SEDANCE_API_URL=http://127.0.0.1:9100/sedance/generate python app.py
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+SHOTS = ["主播手持产品近景特写", "产品质地上手试色", "对比使用前后效果", "展示包装与赠品", "直播间价格牌特写"]
+LINES = ["家人们看过来，这款真的绝了", "黄皮姐妹闭眼入", "熬夜党救星，学生党也能冲", "回购无数次，今天直播间专属价"]
+
+
+def add_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--seed", type=int, default=20)
+    parser.add_argument("--deepseek-latency", type=float, default=1.0, help="非流式响应耗时（秒）")
+    parser.add_argument("--deepseek-jitter", type=float, default=0.3, help="延迟在 ±该比例内均匀波动")
+    parser.add_argument("--deepseek-first-token", type=float, default=0.4, help="流式首个分片前的等待（秒）")
+    parser.add_argument("--deepseek-chunk-interval", type=float, default=0.02, help="流式分片间隔（秒）")
+    parser.add_argument("--deepseek-chunk-chars", type=int, default=8, help="每个流式分片的字符数")
+    parser.add_argument("--deepseek-shots", type=int, default=6, help="提示词未指定镜头数时生成的镜头数")
+    parser.add_argument("--deepseek-shot-chars", type=int, default=0, help="每个镜头追加的台词字数上限（随机 0~该值），用于模拟长短不一的输出")
+    parser.add_argument("--deepseek-error-rate", type=float, default=0.0)
+    parser.add_argument("--deepseek-429-rate", type=float, default=0.0)
+    parser.add_argument("--deepseek-hang-rate", type=float, default=0.0)
+    parser.add_argument("--deepseek-stream-abort-rate", type=float, default=0.0)
+    parser.add_argument("--sedance-latency", type=float, default=2.0)
+    parser.add_argument("--sedance-jitter", type=float, default=0.3)
+    parser.add_argument("--sedance-error-rate", type=float, default=0.0)
+    parser.add_argument("--sedance-hang-rate", type=float, default=0.0)
+    parser.add_argument("--hang-seconds", type=float, default=180.0)
+    parser.add_argument("--retry-after", type=int, default=1, help="429 响应的 Retry-After（秒）")
+    parser.add_argument("--cache-block-chars", type=int, default=128, help="模拟上下文缓存的前缀块大小（字符），0 为不模拟")
+
+
+def build_script(rng: random.Random, shots: int, start: int = 1, shot_chars: int = 0) -> str:
+    lines = [f"标题: 好物推荐第{rng.randrange(10000)}期 {rng.choice(LINES)}"] if start == 1 else []
+    for n in range(start, shots + 1):
+        padding = "，".join(rng.choice(LINES) for _ in range(rng.randrange(shot_chars // 12 + 1))) if shot_chars > 0 else ""
+        lines.append(f"镜头{n}: {rng.choice(SHOTS)}")
+        lines.append(f"台词{n}: {rng.choice(LINES)}，只要{rng.randrange(50, 500)}元{('，' + padding) if padding else ''}")
+        lines.append("")
+    lines.append("配乐建议: 轻快流行")
+    return "\n".join(lines)
+
+
+def script_plan(messages: list, default_shots: int) -> tuple:
+    """从提示词中读出 (镜头数, 起始镜头)；只要求配乐建议的续写返回起始镜头 = 镜头数 + 1"""
+    prompt = "".join(message.get("content", "") for message in messages)
+    match = re.search(r"镜头数量：(\d+)个", prompt)
+    shots = int(match.group(1)) if match else default_shots
+    last = messages[-1].get("content", "") if messages else ""
+    if len(messages) > 2 and "配乐建议这一行" in last:
+        return shots, shots + 1
+    match = re.search(r"从镜头(\d+)开始", last) if len(messages) > 2 else None
+    return shots, int(match.group(1)) if match else 1
+
+
+def create_app(options: argparse.Namespace) -> Starlette:
+    rng = random.Random(options.seed)
+    stats: Counter = Counter()
+    cached_prefixes = set()
+
+    def cached_prefix_chars(prompt: str) -> int:
+        # 只有从开头起连续相同的块才算命中，与按前缀匹配的上下文缓存一致
+        size = options.cache_block_chars
+        if size <= 0:
+            return 0
+        hit, missed = 0, False
+        for end in range(size, len(prompt) + 1, size):
+            digest = hash(prompt[:end])
+            if not missed and digest in cached_prefixes:
+                hit = end
+            else:
+                missed = True
+                cached_prefixes.add(digest)
+        return hit
+
+    def delay(mean: float, jitter: float) -> float:
+        return max(0.0, mean * (1 + rng.uniform(-jitter, jitter)))
+
+    def pick_fault(error_rate: float, rate_limit_rate: float, hang_rate: float) -> str:
+        draw = rng.random()
+        for fault, rate in (("error", error_rate), ("rate_limited", rate_limit_rate), ("hang", hang_rate)):
+            if draw < rate:
+                return fault
+            draw -= rate
+        return ""
+
+    async def chat_completions(request: Request) -> Response:
+        body = await request.json()
+        stream = bool(body.get("stream"))
+        prompt = "".join(message.get("content", "") for message in body.get("messages", []))
+        hit_chars = cached_prefix_chars(prompt)
+        fault = pick_fault(options.deepseek_error_rate, options.deepseek_429_rate, options.deepseek_hang_rate)
+        stats[f"deepseek_{fault or 'ok'}"] += 1
+        if fault == "error":
+            await asyncio.sleep(delay(options.deepseek_latency, options.deepseek_jitter) / 4)
+            return JSONResponse({"error": {"message": "模拟服务内部错误"}}, status_code=500)
+        if fault == "rate_limited":
+            return JSONResponse({"error": {"message": "模拟限流"}}, status_code=429,
+                                headers={"Retry-After": str(options.retry_after)})
+        if fault == "hang":
+            await asyncio.sleep(options.hang_seconds)
+
+        shots, start = script_plan(body.get("messages", []), options.deepseek_shots)
+        content = build_script(rng, shots, start, options.deepseek_shot_chars)
+        if start > shots:
+            content = "配乐建议: 轻快流行"
+        finish_reason = "stop"
+        max_tokens = body.get("max_tokens")
+        if max_tokens and len(content) // 2 > max_tokens:
+            content = content[:max_tokens * 2]
+            finish_reason = "length"
+            stats["deepseek_truncated"] += 1
+        usage = {
+            "prompt_tokens": len(prompt) // 2,
+            "completion_tokens": len(content) // 2,
+            "prompt_cache_hit_tokens": hit_chars // 2,
+            "prompt_cache_miss_tokens": len(prompt) // 2 - hit_chars // 2
+        }
+        usage["total_tokens"] = usage["prompt_tokens"] + usage["completion_tokens"]
+        completion_id = f"fake-{uuid.uuid4().hex[:12]}"
+        if not stream:
+            await asyncio.sleep(delay(options.deepseek_latency, options.deepseek_jitter))
+            return JSONResponse({
+                "id": completion_id,
+                "object": "chat.completion",
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish_reason}],
+                "usage": usage
+            })
+
+        abort = rng.random() < options.deepseek_stream_abort_rate
+        if abort:
+            stats["deepseek_stream_abort"] += 1
+        first_token = delay(options.deepseek_first_token, options.deepseek_jitter)
+        size = max(options.deepseek_chunk_chars, 1)
+        pieces = [content[i:i + size] for i in range(0, len(content), size)]
+
+        async def events():
+            await asyncio.sleep(first_token)
+            for index, piece in enumerate(pieces):
+                if abort and index >= len(pieces) // 2:
+                    raise ConnectionResetError("模拟上游中途断开")
+                chunk = {"id": completion_id, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                await asyncio.sleep(options.deepseek_chunk_interval)
+            final = {"id": completion_id, "choices": [{"index": 0, "delta": {}, "finish_reason": finish_reason}], "usage": usage}
+            yield f"data: {json.dumps(final, ensure_ascii=False)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    async def sedance_generate(request: Request) -> Response:
+        await request.json()
+        fault = pick_fault(options.sedance_error_rate, 0.0, options.sedance_hang_rate)
+        stats[f"sedance_{fault or 'ok'}"] += 1
+        if fault == "error":
+            return JSONResponse({"message": "模拟服务内部错误"}, status_code=502)
+        if fault == "hang":
+            await asyncio.sleep(options.hang_seconds)
+        await asyncio.sleep(delay(options.sedance_latency, options.sedance_jitter))
+        task_id = f"fake_{uuid.uuid4().hex[:12]}"
+        signed_at = time.strftime("%Y%m%dT%H%M%SZ", time.gmtime())
+        return JSONResponse({
+            "data": {
+                "task_id": task_id,
+                "video_url": f"https://cdn.example.com/{task_id}.mp4?X-Tos-Date={signed_at}&X-Tos-Expires=86400"
+            }
+        })
+
+    async def get_stats(request: Request) -> Response:
+        return JSONResponse(dict(stats))
+
+    return Starlette(routes=[
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/sedance/generate", sedance_generate, methods=["POST"]),
+        Route("/_stats", get_stats, methods=["GET"]),
+    ])
+
+
+def main() -> None:
+    import uvicorn
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    add_arguments(parser)
+    options = parser.parse_args()
+    uvicorn.run(create_app(options), host=options.host, port=options.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+端到端压测：启动本地 DeepSeek / Seedance 模拟服务（fake_upstreams.py）和一个独立的 main.py 服务进程，
+按“场景 × 并发”做闭环压测，输出每组的请求数、失败数、RPS 与 p50/p95/p99 延迟；
+结果可保存为基线，之后每次修改 main.py 都能离线与基线对比。
+
+场景：
+- script_create  POST /api/script/create
+- script_stream  POST /api/script/create/stream，读完整个 SSE 流，出现 error 事件记为失败
+- history        GET /api/scripts/history，随机用户，按 next_cursor 随机往后翻页
+- quota          GET /api/video/quota
+- video          POST /api/video/generate 后长轮询 /api/video/jobs/{id} 至完成，每次换一个新用户（免费次数够用）
+
+用法：
+    python benchmarks/load_test.py --scenarios all --concurrency 1,8,32 --duration 15
+    python benchmarks/load_test.py --save-baseline benchmarks/load_baseline.json
+    python benchmarks/load_test.py --baseline benchmarks/load_baseline.json --tolerance 0.1
+
+未识别的参数原样传给模拟服务，例如 --deepseek-latency 2 --deepseek-error-rate 0.05；
+--env KEY=VALUE 覆盖服务进程的环境变量，例如 --env SCRIPT_CACHE_ENABLED=True。
+对比时 RPS 下降或 p95 上升超过 --tolerance 记为回退，进程以非 0 状态退出。
+基线与机器相关，请在同一台机器、同一组参数下生成和对比。
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+import httpx
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = ("script_create", "script_stream", "history", "quota", "video")
+SCENES = ["美妆", "美食", "服饰", "数码", "家居", "母婴"]
+KEY_INFOS = ["控油持妆粉底液", "低糖代餐饼干", "冰丝防晒衣", "降噪蓝牙耳机", "免打孔置物架", "婴儿湿巾"]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def percentile_ms(samples: list, ratio: float) -> float:
+    if not samples:
+        return 0.0
+    return samples[max(int(len(samples) * ratio) - 1, 0)] * 1000
+
+
+def seed_history(users: int, scripts_per_user: int) -> None:
+    """在服务进程启动前直接写库，准备历史记录分页场景的数据"""
+    sys.path.insert(0, ROOT_DIR)
+    import main
+
+    rng = random.Random(7)
+    rows = []
+    for u in range(users):
+        for i in range(scripts_per_user):
+            req = main.CreateScriptRequest(user_id=f"load_user_{u}", scene=rng.choice(SCENES), key_info=f"{rng.choice(KEY_INFOS)}{i}")
+            content = f"标题: {req.key_info}\n镜头1: 开场特写\n台词1: 家人们看过来\n\n镜头2: 上手试用\n台词2: 今天直播间专属价"
+            create_time = f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} {i % 24:02d}:{u % 60:02d}:{i % 60:02d}"
+            rows.append(main._script_row(f"load_{u}_{i}", req, [content], create_time))
+        if len(rows) >= 5000:
+            main._save_script_records(rows)
+            rows = []
+    main._save_script_records(rows)
+
+
+# ------------------- 场景：每次调用发一个逻辑请求，返回是否成功 -------------------
+def _script_body(rng: random.Random) -> dict:
+    return {
+        "user_id": f"load_user_{rng.randrange(1000)}",
+        "scene": rng.choice(SCENES),
+        "key_info": f"{rng.choice(KEY_INFOS)} {uuid.uuid4().hex[:6]}",
+        "style": "口语化",
+        "duration": "30秒"
+    }
+
+
+async def run_script_create(client: httpx.AsyncClient, rng: random.Random, state: dict, options) -> bool:
+    response = await client.post("/api/script/create", json=_script_body(rng))
+    return response.status_code == 200 and response.json().get("code") == 200
+
+
+async def run_script_stream(client: httpx.AsyncClient, rng: random.Random, state: dict, options) -> bool:
+    done = False
+    async with client.stream("POST", "/api/script/create/stream", json=_script_body(rng)) as response:
+        if response.status_code != 200:
+            await response.aread()
+            return False
+        async for line in response.aiter_lines():
+            if line == "event: error":
+                return False
+            if line == "event: done":
+                done = True
+    return done
+
+
+async def run_history(client: httpx.AsyncClient, rng: random.Random, state: dict, options) -> bool:
+    cursor = state.get("cursor")
+    if not cursor or rng.random() < 0.4:
+        state["user_id"] = f"load_user_{rng.randrange(options.seed_users)}"
+        cursor = None
+    params = {"user_id": state["user_id"], "limit": 20}
+    if cursor:
+        params["cursor"] = cursor
+    response = await client.get("/api/scripts/history", params=params)
+    if response.status_code != 200:
+        return False
+    state["cursor"] = response.json().get("next_cursor")
+    return True
+
+
+async def run_quota(client: httpx.AsyncClient, rng: random.Random, state: dict, options) -> bool:
+    response = await client.get("/api/video/quota", params={"user_id": f"load_user_{rng.randrange(options.seed_users)}"})
+    return response.status_code == 200 and response.json().get("code") == 200
+
+
+async def run_video(client: httpx.AsyncClient, rng: random.Random, state: dict, options) -> bool:
+    user_id = f"video_user_{uuid.uuid4().hex[:10]}"
+    body = {"user_id": user_id, "model": rng.choice(["2.0", "1.8"]), "script": f"标题: 压测视频\n镜头1: {uuid.uuid4().hex}"}
+    response = await client.post("/api/video/generate", json=body)
+    payload = response.json() if response.status_code == 200 else {}
+    if payload.get("code") != 200:
+        return False
+    job_id = payload["data"]["job_id"]
+    deadline = time.perf_counter() + options.video_timeout
+    while time.perf_counter() < deadline:
+        job = (await client.get(f"/api/video/jobs/{job_id}", params={"user_id": user_id, "wait": 30})).json().get("data") or {}
+        if job.get("status") == "succeeded":
+            return True
+        if job.get("status") == "failed":
+            return False
+    return False
+
+
+RUNNERS = {
+    "script_create": run_script_create,
+    "script_stream": run_script_stream,
+    "history": run_history,
+    "quota": run_quota,
+    "video": run_video,
+}
+
+
+async def run_scenario(base_url: str, scenario: str, concurrency: int, options) -> dict:
+    runner = RUNNERS[scenario]
+    latencies, errors = [], 0
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=options.request_timeout) as client:
+        warmup_until = time.perf_counter() + options.warmup
+        deadline = warmup_until + options.duration
+
+        async def worker(slot: int) -> None:
+            nonlocal errors
+            rng = random.Random(f"{scenario}-{concurrency}-{slot}")
+            state: dict = {}
+            while True:
+                started = time.perf_counter()
+                if started >= deadline:
+                    return
+                try:
+                    ok = await runner(client, rng, state, options)
+                except (httpx.HTTPError, ValueError, KeyError):
+                    ok = False
+                finished = time.perf_counter()
+                if started < warmup_until:
+                    continue
+                if ok:
+                    latencies.append(finished - started)
+                else:
+                    errors += 1
+
+        await asyncio.gather(*(worker(slot) for slot in range(concurrency)))
+
+    latencies.sort()
+    return {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round(len(latencies) / options.duration, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2) if latencies else 0.0,
+        "p95_ms": round(percentile_ms(latencies, 0.95), 2),
+        "p99_ms": round(percentile_ms(latencies, 0.99), 2)
+    }
+
+
+def wait_ready(url: str, process: subprocess.Popen, timeout: float = 120.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"进程提前退出（{process.returncode}）：{url}")
+        try:
+            if httpx.get(url, timeout=2).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.3)
+    raise RuntimeError(f"等待服务启动超时：{url}")
+
+
+def print_results(results: dict, baseline: dict = None, tolerance: float = 0.1) -> list:
+    regressions = []
+    header = f"{'场景@并发':<20}{'请求':>8}{'失败':>6}{'RPS':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+    if baseline:
+        header += f"{'RPS 变化':>11}{'p95 变化':>11}"
+    print(header)
+    for key, row in results.items():
+        line = f"{key:<20}{row['requests']:>8}{row['errors']:>6}{row['rps']:>10.2f}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}"
+        base = (baseline or {}).get(key)
+        if base and base["rps"] and base["p95_ms"]:
+            rps_change = row["rps"] / base["rps"] - 1
+            p95_change = row["p95_ms"] / base["p95_ms"] - 1
+            flag = ""
+            if rps_change < -tolerance or p95_change > tolerance:
+                flag = "  ← 回退"
+                regressions.append(key)
+            line += f"{rps_change * 100:>+10.1f}%{p95_change * 100:>+10.1f}%{flag}"
+        print(line)
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default="all", help=f"逗号分隔，可选 {','.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", default="1,8,32", help="逗号分隔的并发数")
+    parser.add_argument("--duration", type=float, default=15.0, help="每组计入统计的时长（秒）")
+    parser.add_argument("--warmup", type=float, default=2.0, help="每组开始时不计入统计的时长（秒）")
+    parser.add_argument("--request-timeout", type=float, default=120.0)
+    parser.add_argument("--video-timeout", type=float, default=120.0)
+    parser.add_argument("--seed-users", type=int, default=200)
+    parser.add_argument("--seed-scripts-per-user", type=int, default=100)
+    parser.add_argument("--env", action="append", default=[], help="服务进程环境变量，KEY=VALUE，可重复")
+    parser.add_argument("--output", help="结果 JSON 输出路径")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基线")
+    parser.add_argument("--baseline", help="与该基线对比")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    parser.add_argument("--seed-worker", action="store_true", help=argparse.SUPPRESS)
+    options, upstream_args = parser.parse_known_args()
+
+    if options.seed_worker:
+        seed_history(options.seed_users, options.seed_scripts_per_user)
+        return
+
+    scenarios = SCENARIOS if options.scenarios == "all" else tuple(s.strip() for s in options.scenarios.split(","))
+    unknown = [s for s in scenarios if s not in RUNNERS]
+    if unknown:
+        parser.error(f"未知场景: {unknown}")
+    levels = [int(c) for c in options.concurrency.split(",")]
+    overrides = dict(item.split("=", 1) for item in options.env)
+
+    upstream_port, app_port = free_port(), free_port()
+    upstream_url = f"http://127.0.0.1:{upstream_port}"
+    base_url = f"http://127.0.0.1:{app_port}"
+    processes = []
+    with tempfile.TemporaryDirectory(prefix="load_test_") as data_dir:
+        env = dict(
+            os.environ,
+            DATA_DIR=data_dir,
+            DEEPSEEK_API_KEY="bench",
+            DEEPSEEK_API_URL=f"{upstream_url}/v1/chat/completions",
+            SEDANCE_API_URL=f"{upstream_url}/sedance/generate",
+            SEDANCE_API_KEY="bench",
+            SEDANCE_MOCK_MODE="False"
+        )
+        env.update(overrides)
+        try:
+            upstream = subprocess.Popen(
+                [sys.executable, os.path.join(BENCH_DIR, "fake_upstreams.py"), "--port", str(upstream_port), *upstream_args],
+                cwd=ROOT_DIR
+            )
+            processes.append(upstream)
+            if "history" in scenarios or "quota" in scenarios:
+                subprocess.check_call(
+                    [sys.executable, os.path.abspath(__file__), "--seed-worker", "--seed-users", str(options.seed_users),
+                     "--seed-scripts-per-user", str(options.seed_scripts_per_user)],
+                    env=env, cwd=ROOT_DIR
+                )
+            app = subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(app_port), "--log-level", "warning"],
+                env=env, cwd=ROOT_DIR
+            )
+            processes.append(app)
+            wait_ready(f"{upstream_url}/_stats", upstream)
+            wait_ready(f"{base_url}/api/cache/stats", app)
+
+            results = {}
+            for scenario in scenarios:
+                for concurrency in levels:
+                    key = f"{scenario}@{concurrency}"
+                    results[key] = asyncio.run(run_scenario(base_url, scenario, concurrency, options))
+                    print(f"  {key} 完成: {results[key]['rps']} req/s", flush=True)
+            upstream_stats = httpx.get(f"{upstream_url}/_stats").json()
+        finally:
+            for process in reversed(processes):
+                process.terminate()
+                try:
+                    process.wait(timeout=10)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    report = {
+        "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "config": {
+            "duration": options.duration,
+            "warmup": options.warmup,
+            "concurrency": levels,
+            "upstream_args": upstream_args,
+            "env": overrides
+        },
+        "upstream_calls": upstream_stats,
+        "results": results
+    }
+
+    baseline = None
+    if options.baseline:
+        with open(options.baseline, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored["config"] != report["config"]:
+            print(f"注意：基线参数不同 {stored['config']}，对比仅供参考")
+        baseline = stored["results"]
+
+    print(f"\n时长: {options.duration}s/组  模拟服务参数: {' '.join(upstream_args) or '默认'}  上游调用: {upstream_stats}")
+    regressions = print_results(results, baseline, options.tolerance)
+    for path in (options.output, options.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+    if regressions:
+        print(f"\n相对基线回退: {', '.join(regressions)}")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,288 @@
+"""
+DeepSeek（及其他 OpenAI 兼容接口）多 Key / 多地址调度池。
+
+- 每个成员是一组 (接口地址, API Key, 模型)，可单独设置每分钟请求数（RPM）与 token 数（TPM）预算
+- 选择成员用 power-of-two-choices：在可用成员中随机取两个，选评分更低的一个；
+  评分 = 近期耗时（按调用类型分别做指数滑动平均）× (1 + 进行中请求数) × (1 + 近期 429 次数 × 惩罚系数)
+- 429：按 Retry-After 暂停该成员，其余成员照常使用
+- 连续失败（超时、网络错误、5xx、401/402/403）达到阈值后暂时移出，移出时长随连续移出次数翻倍
+- token 在发起时按估算值预占，完成后按接口返回的 usage 校正，失败时释放
+"""
+import random
+import re
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Mapping, Optional
+from urllib.parse import urlsplit
+
+USAGE_WINDOW_SECONDS = 60.0
+
+
+class PoolExhaustedError(Exception):
+    """没有可用成员（全部限流、移出或超出预算）；retry_after 为最早有成员恢复的秒数"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"DeepSeek 调度池暂无可用 Key，{retry_after:.0f} 秒后重试")
+        self.retry_after = retry_after
+
+
+class PoolEndpoint:
+    def __init__(self, name: str, url: str, api_key: str, model: str, rpm_limit: int = 0, tpm_limit: int = 0):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.rpm_limit = rpm_limit
+        self.tpm_limit = tpm_limit
+        self.inflight = 0
+        self.latency: Dict[str, float] = {}
+        # 近 60 秒内的调用：[发起时间, token 数]，token 数在完成后校正
+        self.window: deque = deque()
+        self.rate_limits: deque = deque()
+        self.cooldown_until = 0.0
+        self.evicted_until = 0.0
+        self.consecutive_failures = 0
+        self.consecutive_evictions = 0
+        self.requests_total = 0
+        self.failures_total = 0
+        self.rate_limited_total = 0
+        self.evictions_total = 0
+        self.tokens_total = 0
+
+    @property
+    def masked_key(self) -> str:
+        return f"{self.api_key[:3]}****{self.api_key[-4:]}" if len(self.api_key) > 8 else "****"
+
+    def _prune(self, now: float) -> None:
+        while self.window and self.window[0][0] <= now - USAGE_WINDOW_SECONDS:
+            self.window.popleft()
+        while self.rate_limits and self.rate_limits[0] <= now - USAGE_WINDOW_SECONDS:
+            self.rate_limits.popleft()
+
+    def window_tokens(self) -> int:
+        return sum(entry[1] for entry in self.window)
+
+    def budget_wait(self, tokens: int, now: float) -> float:
+        """按预算还需等待的秒数，0 表示当前可以发起"""
+        self._prune(now)
+        wait = 0.0
+        if self.rpm_limit > 0 and len(self.window) >= self.rpm_limit:
+            wait = self.window[len(self.window) - self.rpm_limit][0] + USAGE_WINDOW_SECONDS - now
+        if self.tpm_limit > 0 and self.window:
+            # 单次估算超过整个 TPM 预算时只要求窗口为空，避免永远无法调度
+            allowed = max(self.tpm_limit - tokens, 0)
+            used = self.window_tokens()
+            for started, spent in self.window:
+                if used <= allowed:
+                    break
+                used -= spent
+                wait = max(wait, started + USAGE_WINDOW_SECONDS - now)
+        return max(wait, 0.0)
+
+    def unavailable_for(self, tokens: int, now: float) -> float:
+        return max(self.evicted_until - now, self.cooldown_until - now, self.budget_wait(tokens, now), 0.0)
+
+    def score(self, kind: str, default_latency: float, rate_limit_penalty: float) -> float:
+        latency = self.latency.get(kind, default_latency)
+        return latency * (1 + self.inflight) * (1 + len(self.rate_limits) * rate_limit_penalty)
+
+    def state(self, now: float) -> str:
+        if self.evicted_until > now:
+            return "evicted"
+        if self.cooldown_until > now:
+            return "rate_limited"
+        if self.budget_wait(0, now) > 0:
+            return "over_budget"
+        return "available"
+
+    def utilization(self) -> Optional[float]:
+        ratios = []
+        if self.rpm_limit > 0:
+            ratios.append(len(self.window) / self.rpm_limit)
+        if self.tpm_limit > 0:
+            ratios.append(self.window_tokens() / self.tpm_limit)
+        return round(max(ratios), 4) if ratios else None
+
+
+class PoolLease:
+    """一次调用占用的成员与预占的 token，由调用方在结束时交回调度池"""
+
+    def __init__(self, endpoint: PoolEndpoint, kind: str, entry: list):
+        self.endpoint = endpoint
+        self.kind = kind
+        self.entry = entry
+        self.started = time.monotonic()
+        self.released = False
+
+
+class DeepSeekPool:
+    def __init__(self, endpoints: List[PoolEndpoint], evict_after_failures: int = 3, evict_seconds: float = 60.0,
+                 evict_max_seconds: float = 600.0, latency_alpha: float = 0.2, rate_limit_penalty: float = 0.5,
+                 default_cooldown_seconds: float = 5.0):
+        self.endpoints = endpoints
+        self.evict_after_failures = evict_after_failures
+        self.evict_seconds = evict_seconds
+        self.evict_max_seconds = evict_max_seconds
+        self.latency_alpha = latency_alpha
+        self.rate_limit_penalty = rate_limit_penalty
+        self.default_cooldown_seconds = default_cooldown_seconds
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    def _default_latency(self, kind: str) -> float:
+        # 尚无耗时样本的成员按已有成员的最小值计，既能被选中试探，也不会抢走全部流量
+        known = [endpoint.latency[kind] for endpoint in self.endpoints if kind in endpoint.latency]
+        return min(known) if known else 1.0
+
+    def acquire(self, tokens: int, kind: str = "chat") -> PoolLease:
+        now = time.monotonic()
+        with self._lock:
+            waits = [(endpoint.unavailable_for(tokens, now), endpoint) for endpoint in self.endpoints]
+            candidates = [endpoint for wait, endpoint in waits if wait <= 0]
+            if not candidates:
+                raise PoolExhaustedError(min(wait for wait, _ in waits))
+            default_latency = self._default_latency(kind)
+            if len(candidates) > 2:
+                candidates = random.sample(candidates, 2)
+            endpoint = min(candidates, key=lambda item: item.score(kind, default_latency, self.rate_limit_penalty))
+            entry = [now, tokens]
+            endpoint.window.append(entry)
+            endpoint.inflight += 1
+            endpoint.requests_total += 1
+            return PoolLease(endpoint, kind, entry)
+
+    def has_available(self, tokens: int = 0) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            return any(endpoint.unavailable_for(tokens, now) <= 0 for endpoint in self.endpoints)
+
+    def _finish(self, lease: PoolLease) -> bool:
+        if lease.released:
+            return False
+        lease.released = True
+        lease.endpoint.inflight -= 1
+        return True
+
+    def succeed(self, lease: PoolLease, tokens: Optional[int] = None, latency: Optional[float] = None) -> None:
+        """latency 缺省为从 acquire 到现在的耗时；流式调用应传入首个增量的耗时"""
+        with self._lock:
+            if not self._finish(lease):
+                return
+            endpoint = lease.endpoint
+            if tokens is not None:
+                lease.entry[1] = tokens
+            endpoint.tokens_total += lease.entry[1]
+            endpoint.consecutive_failures = 0
+            endpoint.consecutive_evictions = 0
+            observed = time.monotonic() - lease.started if latency is None else latency
+            previous = endpoint.latency.get(lease.kind)
+            endpoint.latency[lease.kind] = observed if previous is None else previous + self.latency_alpha * (observed - previous)
+
+    def rate_limited(self, lease: PoolLease, retry_after: Optional[float] = None) -> None:
+        with self._lock:
+            if not self._finish(lease):
+                return
+            endpoint = lease.endpoint
+            now = time.monotonic()
+            lease.entry[1] = 0
+            endpoint.rate_limited_total += 1
+            endpoint.rate_limits.append(now)
+            wait = retry_after if retry_after is not None else self.default_cooldown_seconds
+            endpoint.cooldown_until = max(endpoint.cooldown_until, now + wait)
+
+    def fail(self, lease: PoolLease, counts_toward_eviction: bool = True) -> None:
+        """counts_toward_eviction 为 False 时（如请求参数错误）只释放占用，不影响该成员的健康状态"""
+        with self._lock:
+            if not self._finish(lease):
+                return
+            endpoint = lease.endpoint
+            lease.entry[1] = 0
+            if not counts_toward_eviction:
+                return
+            endpoint.failures_total += 1
+            endpoint.consecutive_failures += 1
+            # 只有一个成员时移出等于整体不可用，交给调用方的熔断处理
+            if len(self.endpoints) > 1 and self.evict_after_failures > 0 and endpoint.consecutive_failures >= self.evict_after_failures:
+                duration = min(self.evict_seconds * (2 ** endpoint.consecutive_evictions), self.evict_max_seconds)
+                endpoint.evicted_until = time.monotonic() + duration
+                endpoint.consecutive_evictions += 1
+                endpoint.evictions_total += 1
+                endpoint.consecutive_failures = 0
+
+    def cancel(self, lease: PoolLease) -> None:
+        """调用被取消（如对冲请求落败）：结果未知，保留预占的 token，不计成功或失败"""
+        with self._lock:
+            self._finish(lease)
+
+    def stats(self) -> List[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            items = []
+            for endpoint in self.endpoints:
+                endpoint._prune(now)
+                items.append({
+                    "name": endpoint.name,
+                    "host": urlsplit(endpoint.url).netloc,
+                    "model": endpoint.model,
+                    "api_key": endpoint.masked_key,
+                    "state": endpoint.state(now),
+                    "available_in_seconds": round(endpoint.unavailable_for(0, now), 1),
+                    "inflight": endpoint.inflight,
+                    "latency_seconds": {kind: round(value, 3) for kind, value in endpoint.latency.items()},
+                    "window_requests": len(endpoint.window),
+                    "window_tokens": endpoint.window_tokens(),
+                    "rpm_limit": endpoint.rpm_limit or None,
+                    "tpm_limit": endpoint.tpm_limit or None,
+                    "utilization": endpoint.utilization(),
+                    "rate_limited_last_minute": len(endpoint.rate_limits),
+                    "requests_total": endpoint.requests_total,
+                    "tokens_total": endpoint.tokens_total,
+                    "failures_total": endpoint.failures_total,
+                    "rate_limited_total": endpoint.rate_limited_total,
+                    "evictions_total": endpoint.evictions_total
+                })
+            return items
+
+
+def parse_endpoints(environ: Mapping[str, str], default_url: str, default_model: str,
+                    rpm_limit: int = 0, tpm_limit: int = 0) -> List[PoolEndpoint]:
+    """
+    从环境变量读取调度池成员，同一地址下重复的 Key 只保留一个：
+    - DEEPSEEK_API_KEY：默认地址下的主 Key
+    - DEEPSEEK_API_KEYS：默认地址下的其余 Key，逗号分隔
+    - DEEPSEEK_ENDPOINT_<N>_URL / _KEY / _MODEL / _RPM / _TPM / _NAME：其他 OpenAI 兼容地址，
+      URL 缺省为默认地址，RPM/TPM 缺省为全局的每 Key 预算
+    """
+    specs = []
+    keys = [environ.get("DEEPSEEK_API_KEY", "")] + environ.get("DEEPSEEK_API_KEYS", "").split(",")
+    for index, key in enumerate(key.strip() for key in keys):
+        if key:
+            specs.append((f"key{index}", default_url, key, default_model, rpm_limit, tpm_limit))
+
+    numbers = sorted({int(match.group(1)) for name in environ
+                      for match in [re.fullmatch(r"DEEPSEEK_ENDPOINT_(\d+)_KEY", name)] if match})
+    for number in numbers:
+        prefix = f"DEEPSEEK_ENDPOINT_{number}_"
+        key = environ.get(prefix + "KEY", "").strip()
+        if not key:
+            continue
+        specs.append((
+            environ.get(prefix + "NAME", "").strip() or f"endpoint{number}",
+            environ.get(prefix + "URL", "").strip() or default_url,
+            key,
+            environ.get(prefix + "MODEL", "").strip() or default_model,
+            int(environ.get(prefix + "RPM", "") or rpm_limit),
+            int(environ.get(prefix + "TPM", "") or tpm_limit)
+        ))
+
+    endpoints, seen = [], set()
+    for name, url, key, model, rpm, tpm in specs:
+        if (url, key) in seen:
+            continue
+        seen.add((url, key))
+        endpoints.append(PoolEndpoint(name, url, key, model, rpm, tpm))
+    return endpoints
+
@@ -3,11 +3,16 @@
 
     app.state = app.state || {
         currentScheme: "",
+        currentStructured: null,
         USER_ID: "local_user_fixed_id_2026",
         userName: "创作者",
         currentGenerateParams: null,
         historyData: [],
-        videoQuota: null
+        historyCursor: null,
+        historyQuery: "",
+        historyLoading: false,
+        videoQuota: null,
+        lastVideoJob: null
     };
 
     app.getEl = function getEl(id) {
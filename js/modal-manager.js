@@ -1,6 +1,7 @@
 ﻿(function () {
     const app = window.AIApp;
     const state = app.state;
+    const HISTORY_PAGE_SIZE = 20;
 
     function showNicknameModal() {
         app.openModal("nicknameModal", closeNicknameModal);
@@ -30,9 +31,13 @@
         return records
             .map(function (item, index) {
                 const scene = app.escapeHtml(item.scene || "");
-                const summary = app.escapeHtml(item.key_info || item.keyInfo || "");
+                const summary = app.escapeHtml(item.title || item.key_info || item.keyInfo || "");
                 const style = app.escapeHtml(item.style || "默认");
                 const duration = app.escapeHtml(item.duration || "默认");
+                // 摘要模式下不返回风格与时长，不展示该行
+                const meta = item.style || item.duration
+                    ? '<div class="record-meta">风格: ' + style + " | 时长: " + duration + "</div>"
+                    : "";
                 const timestamp = item.create_time
                     ? app.escapeHtml(item.create_time)
                     : app.escapeHtml(new Date(item.timestamp).toLocaleString());
@@ -41,7 +46,7 @@
                     '<div class="record-item">' +
                     '<div class="record-title">' + scene + "</div>" +
                     '<div class="record-desc">' + summary + "</div>" +
-                    '<div class="record-meta">风格: ' + style + " | 时长: " + duration + "</div>" +
+                    meta +
                     '<div class="record-time">' + app.escapeHtml(timeLabel) + ": " + timestamp + "</div>" +
                     '<button class="record-btn" onclick="' + onViewAction + "(" + index + ')">查看详情</button>' +
                     "</div>"
@@ -50,32 +55,103 @@
             .join("");
     }
 
-    async function showHistory() {
-        app.openModal("historyModal", closeHistoryModal);
+    async function loadHistoryPage(reset) {
+        if (state.historyLoading) return;
+        if (!reset && !state.historyCursor) return;
 
+        state.historyLoading = true;
         try {
-            const response = await fetch("/api/scripts/history?user_id=" + encodeURIComponent(state.USER_ID));
+            let url;
+            if (state.historyQuery) {
+                // 搜索结果按 offset 分页
+                url = "/api/scripts/search?user_id=" + encodeURIComponent(state.USER_ID) +
+                    "&q=" + encodeURIComponent(state.historyQuery) + "&limit=" + HISTORY_PAGE_SIZE;
+                if (!reset) {
+                    url += "&offset=" + encodeURIComponent(state.historyCursor);
+                }
+            } else {
+                url = "/api/scripts/history?user_id=" + encodeURIComponent(state.USER_ID) + "&limit=" + HISTORY_PAGE_SIZE + "&fields=summary";
+                if (!reset) {
+                    url += "&cursor=" + encodeURIComponent(state.historyCursor);
+                }
+            }
+
+            const response = await fetch(url);
             const data = await response.json();
 
             if (data.code !== 200) return;
 
             const historyContent = app.getEl("historyContent");
-            state.historyData = data.data || [];
+            state.historyData = reset ? data.data || [] : state.historyData.concat(data.data || []);
+            state.historyCursor = state.historyQuery ? data.next_offset : data.next_cursor;
+            if (state.historyCursor === undefined) {
+                state.historyCursor = null;
+            }
+            // 高频词只在最近的记录中查找，翻到底时提示换用更具体的关键词
+            if (data.partial && !state.historyCursor) {
+                app.showToast("只搜索了最近的记录，可尝试更具体的关键词");
+            }
             historyContent.innerHTML = renderRecordList(state.historyData, "暂无历史记录", "viewHistory", "生成时间");
         } catch (error) {
             console.error(error);
+        } finally {
+            state.historyLoading = false;
+        }
+    }
+
+    // 滚动到接近底部时按游标加载下一页
+    function onHistoryScroll(event) {
+        const target = event.target;
+        if (target.scrollTop + target.clientHeight >= target.scrollHeight - 80) {
+            loadHistoryPage(false);
         }
     }
 
+    async function showHistory() {
+        app.openModal("historyModal", closeHistoryModal);
+
+        const historyContent = app.getEl("historyContent");
+        historyContent.onscroll = onHistoryScroll;
+
+        const searchInput = app.getEl("historySearchInput");
+        searchInput.onkeydown = function (event) {
+            if (event.key === "Enter") {
+                searchHistory(searchInput.value);
+            }
+        };
+
+        await searchHistory(searchInput.value);
+    }
+
+    async function searchHistory(query) {
+        state.historyQuery = (query || "").trim();
+        state.historyCursor = null;
+        await loadHistoryPage(true);
+    }
+
     function closeHistoryModal() {
         app.closeModal("historyModal");
     }
 
-    function viewHistory(index) {
+    async function viewHistory(index) {
         if (!state.historyData || !state.historyData[index]) return;
 
         const item = state.historyData[index];
+        if (!item.content) {
+            // 列表只返回摘要，正文按需加载
+            try {
+                const response = await fetch("/api/scripts/" + encodeURIComponent(item.id) +
+                    "?user_id=" + encodeURIComponent(state.USER_ID));
+                const data = await response.json();
+                if (data.code !== 200) return;
+                Object.assign(item, data.data);
+            } catch (error) {
+                console.error(error);
+                return;
+            }
+        }
         state.currentScheme = item.content || (item.schemes && item.schemes[0]) || "";
+        state.currentStructured = item.structured && item.structured.length > 0 ? item.structured[0] : null;
         app.renderScheme();
         closeHistoryModal();
     }
@@ -97,6 +173,7 @@
         if (!favorites[index]) return;
 
         state.currentScheme = favorites[index].content;
+        state.currentStructured = null;
         app.renderScheme();
         closeFavoritesModal();
     }
@@ -81,12 +81,23 @@
             return;
         }
 
+        const previousParams = state.currentGenerateParams;
+        // 参数未变时视为“再次生成”，跳过服务端结果缓存以获得新方案
+        const isRegenerate = Boolean(
+            previousParams &&
+            previousParams.scene === scene &&
+            previousParams.style === style &&
+            previousParams.duration === duration &&
+            previousParams.key_info === keyInfo
+        );
+
         state.currentGenerateParams = {
             user_id: state.USER_ID,
             scene: scene,
             style: style,
             duration: duration,
-            key_info: keyInfo
+            key_info: keyInfo,
+            bypass_cache: isRegenerate
         };
 
         setLoading(true);
@@ -95,25 +106,17 @@
         generateBtn.innerHTML = "🤖 不满意？点击再次生成";
 
         try {
-            const response = await fetch("/api/script/create", {
+            const response = await fetch("/api/script/create/stream", {
                 method: "POST",
                 headers: { "Content-Type": "application/json" },
                 body: JSON.stringify(state.currentGenerateParams)
             });
 
-            const data = await response.json();
-            if (data.code === 200) {
-                if (data.data.schemes && data.data.schemes.length > 0) {
-                    state.currentScheme = data.data.schemes[0];
-                } else if (data.data.content) {
-                    state.currentScheme = data.data.content;
-                } else {
-                    state.currentScheme = "";
-                }
-                renderScheme();
-            } else {
-                app.showToast("生成失败: " + (data.msg || "服务器错误"));
+            if (!response.ok || !response.body) {
+                throw new Error("HTTP " + response.status);
             }
+
+            await readScriptStream(response.body);
         } catch (error) {
             app.showToast("请求失败，请检查网络连接");
             console.error(error);
@@ -122,6 +125,84 @@
         }
     }
 
+    function buildStreamingScheme(parts) {
+        let text = "";
+        if (parts.title) {
+            text += "标题: " + parts.title + "\n";
+        }
+        parts.shots.forEach(function (shot) {
+            text += "镜头" + shot.index + ": " + shot.shot + "\n";
+            text += "台词" + shot.index + ": " + shot.line + "\n\n";
+        });
+        if (parts.music) {
+            text += "配乐建议: " + parts.music;
+        }
+        return text;
+    }
+
+    function handleStreamEvent(eventName, data, parts) {
+        if (eventName === "title") {
+            parts.title = data.text;
+        } else if (eventName === "shot") {
+            parts.shots.push(data);
+        } else if (eventName === "music") {
+            parts.music = data.text;
+        } else if (eventName === "done") {
+            state.currentScheme = data.schemes && data.schemes.length > 0 ? data.schemes[0] : buildStreamingScheme(parts);
+            state.currentStructured = data.structured && data.structured.length > 0 ? data.structured[0] : parts;
+            renderScheme();
+            return;
+        } else if (eventName === "error") {
+            app.showToast("生成失败: " + (data.msg || "服务器错误"));
+            return;
+        } else if (eventName === "warning") {
+            app.showToast(data.msg);
+            return;
+        } else {
+            return;
+        }
+
+        // 收到首个镜头/标题后即隐藏加载状态，边生成边展示
+        setLoading(false);
+        state.currentScheme = buildStreamingScheme(parts);
+        state.currentStructured = parts;
+        renderScheme();
+    }
+
+    async function readScriptStream(body) {
+        const reader = body.getReader();
+        const decoder = new TextDecoder("utf-8");
+        const parts = { title: "", shots: [], music: "" };
+        let buffer = "";
+
+        while (true) {
+            const result = await reader.read();
+            if (result.done) break;
+
+            buffer += decoder.decode(result.value, { stream: true });
+            let boundary = buffer.indexOf("\n\n");
+            while (boundary !== -1) {
+                const rawEvent = buffer.slice(0, boundary);
+                buffer = buffer.slice(boundary + 2);
+                boundary = buffer.indexOf("\n\n");
+
+                let eventName = "message";
+                let dataText = "";
+                rawEvent.split("\n").forEach(function (line) {
+                    if (line.indexOf("event:") === 0) {
+                        eventName = line.slice(6).trim();
+                    } else if (line.indexOf("data:") === 0) {
+                        dataText += line.slice(5).trim();
+                    }
+                });
+
+                if (dataText) {
+                    handleStreamEvent(eventName, JSON.parse(dataText), parts);
+                }
+            }
+        }
+    }
+
     function renderScheme() {
         const contentDiv = app.getEl("schemeContent");
         if (!contentDiv) return;
@@ -136,7 +217,32 @@
             '<div class="scheme-label">AI 生成方案</div>' +
             '<button class="favorite-btn" onclick="toggleFavorite()">❤️</button>' +
             "</div>" +
-            '<div class="script-content">' + formatScriptContent(state.currentScheme) + "</div>";
+            '<div class="script-content">' +
+            (state.currentStructured ? formatStructuredScript(state.currentStructured) : formatScriptContent(state.currentScheme)) +
+            "</div>";
+    }
+
+    // 服务端已解析好的结构化脚本直接渲染，无需再用正则拆分文本
+    function formatStructuredScript(structured) {
+        const escape = app.escapeHtml;
+        let html = "";
+        if (structured.title) {
+            html += '<h4 class="script-title">标题: ' + escape(structured.title) + "</h4>";
+        }
+        (structured.shots || []).forEach(function (shot) {
+            html +=
+                '<div class="shot-item">' +
+                '<div class="shot-header">镜头' + escape(shot.index) + ":</div> " + escape(shot.shot) +
+                '<div class="shot-dialogue">台词' + escape(shot.index) + ":</div> " + escape(shot.line) +
+                "</div>";
+        });
+        (structured.notes || []).forEach(function (note) {
+            html += "<p>" + escape(note) + "</p>";
+        });
+        if (structured.music) {
+            html += '<div class="music-suggestion">配乐建议: ' + escape(structured.music) + "</div>";
+        }
+        return html || "<p>暂无内容</p>";
     }
 
     function formatScriptContent(content) {
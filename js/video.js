@@ -1,6 +1,8 @@
 ﻿(function () {
     const app = window.AIApp;
     const state = app.state;
+    const VIDEO_JOB_STORAGE_KEY = "ai_copywriter_video_job";
+    const VIDEO_JOB_WAIT_SECONDS = 25;
 
     function formatModelUsage(quota, model) {
         const data = quota && quota.models ? quota.models[model] : null;
@@ -144,12 +146,12 @@
                 if (data.data && data.data.quota) {
                     state.videoQuota = data.data.quota;
                     renderQuota(state.videoQuota);
-                } else {
-                    await fetchVideoQuota(false);
                 }
 
-                app.showToast("视频生成成功！");
+                localStorage.setItem(VIDEO_JOB_STORAGE_KEY, data.data.job_id);
+                app.showToast(data.data.cached ? "已复用相同脚本生成过的视频" : "视频任务已提交，正在生成...");
                 closeVideoModal();
+                await waitForVideoJob(data.data.job_id);
             } else {
                 app.showToast("生成失败: " + (data.msg || "服务器错误"));
                 if ((data.msg || "").includes("次数已用完")) {
@@ -165,6 +167,46 @@
         }
     }
 
+    // 长轮询任务状态，直到任务完成；页面刷新后可凭本地保存的任务 ID 继续等待
+    async function waitForVideoJob(jobId) {
+        while (true) {
+            let data;
+            try {
+                const response = await fetch(
+                    "/api/video/jobs/" + encodeURIComponent(jobId) +
+                    "?user_id=" + encodeURIComponent(state.USER_ID) +
+                    "&wait=" + VIDEO_JOB_WAIT_SECONDS
+                );
+                data = await response.json();
+            } catch (error) {
+                console.error(error);
+                await new Promise(function (resolve) {
+                    setTimeout(resolve, 3000);
+                });
+                continue;
+            }
+
+            if (data.code !== 200 || !data.data) {
+                localStorage.removeItem(VIDEO_JOB_STORAGE_KEY);
+                return null;
+            }
+
+            const job = data.data;
+            if (job.status === "succeeded") {
+                localStorage.removeItem(VIDEO_JOB_STORAGE_KEY);
+                state.lastVideoJob = job;
+                app.showToast("视频生成成功！");
+                return job;
+            }
+            if (job.status === "failed") {
+                localStorage.removeItem(VIDEO_JOB_STORAGE_KEY);
+                app.showToast("生成失败: " + (job.error || "服务器错误"));
+                await fetchVideoQuota(false);
+                return job;
+            }
+        }
+    }
+
     app.bindGlobal({
         showVideoModal: showVideoModal,
         closeVideoModal: closeVideoModal,
@@ -176,5 +218,10 @@
 
     window.addEventListener("load", function () {
         fetchVideoQuota(false);
+
+        const pendingJobId = localStorage.getItem(VIDEO_JOB_STORAGE_KEY);
+        if (pendingJobId) {
+            waitForVideoJob(pendingJobId);
+        }
     });
 })();
@@ -1,16 +1,49 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-import requests
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager, contextmanager
+import anyio.to_thread
+import asyncio
+import httpx
 import sqlite3
 import uuid
-from datetime import datetime, timedelta
-from typing import Any, Dict, Optional
+from datetime import datetime, timedelta, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+import base64
+import gzip
+import hashlib
+import hmac
+import json
+import queue
 import re
 import os
 import sys
+import threading
+import time
+import unicodedata
+import zlib
 from dotenv import load_dotenv
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, MetricsMiddleware, MetricsRegistry
+from minhash_index import MinHashLSHIndex, shingle_jaccard, shingles
+from deepseek_pool import DeepSeekPool, PoolEndpoint, PoolExhaustedError, PoolLease, parse_endpoints
+from profiling import ProfilingMiddleware, RequestProfiler
+from prompts import ShotTokenEstimator, build_continuation_messages, build_corpus_messages, build_script_messages, shot_count_for
+from resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, RetryPolicy, hedged, parse_retry_after
+
+try:
+    import brotli  # 可选依赖，安装后响应支持 br 压缩
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard  # 可选依赖，安装后归档数据可改用 zstd 压缩
+except ImportError:
+    zstandard = None
 
 # ====================== 获取基础目录 ======================
 def get_base_dir():
@@ -49,7 +82,36 @@ def load_env_from_multiple_locations():
 load_env_from_multiple_locations()
 
 # ====================== 配置项（从环境变量读取）======================
-DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY')
+DEEPSEEK_API_URL = os.getenv('DEEPSEEK_API_URL', 'https://api.deepseek.com/v1/chat/completions').strip()
+DEEPSEEK_MODEL = os.getenv('DEEPSEEK_MODEL', 'deepseek-chat').strip()
+# 多 Key / 多地址调度池：成员来自 DEEPSEEK_API_KEY、DEEPSEEK_API_KEYS 与 DEEPSEEK_ENDPOINT_<N>_*（0 表示不限）
+DEEPSEEK_KEY_RPM_LIMIT = int(os.getenv('DEEPSEEK_KEY_RPM_LIMIT', '0'))
+DEEPSEEK_KEY_TPM_LIMIT = int(os.getenv('DEEPSEEK_KEY_TPM_LIMIT', '0'))
+DEEPSEEK_ENDPOINTS = parse_endpoints(os.environ, DEEPSEEK_API_URL, DEEPSEEK_MODEL, DEEPSEEK_KEY_RPM_LIMIT, DEEPSEEK_KEY_TPM_LIMIT)
+DEEPSEEK_POOL_EVICT_AFTER_FAILURES = int(os.getenv('DEEPSEEK_POOL_EVICT_AFTER_FAILURES', '3'))
+DEEPSEEK_POOL_EVICT_SECONDS = float(os.getenv('DEEPSEEK_POOL_EVICT_SECONDS', '60'))
+DEEPSEEK_POOL_EVICT_MAX_SECONDS = float(os.getenv('DEEPSEEK_POOL_EVICT_MAX_SECONDS', '600'))
+DEEPSEEK_USAGE_FLUSH_INTERVAL_SECONDS = float(os.getenv('DEEPSEEK_USAGE_FLUSH_INTERVAL_SECONDS', '5'))
+# 脚本生成的 max_tokens 按镜头数估算：每镜头 token 数初始值（之后按实测校正）、余量系数、上限；截断后最多续写轮数
+SCRIPT_TOKENS_PER_SHOT = float(os.getenv('SCRIPT_TOKENS_PER_SHOT', '120'))
+SCRIPT_TOKEN_BUDGET_MARGIN = float(os.getenv('SCRIPT_TOKEN_BUDGET_MARGIN', '1.3'))
+SCRIPT_MAX_TOKENS_CAP = int(os.getenv('SCRIPT_MAX_TOKENS_CAP', '8192'))
+SCRIPT_CONTINUATION_MAX_ROUNDS = int(os.getenv('SCRIPT_CONTINUATION_MAX_ROUNDS', '2'))
+DEEPSEEK_TIMEOUT_SECONDS = float(os.getenv('DEEPSEEK_TIMEOUT_SECONDS', '60'))
+DEEPSEEK_CONNECT_TIMEOUT_SECONDS = float(os.getenv('DEEPSEEK_CONNECT_TIMEOUT_SECONDS', '10'))
+DEEPSEEK_POOL_MAX_CONNECTIONS = int(os.getenv('DEEPSEEK_POOL_MAX_CONNECTIONS', '200'))
+DEEPSEEK_POOL_MAX_KEEPALIVE = int(os.getenv('DEEPSEEK_POOL_MAX_KEEPALIVE', '50'))
+DEEPSEEK_KEEPALIVE_EXPIRY_SECONDS = float(os.getenv('DEEPSEEK_KEEPALIVE_EXPIRY_SECONDS', '60'))
+DEEPSEEK_HEDGE_ENABLED = os.getenv('DEEPSEEK_HEDGE_ENABLED', 'False').lower() == 'true'
+DEEPSEEK_HEDGE_QUANTILE = float(os.getenv('DEEPSEEK_HEDGE_QUANTILE', '0.95'))
+DEEPSEEK_HEDGE_MIN_DELAY_SECONDS = float(os.getenv('DEEPSEEK_HEDGE_MIN_DELAY_SECONDS', '2'))
+DEEPSEEK_HEDGE_MIN_SAMPLES = int(os.getenv('DEEPSEEK_HEDGE_MIN_SAMPLES', '20'))
+UPSTREAM_RETRY_MAX_ATTEMPTS = int(os.getenv('UPSTREAM_RETRY_MAX_ATTEMPTS', '3'))
+UPSTREAM_RETRY_BASE_DELAY_SECONDS = float(os.getenv('UPSTREAM_RETRY_BASE_DELAY_SECONDS', '0.5'))
+UPSTREAM_RETRY_MAX_DELAY_SECONDS = float(os.getenv('UPSTREAM_RETRY_MAX_DELAY_SECONDS', '8'))
+UPSTREAM_RETRY_AFTER_MAX_SECONDS = float(os.getenv('UPSTREAM_RETRY_AFTER_MAX_SECONDS', '30'))
+UPSTREAM_BREAKER_FAILURE_THRESHOLD = int(os.getenv('UPSTREAM_BREAKER_FAILURE_THRESHOLD', '5'))
+UPSTREAM_BREAKER_RECOVERY_SECONDS = float(os.getenv('UPSTREAM_BREAKER_RECOVERY_SECONDS', '30'))
 HOST = os.getenv('HOST', '127.0.0.1')
 PORT = int(os.getenv('PORT', 8000))
 DEBUG = os.getenv('DEBUG', 'True').lower() == 'true'
@@ -57,23 +119,89 @@ SEDANCE_API_URL = os.getenv('SEDANCE_API_URL', '').strip()
 SEDANCE_API_KEY = os.getenv('SEDANCE_API_KEY', '').strip()
 SEDANCE_TIMEOUT_SECONDS = int(os.getenv('SEDANCE_TIMEOUT_SECONDS', '120'))
 SEDANCE_MOCK_MODE = os.getenv('SEDANCE_MOCK_MODE', 'False').lower() == 'true'
+VIDEO_WORKER_COUNT = int(os.getenv('VIDEO_WORKER_COUNT', '4'))
+VIDEO_JOB_MAX_WAIT_SECONDS = int(os.getenv('VIDEO_JOB_MAX_WAIT_SECONDS', '30'))
+VIDEO_MEMBERSHIP_SWEEP_INTERVAL_SECONDS = int(os.getenv('VIDEO_MEMBERSHIP_SWEEP_INTERVAL_SECONDS', '3600'))
+VIDEO_QUOTA_CACHE_MAX_ENTRIES = int(os.getenv('VIDEO_QUOTA_CACHE_MAX_ENTRIES', '10000'))
+VIDEO_QUOTA_CACHE_TTL_SECONDS = int(os.getenv('VIDEO_QUOTA_CACHE_TTL_SECONDS', '300'))
+VIDEO_CACHE_ENABLED = os.getenv('VIDEO_CACHE_ENABLED', 'False').lower() == 'true'
+VIDEO_CACHE_TTL_SECONDS = int(os.getenv('VIDEO_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+VIDEO_CACHE_MAX_ENTRIES = int(os.getenv('VIDEO_CACHE_MAX_ENTRIES', '5000'))
+VIDEO_CACHE_HIT_CONSUMES_QUOTA = os.getenv('VIDEO_CACHE_HIT_CONSUMES_QUOTA', 'False').lower() == 'true'
+VIDEO_CACHE_SHARED_ACROSS_USERS = os.getenv('VIDEO_CACHE_SHARED_ACROSS_USERS', 'False').lower() == 'true'
+VIDEO_CACHE_URL_TTL_SECONDS = int(os.getenv('VIDEO_CACHE_URL_TTL_SECONDS', str(24 * 3600)))
+VIDEO_CACHE_URL_MIN_REMAINING_SECONDS = int(os.getenv('VIDEO_CACHE_URL_MIN_REMAINING_SECONDS', '600'))
 MEMBER_MONTHLY_PRICE = 9.9
+SCRIPT_CACHE_ENABLED = os.getenv('SCRIPT_CACHE_ENABLED', 'False').lower() == 'true'
+SCRIPT_CACHE_TTL_SECONDS = int(os.getenv('SCRIPT_CACHE_TTL_SECONDS', str(7 * 24 * 3600)))
+SCRIPT_CACHE_MAX_ENTRIES = int(os.getenv('SCRIPT_CACHE_MAX_ENTRIES', '5000'))
+CACHE_ACCESS_UPDATE_INTERVAL_SECONDS = int(os.getenv('CACHE_ACCESS_UPDATE_INTERVAL_SECONDS', '60'))
+# 近似请求复用：同场景/风格/时长下 key_info 高度相似时复用已有脚本
+SCRIPT_SIMILAR_ENABLED = os.getenv('SCRIPT_SIMILAR_ENABLED', 'False').lower() == 'true'
+SCRIPT_SIMILAR_MODE = os.getenv('SCRIPT_SIMILAR_MODE', 'reuse').lower()
+SCRIPT_SIMILAR_THRESHOLD = float(os.getenv('SCRIPT_SIMILAR_THRESHOLD', '0.8'))
+SCRIPT_SIMILAR_BANDS = int(os.getenv('SCRIPT_SIMILAR_BANDS', '10'))
+SCRIPT_SIMILAR_ROWS = int(os.getenv('SCRIPT_SIMILAR_ROWS', '4'))
+SCRIPT_SIMILAR_SHARED_ACROSS_USERS = os.getenv('SCRIPT_SIMILAR_SHARED_ACROSS_USERS', 'False').lower() == 'true'
+SCRIPT_BATCH_MAX_ITEMS = int(os.getenv('SCRIPT_BATCH_MAX_ITEMS', '500'))
+SCRIPT_BATCH_CONCURRENCY = int(os.getenv('SCRIPT_BATCH_CONCURRENCY', '16'))
+CORPUS_ENABLED = os.getenv('CORPUS_ENABLED', 'False').lower() == 'true'
+CORPUS_CACHE_TTL_SECONDS = int(os.getenv('CORPUS_CACHE_TTL_SECONDS', str(30 * 24 * 3600)))
+CORPUS_CACHE_MAX_ENTRIES = int(os.getenv('CORPUS_CACHE_MAX_ENTRIES', '500'))
+CORPUS_CACHE_MEMORY_ENTRIES = int(os.getenv('CORPUS_CACHE_MEMORY_ENTRIES', '64'))
+CORPUS_PREWARM_TOP_N = int(os.getenv('CORPUS_PREWARM_TOP_N', '8'))
+RESPONSE_COMPRESS_MIN_BYTES = int(os.getenv('RESPONSE_COMPRESS_MIN_BYTES', '1024'))
+SEARCH_FTS_MAX_CANDIDATES = int(os.getenv('SEARCH_FTS_MAX_CANDIDATES', '1000'))
+SEARCH_SCAN_MAX_ROWS = int(os.getenv('SEARCH_SCAN_MAX_ROWS', '5000'))
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True').lower() == 'true'
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False').lower() == 'true'
+PROFILING_TOKEN = os.getenv('PROFILING_TOKEN', '').strip()
+PROFILING_INTERVAL_MS = float(os.getenv('PROFILING_INTERVAL_MS', '5'))
+PROFILING_MAX_FILES = int(os.getenv('PROFILING_MAX_FILES', '100'))
+PROFILING_MAX_CONCURRENT = int(os.getenv('PROFILING_MAX_CONCURRENT', '4'))
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '8'))
+DB_POOL_MAX_CONNECTIONS = int(os.getenv('DB_POOL_MAX_CONNECTIONS', '64'))
+DB_POOL_ACQUIRE_TIMEOUT_SECONDS = float(os.getenv('DB_POOL_ACQUIRE_TIMEOUT_SECONDS', '10'))
+DB_JOURNAL_MODE = os.getenv('DB_JOURNAL_MODE', 'WAL').strip().upper()
+DB_SYNCHRONOUS = os.getenv('DB_SYNCHRONOUS', 'NORMAL').strip().upper()
+DB_BUSY_TIMEOUT_MS = int(os.getenv('DB_BUSY_TIMEOUT_MS', '5000'))
+DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', str(256 * 1024 * 1024)))
+DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', str(32 * 1024)))
+DB_VACUUM_FREE_RATIO = float(os.getenv('DB_VACUUM_FREE_RATIO', '0.2'))
+DB_MAINTENANCE_STEP_PAGES = int(os.getenv('DB_MAINTENANCE_STEP_PAGES', '500'))
+SCRIPT_ARCHIVE_ENABLED = os.getenv('SCRIPT_ARCHIVE_ENABLED', 'False').lower() == 'true'
+SCRIPT_ARCHIVE_AFTER_DAYS = int(os.getenv('SCRIPT_ARCHIVE_AFTER_DAYS', '90'))
+SCRIPT_ARCHIVE_INTERVAL_SECONDS = int(os.getenv('SCRIPT_ARCHIVE_INTERVAL_SECONDS', str(6 * 3600)))
+SCRIPT_ARCHIVE_BATCH_SIZE = int(os.getenv('SCRIPT_ARCHIVE_BATCH_SIZE', '500'))
+SCRIPT_ARCHIVE_CODEC = os.getenv('SCRIPT_ARCHIVE_CODEC', 'zlib').strip().lower()
 
 # ====================== 获取数据目录 ======================
 def get_data_dir():
-    data_dir = os.path.join(BASE_DIR, 'data')
+    data_dir = os.getenv('DATA_DIR', '').strip() or os.path.join(BASE_DIR, 'data')
     os.makedirs(data_dir, exist_ok=True)
     return data_dir
 
 # ====================== 数据库文件路径 ======================
 DB_PATH = os.path.join(get_data_dir(), 'ai_copywriter.db')
+# 归档库：旧脚本压缩后移到独立文件，主库只保留近期数据；已有归档时即使关闭归档也继续挂载以便读取
+ARCHIVE_DB_PATH = os.path.join(get_data_dir(), 'ai_copywriter_archive.db')
+ARCHIVE_ATTACHED = SCRIPT_ARCHIVE_ENABLED or os.path.exists(ARCHIVE_DB_PATH)
 
 # ====================== 验证必要配置 ======================
-if not DEEPSEEK_API_KEY:
-    raise ValueError("请在 .env 文件中配置 DEEPSEEK_API_KEY")
+if not DEEPSEEK_ENDPOINTS:
+    raise ValueError("请在 .env 文件中配置 DEEPSEEK_API_KEY（或 DEEPSEEK_API_KEYS / DEEPSEEK_ENDPOINT_1_KEY）")
+
+# ====================== 应用生命周期（启动/关闭钩子）======================
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await on_startup()
+    try:
+        yield
+    finally:
+        await on_shutdown()
 
 # 初始化FastAPI应用
-app = FastAPI(title="AI文案脚本创作API", version="1.0")
+app = FastAPI(title="AI文案脚本创作API", version="1.0", lifespan=lifespan)
 
 VIDEO_MODELS = ("2.0", "1.8")
 VIDEO_LIMITS_FREE = {"2.0": 1, "1.8": 2}
@@ -118,9 +246,289 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# ====================== 运行指标（Prometheus 文本格式，GET /metrics）======================
+# 记录只做加锁累加，缓存命中率、线程池占用等在抓取时读取；METRICS_ENABLED=False 时不挂中间件、不计数据库耗时
+metrics_registry = MetricsRegistry()
+HTTP_REQUEST_SECONDS = metrics_registry.histogram(
+    "http_request_duration_seconds", "按路由模板统计的请求耗时", ("method", "route", "status"))
+HTTP_REQUESTS_INFLIGHT = metrics_registry.gauge("http_requests_in_flight", "正在处理的 HTTP 请求数")
+DEEPSEEK_REQUEST_SECONDS = metrics_registry.histogram(
+    "deepseek_request_duration_seconds", "DeepSeek 调用耗时（流式为整段生成耗时）", ("mode",))
+DEEPSEEK_FIRST_TOKEN_SECONDS = metrics_registry.histogram(
+    "deepseek_stream_first_token_seconds", "DeepSeek 流式调用首个文本增量的等待时间")
+SEDANCE_REQUEST_SECONDS = metrics_registry.histogram("sedance_request_duration_seconds", "Seedance 视频生成接口调用耗时")
+UPSTREAM_REQUESTS_INFLIGHT = metrics_registry.gauge("upstream_requests_in_flight", "进行中的上游调用数", ("upstream",))
+UPSTREAM_ERRORS = metrics_registry.counter("upstream_errors_total", "上游调用失败次数", ("upstream", "type"))
+DB_QUERY_SECONDS = metrics_registry.histogram(
+    "db_query_duration_seconds", "SQLite 语句执行耗时（含 fetchall/fetchmany 与提交）", ("operation",),
+    buckets=(0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware, latency=HTTP_REQUEST_SECONDS, inflight=HTTP_REQUESTS_INFLIGHT)
+
+def _upstream_error_type(exc: Exception) -> str:
+    if isinstance(exc, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        if status == 429:
+            return "rate_limited"
+        return "http_5xx" if status >= 500 else "http_4xx"
+    if isinstance(exc, httpx.ConnectError):
+        return "connect"
+    if isinstance(exc, httpx.HTTPError):
+        return "transport"
+    if isinstance(exc, (ValueError, KeyError, IndexError, TypeError)):
+        return "invalid_response"
+    return "other"
+
+@contextmanager
+def _track_upstream(upstream: str, latency) -> Iterator[None]:
+    """统计上游调用耗时、进行中数量与失败类型；客户端断开导致的取消不计为失败"""
+    inflight = UPSTREAM_REQUESTS_INFLIGHT.labels(upstream)
+    started = time.perf_counter()
+    inflight.inc()
+    try:
+        yield
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(upstream, _upstream_error_type(e)).inc()
+        raise
+    finally:
+        inflight.dec()
+        latency.observe(time.perf_counter() - started)
+
+# ====================== 按请求性能分析（PROFILING_ENABLED + X-Profile 请求头）======================
+# 采样结果以折叠栈格式写入 data/profiles，可用 flamegraph.pl / speedscope 查看；关闭时不挂中间件、不安装任务工厂
+request_profiler = RequestProfiler(
+    os.path.join(get_data_dir(), 'profiles'),
+    interval=PROFILING_INTERVAL_MS / 1000,
+    max_files=PROFILING_MAX_FILES,
+    max_active=PROFILING_MAX_CONCURRENT
+)
+
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware, profiler=request_profiler, header="X-Profile", token=PROFILING_TOKEN)
+
+# ====================== SQLite连接池（WAL + 调优参数）======================
+class PooledConnection(sqlite3.Connection):
+    """close() 时归还连接池而不是真正关闭，调用方写法保持不变"""
+    pool = None
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.release(self)
+        else:
+            super().close()
+
+    def close_physical(self):
+        sqlite3.Connection.close(self)
+
+# ------------------- 数据库耗时统计：按语句类型记录执行/取数/提交耗时 -------------------
+_DB_OPERATIONS = ("select", "insert", "update", "delete", "commit", "other")
+_DB_TIMERS = {operation: DB_QUERY_SECONDS.labels(operation) for operation in _DB_OPERATIONS}
+# 语句多为固定字符串，按原文缓存对应的直方图，省去每次的截取与大小写转换
+_DB_STATEMENT_TIMERS: Dict[str, Any] = {}
+
+def _db_timer(sql: str):
+    timer = _DB_STATEMENT_TIMERS.get(sql)
+    if timer is None:
+        timer = _DB_TIMERS.get(sql.lstrip()[:6].lower(), _DB_TIMERS["other"])
+        if len(_DB_STATEMENT_TIMERS) < 4096:
+            _DB_STATEMENT_TIMERS[sql] = timer
+    return timer
+
+class TimedCursor(sqlite3.Cursor):
+    timer = _DB_TIMERS["other"]
+
+    def execute(self, sql, *args):
+        self.timer = _db_timer(sql)
+        started = time.perf_counter()
+        try:
+            return sqlite3.Cursor.execute(self, sql, *args)
+        finally:
+            self.timer.observe(time.perf_counter() - started)
+
+    def executemany(self, sql, *args):
+        self.timer = _db_timer(sql)
+        started = time.perf_counter()
+        try:
+            return sqlite3.Cursor.executemany(self, sql, *args)
+        finally:
+            self.timer.observe(time.perf_counter() - started)
+
+    def fetchall(self):
+        started = time.perf_counter()
+        try:
+            return sqlite3.Cursor.fetchall(self)
+        finally:
+            self.timer.observe(time.perf_counter() - started)
+
+    def fetchmany(self, *args):
+        started = time.perf_counter()
+        try:
+            return sqlite3.Cursor.fetchmany(self, *args)
+        finally:
+            self.timer.observe(time.perf_counter() - started)
+
+class TimedConnection(PooledConnection):
+    """METRICS_ENABLED 时连接池使用的连接类型；Connection.execute 不经过 cursor()，需要单独转发"""
+
+    def cursor(self, factory=TimedCursor):
+        return sqlite3.Connection.cursor(self, factory)
+
+    def execute(self, sql, *args):
+        return sqlite3.Connection.cursor(self, TimedCursor).execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return sqlite3.Connection.cursor(self, TimedCursor).executemany(sql, *args)
+
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            sqlite3.Connection.commit(self)
+        finally:
+            _DB_TIMERS["commit"].observe(time.perf_counter() - started)
+
+class _PoolWaiter:
+    __slots__ = ("event", "conn", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.conn: Optional[PooledConnection] = None
+        self.granted = False
+
+class SQLiteConnectionPool:
+    """
+    size 为保留的空闲连接数，max_connections 为同时打开的连接总数上限（0 为不限）；
+    达到上限时借用方按先来后到排队，归还的连接直接交给队首，超过 acquire_timeout 秒抛出 TimeoutError
+    """
+
+    def __init__(self, path: str, size: int, attachments: Optional[Dict[str, str]] = None,
+                 max_connections: int = 0, acquire_timeout: float = 10.0):
+        self.path = path
+        self.size = size
+        self.max_connections = max_connections
+        self.acquire_timeout = acquire_timeout
+        self.attachments = attachments or {}
+        self.opened = 0
+        self._idle: "queue.LifoQueue[PooledConnection]" = queue.LifoQueue()
+        self._waiters: "deque[_PoolWaiter]" = deque()
+        self._lock = threading.Lock()
+
+    def _connect(self) -> PooledConnection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_MS / 1000,
+            check_same_thread=False,
+            factory=TimedConnection if METRICS_ENABLED else PooledConnection
+        )
+        conn.row_factory = sqlite3.Row
+        # 新库使用增量 VACUUM（须在切换日志模式前设置），旧库由后台整理首次 VACUUM 时切换
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.execute(f"PRAGMA journal_mode={DB_JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous={DB_SYNCHRONOUS}")
+        conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+        conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+        conn.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        for schema, path in self.attachments.items():
+            conn.execute(f"ATTACH DATABASE ? AS {schema}", (path,))
+            conn.execute(f"PRAGMA {schema}.journal_mode={DB_JOURNAL_MODE}")
+            conn.execute(f"PRAGMA {schema}.synchronous={DB_SYNCHRONOUS}")
+        conn.pool = self
+        return conn
+
+    def acquire(self) -> PooledConnection:
+        conn, waiter = None, None
+        with self._lock:
+            if self._waiters:
+                # 已有人排队时新来的也排到队尾，避免归还的连接总被新请求抢走
+                waiter = _PoolWaiter()
+                self._waiters.append(waiter)
+            elif not self._idle.empty():
+                conn = self._idle.get_nowait()
+            elif self.max_connections <= 0 or self.opened < self.max_connections:
+                # 池中无空闲连接时在上限内临时新建，归还时超出保留数的部分直接关闭
+                self.opened += 1
+            else:
+                waiter = _PoolWaiter()
+                self._waiters.append(waiter)
+        if waiter is not None:
+            waiter.event.wait(self.acquire_timeout)
+            with self._lock:
+                if not waiter.granted:
+                    self._waiters.remove(waiter)
+                    raise TimeoutError(f"等待数据库连接超时（已打开 {self.opened} 个连接）")
+            conn = waiter.conn
+        if conn is None:
+            try:
+                conn = self._connect()
+            except Exception:
+                self._discard()
+                raise
+        if PROFILING_ENABLED:
+            # 借出连接期间该线程在替当前请求访问数据库，计入请求的性能分析
+            request_profiler.attach_thread()
+        return conn
+
+    def _grant(self, conn: Optional[PooledConnection]) -> bool:
+        """把连接（None 表示空出的名额，由等待方自行新建）交给队首等待者，须持有锁"""
+        if not self._waiters:
+            return False
+        waiter = self._waiters.popleft()
+        waiter.conn, waiter.granted = conn, True
+        waiter.event.set()
+        return True
+
+    def release(self, conn: PooledConnection) -> None:
+        if PROFILING_ENABLED:
+            request_profiler.detach_thread()
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except Exception:
+            conn.close_physical()
+            self._discard()
+            raise
+        with self._lock:
+            if self._grant(conn):
+                return
+            keep = self._idle.qsize() < self.size
+            if keep:
+                self._idle.put(conn)
+            else:
+                self.opened -= 1
+        if not keep:
+            conn.close_physical()
+
+    def _discard(self) -> None:
+        with self._lock:
+            if not self._grant(None):
+                self.opened -= 1
+
+    def close_all(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close_physical()
+            except queue.Empty:
+                break
+            self._discard()
+
+# 上限应不小于线程池容量（anyio 默认 40 个线程）加后台任务数，否则线程会在等连接时空占线程池
+db_pool = SQLiteConnectionPool(DB_PATH, DB_POOL_SIZE, {"archive": ARCHIVE_DB_PATH} if ARCHIVE_ATTACHED else None,
+                               DB_POOL_MAX_CONNECTIONS, DB_POOL_ACQUIRE_TIMEOUT_SECONDS)
+
+def get_db_conn():
+    try:
+        return db_pool.acquire()
+    except TimeoutError:
+        raise HTTPException(status_code=503, detail="数据库繁忙，请稍后重试")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"数据库连接失败：{str(e)}")
+
 # ====================== 初始化SQLite数据库 ======================
 def init_db():
-    conn = sqlite3.connect(DB_PATH)
+    conn = get_db_conn()
     cursor = conn.cursor()
     
     # 创建脚本表
@@ -192,68 +600,832 @@ def init_db():
         )
     ''')
     
+    # 创建视频生成任务表（异步队列，重启后继续执行未完成的任务）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS video_jobs (
+            id VARCHAR(64) PRIMARY KEY,
+            user_id VARCHAR(64) NOT NULL,
+            model VARCHAR(10) NOT NULL,
+            digital_human VARCHAR(50),
+            voice_style VARCHAR(50),
+            script TEXT NOT NULL,
+            status VARCHAR(20) NOT NULL,
+            usage_date DATE NOT NULL,
+            video_url TEXT,
+            task_id VARCHAR(128),
+            raw_response TEXT,
+            error TEXT,
+            create_time DATETIME NOT NULL,
+            update_time DATETIME NOT NULL,
+            finish_time DATETIME
+        )
+    ''')
+    
+    # 创建正文存储表（内容寻址：按正文哈希去重，scripts/favorites 通过 content_hash 引用）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS text_blobs (
+            hash VARCHAR(64) PRIMARY KEY,
+            body TEXT NOT NULL,
+            structured TEXT,
+            ref_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    
+    # 创建脚本归档表（位于归档库；列表字段明文存放，正文/方案/结构化结果压缩为 payload）
+    if ARCHIVE_ATTACHED:
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archive.scripts_archive (
+                id VARCHAR(64) PRIMARY KEY,
+                user_id VARCHAR(64) NOT NULL,
+                scene VARCHAR(100) NOT NULL,
+                style VARCHAR(100) NOT NULL,
+                duration VARCHAR(20) NOT NULL,
+                key_info TEXT,
+                title VARCHAR(200),
+                create_time DATETIME NOT NULL,
+                update_time DATETIME NOT NULL,
+                codec VARCHAR(10) NOT NULL,
+                payload BLOB NOT NULL,
+                raw_bytes INTEGER NOT NULL,
+                archive_time DATETIME NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS archive.idx_scripts_archive_user_time ON scripts_archive(user_id, create_time DESC, id DESC)')
+    
+    # 创建脚本生成结果缓存表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS script_cache (
+            cache_key VARCHAR(64) PRIMARY KEY,
+            value TEXT NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            create_time DATETIME NOT NULL,
+            last_access_time DATETIME NOT NULL
+        )
+    ''')
+    
+    # 创建视频结果缓存表（相同脚本/模型/数字人/音色直接复用已生成的视频地址）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS video_cache (
+            cache_key VARCHAR(64) PRIMARY KEY,
+            value TEXT NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            create_time DATETIME NOT NULL,
+            last_access_time DATETIME NOT NULL
+        )
+    ''')
+    
+    # 创建场景语料库缓存表
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS corpus_cache (
+            cache_key VARCHAR(100) PRIMARY KEY,
+            value TEXT NOT NULL,
+            hit_count INTEGER NOT NULL DEFAULT 0,
+            create_time DATETIME NOT NULL,
+            last_access_time DATETIME NOT NULL
+        )
+    ''')
+    
+    # 创建 DeepSeek 用量表（每次生成一行，用于统计上下文缓存命中率与 token 消耗）
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deepseek_usage (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            purpose VARCHAR(20) NOT NULL,
+            user_id VARCHAR(64),
+            script_id VARCHAR(64),
+            scene VARCHAR(100),
+            model VARCHAR(64),
+            endpoint VARCHAR(64),
+            prompt_tokens INTEGER NOT NULL DEFAULT 0,
+            prompt_cache_hit_tokens INTEGER NOT NULL DEFAULT 0,
+            prompt_cache_miss_tokens INTEGER NOT NULL DEFAULT 0,
+            completion_tokens INTEGER NOT NULL DEFAULT 0,
+            finish_reason VARCHAR(20),
+            create_time DATETIME NOT NULL
+        )
+    ''')
+    
     # 创建索引
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scripts_user ON scripts(user_id)')
-    cursor.execute('CREATE INDEX IF NOT EXISTS idx_favorites_user ON favorites(user_id)')
+    # 按 (user_id, create_time, id) 建复合索引，支持按时间倒序的游标分页（取代单列 user_id 索引）
+    cursor.execute('DROP INDEX IF EXISTS idx_scripts_user')
+    cursor.execute('DROP INDEX IF EXISTS idx_favorites_user')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_scripts_user_time ON scripts(user_id, create_time DESC, id DESC)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_favorites_user_time ON favorites(user_id, create_time DESC, id DESC)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_users_phone ON users(phone)')
     cursor.execute('CREATE INDEX IF NOT EXISTS idx_video_usage_user_date ON video_usage_daily(user_id, usage_date)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_video_memberships_expire ON video_memberships(member_expire_at) WHERE is_member = 1')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_video_jobs_user ON video_jobs(user_id, create_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_video_jobs_status ON video_jobs(status)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_script_cache_access ON script_cache(last_access_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_video_cache_access ON video_cache(last_access_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_corpus_cache_access ON corpus_cache(last_access_time)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_text_blobs_orphan ON text_blobs(ref_count) WHERE ref_count <= 0')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_deepseek_usage_time ON deepseek_usage(create_time)')
     
+    # 旧库迁移：新增标题列，列表摘要模式无需读取正文
+    _add_column_if_missing(cursor, "scripts", "title", "VARCHAR(200)")
+    _add_column_if_missing(cursor, "favorites", "title", "VARCHAR(200)")
+    # 结构化脚本（JSON，与 schemes 一一对应），写入时解析一次
+    _add_column_if_missing(cursor, "scripts", "structured", "TEXT")
+    # 正文改为引用 text_blobs，content 列仅保留给尚未迁移的旧数据
+    _add_column_if_missing(cursor, "scripts", "content_hash", "VARCHAR(64)")
+    _add_column_if_missing(cursor, "favorites", "content_hash", "VARCHAR(64)")
+    # 命中视频结果缓存的任务直接标记为成功
+    _add_column_if_missing(cursor, "video_jobs", "cache_hit", "INTEGER NOT NULL DEFAULT 0")
+    _init_text_blob_triggers(cursor)
     conn.commit()
+
+    # 先移除旧版全文索引触发器，避免迁移正文时逐行重建索引
+    _drop_legacy_fulltext_search(conn)
+    _migrate_text_blobs(conn)
+
+    global FTS_ENABLED
+    FTS_ENABLED = _init_fulltext_search(conn)
     conn.close()
 
+def _add_column_if_missing(cursor: sqlite3.Cursor, table: str, column: str, ddl: str) -> None:
+    cursor.execute(f"PRAGMA table_info({table})")
+    if column not in {row[1] for row in cursor.fetchall()}:
+        cursor.execute(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}")
+
+# ====================== 正文去重存储（内容寻址） ======================
+# 热门脚本会被多次生成复用、被多个用户收藏，正文按哈希只存一份；
+# 引用计数由触发器维护，删除记录后由调用方清理计数归零的正文
+BLOB_TABLES = ("scripts", "favorites")
+BLOB_JOIN = " LEFT JOIN text_blobs b ON b.hash = s.content_hash"
+
+def _init_text_blob_triggers(cursor: sqlite3.Cursor) -> None:
+    for table in BLOB_TABLES:
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_blob_ai AFTER INSERT ON {table} BEGIN
+                UPDATE text_blobs SET ref_count = ref_count + 1 WHERE hash = new.content_hash;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_blob_ad AFTER DELETE ON {table} BEGIN
+                UPDATE text_blobs SET ref_count = ref_count - 1 WHERE hash = old.content_hash;
+            END
+        ''')
+        cursor.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_blob_au AFTER UPDATE OF content_hash ON {table} BEGIN
+                UPDATE text_blobs SET ref_count = ref_count - 1 WHERE hash = old.content_hash;
+                UPDATE text_blobs SET ref_count = ref_count + 1 WHERE hash = new.content_hash;
+            END
+        ''')
+
+def _text_hash(body: str) -> str:
+    return hashlib.sha256(body.encode("utf-8")).hexdigest()
+
+def _store_text_blob(cursor: sqlite3.Cursor, body: str, structured: Optional[Dict[str, Any]] = None) -> str:
+    """写入正文（已存在则复用），返回哈希；引用计数在插入引用行时由触发器增加"""
+    content_hash = _text_hash(body)
+    cursor.execute(
+        """
+        INSERT INTO text_blobs (hash, body, structured, ref_count) VALUES (?, ?, ?, 0)
+        ON CONFLICT(hash) DO UPDATE SET structured = COALESCE(text_blobs.structured, excluded.structured)
+        """,
+        (content_hash, body, json.dumps(structured, ensure_ascii=False, separators=(",", ":")) if structured is not None else None)
+    )
+    return content_hash
+
+def _purge_text_blobs(cursor: sqlite3.Cursor, hashes: Optional[List[str]] = None) -> int:
+    """删除引用计数归零的正文；不传 hashes 时清理全部"""
+    if hashes is None:
+        cursor.execute("DELETE FROM text_blobs WHERE ref_count <= 0")
+        return cursor.rowcount
+    hashes = [content_hash for content_hash in hashes if content_hash]
+    if not hashes:
+        return 0
+    placeholders = ", ".join("?" for _ in hashes)
+    cursor.execute(f"DELETE FROM text_blobs WHERE ref_count <= 0 AND hash IN ({placeholders})", hashes)
+    return cursor.rowcount
+
+def _load_json_list(value: Optional[str]) -> list:
+    # 归档记录解压后已是列表
+    if isinstance(value, list):
+        return value
+    try:
+        loaded = json.loads(value) if value else []
+    except ValueError:
+        return []
+    return loaded if isinstance(loaded, list) else []
+
+def _migrate_text_blobs(conn: sqlite3.Connection, batch_size: int = 1000) -> int:
+    """
+    把仍内联在 scripts/favorites 中的正文迁入 text_blobs，相同正文只保留一份，可重复执行。
+    单方案脚本的 schemes/structured 与正文重复，迁移后清空，结构化结果随正文存放
+    """
+    migrated = 0
+    cursor = conn.cursor()
+    for table in BLOB_TABLES:
+        extra_columns = ", schemes, structured" if table == "scripts" else ""
+        last_rowid = 0
+        while True:
+            cursor.execute(
+                f"SELECT rowid, content{extra_columns} FROM {table} WHERE rowid > ? AND content_hash IS NULL ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                content = row["content"] or ""
+                if table == "favorites":
+                    updates.append((_store_text_blob(cursor, content), row[0]))
+                    continue
+                schemes = _load_json_list(row["schemes"])
+                single = not schemes or schemes == [content]
+                structured = _load_json_list(row["structured"])
+                blob_structured = structured[0] if single and len(structured) == 1 else None
+                content_hash = _store_text_blob(cursor, content, blob_structured)
+                updates.append((
+                    content_hash,
+                    None if single else row["schemes"],
+                    None if single else row["structured"],
+                    row[0]
+                ))
+            if table == "scripts":
+                cursor.executemany("UPDATE scripts SET content_hash = ?, content = '', schemes = ?, structured = ? WHERE rowid = ?", updates)
+            else:
+                cursor.executemany("UPDATE favorites SET content_hash = ?, content = '' WHERE rowid = ?", updates)
+            conn.commit()
+            migrated += len(updates)
+            last_rowid = rows[-1][0]
+    cursor.close()
+    return migrated
+
+def _select_columns(fields: List[str]) -> tuple:
+    """字段名 -> (SELECT 列表达式, JOIN 子句)；正文从 text_blobs 读取，未迁移的行回退到内联列"""
+    columns = []
+    join = ""
+    for field in fields:
+        if field == "content":
+            columns.append("COALESCE(b.body, s.content) AS content")
+            join = BLOB_JOIN
+        elif field == "structured":
+            columns.append("s.structured AS structured, b.structured AS blob_structured")
+            join = BLOB_JOIN
+        else:
+            columns.append(f"s.{field}")
+    return ", ".join(columns), join
+
+# ====================== 全文检索（FTS5 trigram，支持中文子串匹配）======================
+FTS_ENABLED = False
+FTS_TABLES = {
+    "scripts": "scripts_fts",
+    "favorites": "favorites_fts"
+}
+
+def _drop_legacy_fulltext_search(conn: sqlite3.Connection) -> None:
+    """旧版索引直接以原表为外部内容表，正文迁出后需改为读取视图，删除后重建"""
+    cursor = conn.cursor()
+    for table, fts_table in FTS_TABLES.items():
+        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,))
+        row = cursor.fetchone()
+        if row and f"content='{table}'" in row[0]:
+            for suffix in ("ai", "ad", "au"):
+                cursor.execute(f"DROP TRIGGER IF EXISTS {fts_table}_{suffix}")
+            cursor.execute(f"DROP TABLE {fts_table}")
+    conn.commit()
+    cursor.close()
+
+def _init_fulltext_search(conn: sqlite3.Connection) -> bool:
+    cursor = conn.cursor()
+    try:
+        for table, fts_table in FTS_TABLES.items():
+            cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (fts_table,))
+            exists = cursor.fetchone() is not None
+
+            # 正文存放在 text_blobs，通过视图拼出索引所需的列
+            body_sql = "COALESCE(b.body, s.content)"
+            cursor.execute(f'''
+                CREATE VIEW IF NOT EXISTS {fts_table}_source AS
+                SELECT s.rowid AS rowid, s.key_info AS key_info, {body_sql} AS content
+                FROM {table} s{BLOB_JOIN}
+            ''')
+            # 外部内容表：索引只存倒排，正文仍在原表，由触发器保持同步
+            cursor.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts_table} USING fts5(
+                    key_info, content,
+                    content='{fts_table}_source', content_rowid='rowid', tokenize='trigram'
+                )
+            ''')
+            new_body = "COALESCE((SELECT body FROM text_blobs WHERE hash = new.content_hash), new.content)"
+            old_body = "COALESCE((SELECT body FROM text_blobs WHERE hash = old.content_hash), old.content)"
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts_table}_ai AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts_table}(rowid, key_info, content) VALUES (new.rowid, new.key_info, {new_body});
+                END
+            ''')
+            # 删除触发器需在正文被清理前执行：引用计数归零的正文由调用方在删除记录之后清理
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts_table}_ad AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts_table}({fts_table}, rowid, key_info, content) VALUES ('delete', old.rowid, old.key_info, {old_body});
+                END
+            ''')
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts_table}_au AFTER UPDATE OF key_info, content, content_hash ON {table} BEGIN
+                    INSERT INTO {fts_table}({fts_table}, rowid, key_info, content) VALUES ('delete', old.rowid, old.key_info, {old_body});
+                    INSERT INTO {fts_table}(rowid, key_info, content) VALUES (new.rowid, new.key_info, {new_body});
+                END
+            ''')
+            if not exists:
+                # 首次创建时为已有数据建立索引
+                cursor.execute(f"INSERT INTO {fts_table}({fts_table}) VALUES ('rebuild')")
+        conn.commit()
+        return True
+    except sqlite3.OperationalError as e:
+        # 当前 SQLite 未编译 FTS5 / trigram 时退化为 LIKE 查询
+        conn.rollback()
+        print(f"全文检索不可用，搜索将使用 LIKE 查询：{e}")
+        return False
+    finally:
+        cursor.close()
+
 # 初始化数据库
 init_db()
 
-# ====================== SQLite连接函数 ======================
-def get_db_conn():
-    try:
-        conn = sqlite3.connect(DB_PATH)
-        conn.row_factory = sqlite3.Row
-        return conn
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"数据库连接失败：{str(e)}")
+# ====================== DeepSeek 异步客户端（长连接池复用）======================
+# 进程内共享一个 AsyncClient，复用 TCP/TLS 连接，生成请求不再占用线程池
+deepseek_client: Optional[httpx.AsyncClient] = None
+
+def get_deepseek_client() -> httpx.AsyncClient:
+    global deepseek_client
+    if deepseek_client is None or deepseek_client.is_closed:
+        deepseek_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(DEEPSEEK_TIMEOUT_SECONDS, connect=DEEPSEEK_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(
+                max_connections=DEEPSEEK_POOL_MAX_CONNECTIONS,
+                max_keepalive_connections=DEEPSEEK_POOL_MAX_KEEPALIVE,
+                keepalive_expiry=DEEPSEEK_KEEPALIVE_EXPIRY_SECONDS
+            )
+        )
+    return deepseek_client
 
-# ====================== 语料库缓存（优化性能）======================
-corpus_cache = {}
+async def close_deepseek_client() -> None:
+    global deepseek_client
+    if deepseek_client is not None:
+        await deepseek_client.aclose()
+        deepseek_client = None
 
-def get_cached_corpus(scene):
-    if scene in corpus_cache:
-        return corpus_cache[scene]
-    return None
+# 未指定 max_tokens 的调用（如语料库生成）使用的默认值；脚本生成按镜头数估算
+DEEPSEEK_MAX_TOKENS = 2500
 
-def set_cached_corpus(scene, content):
-    corpus_cache[scene] = content
+def _as_messages(prompt) -> List[Dict[str, str]]:
+    """prompt 可以是纯文本，也可以是 prompts 模块构造的消息列表（静态 system 在前，便于命中上下文缓存）"""
+    if isinstance(prompt, str):
+        return [{"role": "user", "content": prompt}]
+    return prompt
 
-# DeepSeek API调用函数
-def call_deepseek_api(prompt):
-    if not DEEPSEEK_API_KEY:
-        raise HTTPException(status_code=500, detail="未配置DeepSeek API Key")
-    
-    url = "https://api.deepseek.com/v1/chat/completions"
+def _build_deepseek_request(prompt, endpoint: PoolEndpoint, stream: bool = False, max_tokens: int = DEEPSEEK_MAX_TOKENS) -> Dict[str, Any]:
     headers = {
-        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+        "Authorization": f"Bearer {endpoint.api_key}",
         "Content-Type": "application/json"
     }
     data = {
-        "model": "deepseek-chat",
-        "messages": [{"role": "user", "content": prompt}],
+        "model": endpoint.model,
+        "messages": _as_messages(prompt),
         "temperature": 1.3,
-        "max_tokens": 2500,
-        "stream": False
+        "max_tokens": max_tokens,
+        "stream": stream
     }
-    
+    if stream:
+        # 最后一个分片附带 usage，用于校正调度池中该 Key 的 token 用量
+        data["stream_options"] = {"include_usage": True}
+    return {"url": endpoint.url, "headers": headers, "json": data}
+
+# ====================== DeepSeek 调度池（多 Key / 多地址）======================
+deepseek_pool = DeepSeekPool(
+    DEEPSEEK_ENDPOINTS, DEEPSEEK_POOL_EVICT_AFTER_FAILURES, DEEPSEEK_POOL_EVICT_SECONDS, DEEPSEEK_POOL_EVICT_MAX_SECONDS
+)
+
+def _acquire_deepseek_lease(prompt, kind: str, max_tokens: int = DEEPSEEK_MAX_TOKENS) -> PoolLease:
+    # 发起前按 prompt 字符数 + max_tokens 预占 token（中文约 1 字 1 token 以内），完成后按 usage 校正
+    prompt_chars = sum(len(message["content"]) for message in _as_messages(prompt))
     try:
-        response = requests.post(url, headers=headers, json=data, timeout=60)
-        response.raise_for_status()
-        result = response.json()
-        content = result["choices"][0]["message"]["content"].strip()
-        return content
-    except requests.exceptions.Timeout:
+        return deepseek_pool.acquire(prompt_chars + max_tokens, kind)
+    except PoolExhaustedError:
+        UPSTREAM_ERRORS.labels("deepseek", "pool_exhausted").inc()
+        raise
+
+def _release_deepseek_lease(lease: PoolLease, exc: BaseException) -> None:
+    """按失败类型交回调度池：429 暂停该 Key，鉴权/余额问题与上游故障计入移出，其余 4xx 只释放占用"""
+    if not isinstance(exc, Exception):
+        deepseek_pool.cancel(lease)
+    elif isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        if status == 429:
+            deepseek_pool.rate_limited(lease, parse_retry_after(exc.response.headers.get("Retry-After")))
+        else:
+            deepseek_pool.fail(lease, status >= 500 or status in (401, 402, 403))
+    else:
+        deepseek_pool.fail(lease)
+
+# ====================== 上游容错（退避重试 / 熔断 / DeepSeek 对冲请求）======================
+upstream_retry_policy = RetryPolicy(
+    UPSTREAM_RETRY_MAX_ATTEMPTS, UPSTREAM_RETRY_BASE_DELAY_SECONDS, UPSTREAM_RETRY_MAX_DELAY_SECONDS, UPSTREAM_RETRY_AFTER_MAX_SECONDS
+)
+deepseek_breaker = CircuitBreaker("deepseek", UPSTREAM_BREAKER_FAILURE_THRESHOLD, UPSTREAM_BREAKER_RECOVERY_SECONDS)
+sedance_breaker = CircuitBreaker("sedance", UPSTREAM_BREAKER_FAILURE_THRESHOLD, UPSTREAM_BREAKER_RECOVERY_SECONDS)
+# 最近成功的非流式调用耗时，用于计算对冲请求的触发时间
+deepseek_latency = LatencyTracker()
+UPSTREAM_RETRIES = metrics_registry.counter("upstream_retries_total", "上游调用重试次数", ("upstream",))
+DEEPSEEK_HEDGES = metrics_registry.counter(
+    "deepseek_hedged_requests_total", "DeepSeek 对冲请求：fired 为发出次数，won 为对冲请求先返回的次数", ("event",))
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+def _is_upstream_outage(exc: Exception) -> bool:
+    """超时、网络错误、5xx、返回内容无法解析计入熔断；其余 4xx（含 429 限流）说明上游可达，不计入"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code >= 500
+    return isinstance(exc, (httpx.HTTPError, ValueError, KeyError, IndexError, TypeError))
+
+def _deepseek_retryable(exc: Exception) -> bool:
+    if isinstance(exc, PoolExhaustedError):
+        return True
+    if isinstance(exc, httpx.HTTPStatusError):
+        status = exc.response.status_code
+        # 多个 Key 时，某个 Key 鉴权失败或余额不足可以换其他 Key 重试
+        return status in RETRYABLE_STATUS_CODES or (len(deepseek_pool) > 1 and status in (401, 402, 403))
+    return isinstance(exc, httpx.TransportError)
+
+def _sedance_retryable(exc: Exception) -> bool:
+    """视频生成不是幂等操作：只在确定请求未被受理时重试（连接失败、429、503）"""
+    if isinstance(exc, httpx.HTTPStatusError):
+        return exc.response.status_code in (429, 503)
+    return isinstance(exc, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout))
+
+def _record_upstream_result(breaker: CircuitBreaker, exc: Optional[Exception] = None) -> None:
+    if isinstance(exc, PoolExhaustedError):
+        # 调度池没有可用 Key 时并未真正发出请求，不影响熔断状态
+        return
+    if exc is not None and _is_upstream_outage(exc):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+def _before_upstream_call(upstream: str, breaker: CircuitBreaker) -> None:
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        UPSTREAM_ERRORS.labels(upstream, "circuit_open").inc()
+        raise
+
+def _retry_delay(upstream: str, exc: Exception, attempt: int, deadline: float, retryable: Callable[[Exception], bool]) -> Optional[float]:
+    """返回下次重试前的等待秒数；不可重试、次数用尽或等待后会超出总时限时返回 None"""
+    if not retryable(exc):
+        return None
+    if isinstance(exc, PoolExhaustedError):
+        retry_after = exc.retry_after
+    elif isinstance(exc, httpx.HTTPStatusError):
+        retry_after = parse_retry_after(exc.response.headers.get("Retry-After"))
+        if upstream == "deepseek" and deepseek_pool.has_available():
+            # 限流的 Key 已在调度池中暂停，还有其他可用 Key 时不必等待 Retry-After
+            retry_after = None
+    else:
+        retry_after = None
+    delay = upstream_retry_policy.backoff(attempt, retry_after)
+    if delay is None or time.monotonic() + delay >= deadline:
+        return None
+    UPSTREAM_RETRIES.labels(upstream).inc()
+    return delay
+
+async def _call_upstream(upstream: str, breaker: CircuitBreaker, attempt_fn: Callable[[], Any],
+                         retryable: Callable[[Exception], bool], budget_seconds: float) -> Any:
+    """按重试策略调用 attempt_fn；熔断中抛出 CircuitOpenError，其余异常原样抛出，由调用方转换为接口错误"""
+    deadline = time.monotonic() + budget_seconds
+    attempt = 0
+    while True:
+        _before_upstream_call(upstream, breaker)
+        try:
+            result = await attempt_fn()
+        except Exception as e:
+            _record_upstream_result(breaker, e)
+            delay = _retry_delay(upstream, e, attempt, deadline, retryable)
+            if delay is None:
+                raise
+        else:
+            _record_upstream_result(breaker)
+            return result
+        await asyncio.sleep(delay)
+        attempt += 1
+
+def _deepseek_hedge_delay() -> Optional[float]:
+    """首个请求超过近期耗时分位（且不少于最小等待）仍未返回时发出对冲请求；样本不足时不对冲"""
+    if not DEEPSEEK_HEDGE_ENABLED:
+        return None
+    observed = deepseek_latency.quantile(DEEPSEEK_HEDGE_QUANTILE, DEEPSEEK_HEDGE_MIN_SAMPLES)
+    if observed is None:
+        return None
+    return max(observed, DEEPSEEK_HEDGE_MIN_DELAY_SECONDS)
+
+# ====================== 生成结果缓存（SQLite 持久化，TTL + LRU）======================
+class SQLiteResultCache:
+    """
+    基于 SQLite 表的结果缓存：过期按 TTL（或调用方传入的 is_fresh）判断，超出容量按最近访问时间淘汰。
+    命中时距上次记录访问不足 access_update_interval 秒则不写库，命中次数先记在内存，下次刷新访问时间时一并累加，
+    热点条目不会每次命中都抢写锁；淘汰顺序的精度因此降到该间隔
+    """
+
+    def __init__(self, table: str, ttl_seconds: int, max_entries: int,
+                 access_update_interval: int = CACHE_ACCESS_UPDATE_INTERVAL_SECONDS):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.access_update_interval = access_update_interval
+        self._pending_hits: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _count(self, field: str, amount: int = 1) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + amount)
+
+    def get(self, key: str, is_fresh: Optional[Callable[[str], bool]] = None) -> Optional[str]:
+        now = datetime.now()
+        expire_before = (now - timedelta(seconds=self.ttl_seconds)).strftime("%Y-%m-%d %H:%M:%S")
+        conn = get_db_conn()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT value, create_time, last_access_time FROM {self.table} WHERE cache_key = ?", (key,))
+            row = cursor.fetchone()
+            if row and (row["create_time"] < expire_before or (is_fresh is not None and not is_fresh(row["value"]))):
+                cursor.execute(f"DELETE FROM {self.table} WHERE cache_key = ?", (key,))
+                conn.commit()
+                self._count("evictions")
+                with self._lock:
+                    self._pending_hits.pop(key, None)
+                row = None
+            if not row:
+                cursor.close()
+                self._count("misses")
+                return None
+
+            refresh_before = (now - timedelta(seconds=self.access_update_interval)).strftime("%Y-%m-%d %H:%M:%S")
+            with self._lock:
+                self.hits += 1
+                hit_count = self._pending_hits.pop(key, 0) + 1
+                if self.access_update_interval > 0 and row["last_access_time"] > refresh_before:
+                    # 内存中的待写次数只是统计用途，条目过多时直接丢弃，避免无限增长
+                    if len(self._pending_hits) < max(self.max_entries, 1000):
+                        self._pending_hits[key] = hit_count
+                    hit_count = 0
+            if hit_count:
+                cursor.execute(
+                    f"UPDATE {self.table} SET hit_count = hit_count + ?, last_access_time = ? WHERE cache_key = ?",
+                    (hit_count, now.strftime("%Y-%m-%d %H:%M:%S"), key)
+                )
+                conn.commit()
+            cursor.close()
+            return row["value"]
+        finally:
+            conn.close()
+
+    def set(self, key: str, value: str) -> None:
+        now = _now_str()
+        conn = get_db_conn()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                f"""
+                INSERT INTO {self.table} (cache_key, value, hit_count, create_time, last_access_time)
+                VALUES (?, ?, 0, ?, ?)
+                ON CONFLICT(cache_key)
+                DO UPDATE SET value = excluded.value, create_time = excluded.create_time, last_access_time = excluded.last_access_time
+                """,
+                (key, value, now, now)
+            )
+            # 超出容量时淘汰最久未访问的条目
+            cursor.execute(
+                f"""
+                DELETE FROM {self.table} WHERE cache_key IN (
+                    SELECT cache_key FROM {self.table} ORDER BY last_access_time ASC
+                    LIMIT MAX((SELECT COUNT(*) FROM {self.table}) - ?, 0)
+                )
+                """,
+                (self.max_entries,)
+            )
+            evicted = cursor.rowcount
+            conn.commit()
+            cursor.close()
+            if evicted > 0:
+                self._count("evictions", evicted)
+        finally:
+            conn.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses, evictions = self.hits, self.misses, self.evictions
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries
+        }
+
+script_result_cache = SQLiteResultCache("script_cache", SCRIPT_CACHE_TTL_SECONDS, SCRIPT_CACHE_MAX_ENTRIES)
+video_result_cache = SQLiteResultCache("video_cache", VIDEO_CACHE_TTL_SECONDS, VIDEO_CACHE_MAX_ENTRIES)
+
+def _normalize_cache_text(value: Optional[str]) -> str:
+    normalized = unicodedata.normalize("NFKC", value or "")
+    return re.sub(r"\s+", " ", normalized).strip().lower()
+
+# ====================== DeepSeek 用量记录（上下文缓存命中统计）======================
+# 每次生成的 usage 先放入内存缓冲，由后台任务定期批量写库，不占用请求路径
+DEEPSEEK_TOKENS = metrics_registry.counter(
+    "deepseek_tokens_total", "DeepSeek token 消耗：prompt 为输入总量，cache_hit 为其中命中上下文缓存的部分", ("type",))
+DEEPSEEK_USAGE_BUFFER_MAX = 10000
+deepseek_usage_buffer: deque = deque(maxlen=DEEPSEEK_USAGE_BUFFER_MAX)
+
+def _normalize_deepseek_usage(usage: Dict[str, Any]) -> Dict[str, int]:
+    """兼容 DeepSeek（prompt_cache_hit_tokens）与 OpenAI（prompt_tokens_details.cached_tokens）两种字段"""
+    prompt_tokens = int(usage.get("prompt_tokens") or 0)
+    hit = usage.get("prompt_cache_hit_tokens")
+    if hit is None:
+        hit = (usage.get("prompt_tokens_details") or {}).get("cached_tokens")
+    hit = int(hit or 0)
+    miss = usage.get("prompt_cache_miss_tokens")
+    return {
+        "prompt_tokens": prompt_tokens,
+        "prompt_cache_hit_tokens": hit,
+        "prompt_cache_miss_tokens": int(miss) if miss is not None else max(prompt_tokens - hit, 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0)
+    }
+
+def _record_deepseek_usage(result: Dict[str, Any], usage_tags: Optional[Dict[str, Any]]) -> None:
+    if not result.get("usage"):
+        return
+    usage = _normalize_deepseek_usage(result["usage"])
+    DEEPSEEK_TOKENS.labels("prompt").inc(usage["prompt_tokens"])
+    DEEPSEEK_TOKENS.labels("cache_hit").inc(usage["prompt_cache_hit_tokens"])
+    DEEPSEEK_TOKENS.labels("completion").inc(usage["completion_tokens"])
+    tags = usage_tags or {}
+    deepseek_usage_buffer.append((
+        tags.get("purpose", "other"), tags.get("user_id"), tags.get("script_id"), tags.get("scene"),
+        result.get("model"), result.get("endpoint"),
+        usage["prompt_tokens"], usage["prompt_cache_hit_tokens"], usage["prompt_cache_miss_tokens"], usage["completion_tokens"],
+        result.get("finish_reason"), _now_str()
+    ))
+
+def _flush_deepseek_usage() -> int:
+    rows = []
+    while deepseek_usage_buffer:
+        rows.append(deepseek_usage_buffer.popleft())
+    if not rows:
+        return 0
+    conn = get_db_conn()
+    try:
+        conn.executemany(
+            "INSERT INTO deepseek_usage (purpose, user_id, script_id, scene, model, endpoint, prompt_tokens, prompt_cache_hit_tokens, prompt_cache_miss_tokens, completion_tokens, finish_reason, create_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            rows
+        )
+        conn.commit()
+    finally:
+        conn.close()
+    return len(rows)
+
+async def flush_deepseek_usage_periodically() -> None:
+    while True:
+        await asyncio.sleep(DEEPSEEK_USAGE_FLUSH_INTERVAL_SECONDS)
+        try:
+            await run_in_threadpool(_flush_deepseek_usage)
+        except Exception as e:
+            print(f"DeepSeek 用量写入异常: {e}")
+
+# DeepSeek API调用函数
+async def _deepseek_chat_attempt(prompt, max_tokens: int) -> Dict[str, Any]:
+    lease = _acquire_deepseek_lease(prompt, "chat", max_tokens)
+    started = time.perf_counter()
+    try:
+        with _track_upstream("deepseek", DEEPSEEK_REQUEST_SECONDS.labels("chat")):
+            response = await get_deepseek_client().post(**_build_deepseek_request(prompt, lease.endpoint, max_tokens=max_tokens))
+            response.raise_for_status()
+            result = response.json()
+            choice = result["choices"][0]
+            content = choice["message"]["content"].strip()
+    except BaseException as e:
+        _release_deepseek_lease(lease, e)
+        raise
+    usage = result.get("usage") or {}
+    deepseek_pool.succeed(lease, usage.get("total_tokens"))
+    deepseek_latency.add(time.perf_counter() - started)
+    return {
+        "content": content,
+        "finish_reason": choice.get("finish_reason"),
+        "usage": usage,
+        "model": result.get("model") or lease.endpoint.model,
+        "endpoint": lease.endpoint.name
+    }
+
+async def call_deepseek_api(prompt, usage_tags: Optional[Dict[str, Any]] = None, max_tokens: int = DEEPSEEK_MAX_TOKENS) -> str:
+    return (await call_deepseek_chat(prompt, usage_tags, max_tokens))["content"]
+
+# 返回完整结果（content / finish_reason / usage / model / endpoint），usage_tags 随用量一起记录（purpose、user_id、script_id、scene）
+async def call_deepseek_chat(prompt, usage_tags: Optional[Dict[str, Any]] = None, max_tokens: int = DEEPSEEK_MAX_TOKENS) -> Dict[str, Any]:
+    try:
+        result = await _call_upstream(
+            "deepseek",
+            deepseek_breaker,
+            lambda: hedged(
+                lambda: _deepseek_chat_attempt(prompt, max_tokens),
+                _deepseek_hedge_delay(),
+                lambda event: DEEPSEEK_HEDGES.labels(event).inc()
+            ),
+            _deepseek_retryable,
+            DEEPSEEK_TIMEOUT_SECONDS
+        )
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"AI服务暂时不可用，请{e.retry_in:.0f}秒后重试")
+    except PoolExhaustedError as e:
+        raise HTTPException(status_code=503, detail=f"AI服务繁忙，请{max(e.retry_after, 1):.0f}秒后重试")
+    except httpx.TimeoutException:
         raise HTTPException(status_code=500, detail="AI响应超时，请稍后重试")
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         raise HTTPException(status_code=500, detail=f"AI请求失败：{str(e)}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"AI生成失败：{str(e)}")
+    _record_deepseek_usage(result, usage_tags)
+    return result
+
+# DeepSeek 流式调用：逐段产出模型生成的文本增量；尚未产出任何内容前失败时按重试策略重新发起
+# 传入 outcome 时，正常结束后写入 finish_reason 与 usage（调用方据此判断是否被 max_tokens 截断）
+async def stream_deepseek_api(prompt, usage_tags: Optional[Dict[str, Any]] = None, max_tokens: int = DEEPSEEK_MAX_TOKENS,
+                              outcome: Optional[Dict[str, Any]] = None) -> AsyncIterator[str]:
+    started = time.perf_counter()
+    deadline = time.monotonic() + DEEPSEEK_TIMEOUT_SECONDS
+    first_token = True
+    attempt = 0
+    try:
+        while True:
+            _before_upstream_call("deepseek", deepseek_breaker)
+            lease = None
+            usage: Dict[str, Any] = {}
+            finish_reason = None
+            first_token_seconds = None
+            try:
+                lease = _acquire_deepseek_lease(prompt, "stream", max_tokens)
+                with _track_upstream("deepseek", DEEPSEEK_REQUEST_SECONDS.labels("stream")):
+                    request_kwargs = _build_deepseek_request(prompt, lease.endpoint, stream=True, max_tokens=max_tokens)
+                    async with get_deepseek_client().stream("POST", **request_kwargs) as response:
+                        if response.is_error:
+                            await response.aread()
+                            response.raise_for_status()
+                        async for line in response.aiter_lines():
+                            if not line.startswith("data:"):
+                                continue
+                            payload = line[len("data:"):].strip()
+                            if payload == "[DONE]":
+                                break
+                            chunk = json.loads(payload)
+                            usage = chunk.get("usage") or usage
+                            choices = chunk.get("choices") or []
+                            if not choices:
+                                continue
+                            finish_reason = choices[0].get("finish_reason") or finish_reason
+                            delta = (choices[0].get("delta") or {}).get("content")
+                            if delta:
+                                if first_token_seconds is None:
+                                    first_token_seconds = time.monotonic() - lease.started
+                                if first_token:
+                                    first_token = False
+                                    DEEPSEEK_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                                yield delta
+            except BaseException as e:
+                if lease is not None:
+                    _release_deepseek_lease(lease, e)
+                if not isinstance(e, Exception):
+                    raise
+                _record_upstream_result(deepseek_breaker, e)
+                # 已推送给前端的内容无法撤回，只有首个增量之前的失败才重试
+                delay = _retry_delay("deepseek", e, attempt, deadline, _deepseek_retryable) if first_token else None
+                if delay is None:
+                    raise
+            else:
+                deepseek_pool.succeed(lease, usage.get("total_tokens"), first_token_seconds)
+                _record_upstream_result(deepseek_breaker)
+                _record_deepseek_usage({
+                    "usage": usage, "finish_reason": finish_reason, "model": lease.endpoint.model, "endpoint": lease.endpoint.name
+                }, usage_tags)
+                if outcome is not None:
+                    outcome.update(finish_reason=finish_reason, usage=usage)
+                return
+            await asyncio.sleep(delay)
+            attempt += 1
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"AI服务暂时不可用，请{e.retry_in:.0f}秒后重试")
+    except PoolExhaustedError as e:
+        raise HTTPException(status_code=503, detail=f"AI服务繁忙，请{max(e.retry_after, 1):.0f}秒后重试")
+    except httpx.TimeoutException:
+        raise HTTPException(status_code=500, detail="AI响应超时，请稍后重试")
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"AI请求失败：{str(e)}")
+    except ValueError as e:
+        raise HTTPException(status_code=500, detail=f"AI生成失败：{str(e)}")
 
 # 数据模型（新增style和duration字段，带默认值）
 class CreateScriptRequest(BaseModel):
@@ -263,6 +1435,7 @@ class CreateScriptRequest(BaseModel):
     brand_corpus_id: str = None
     style: str = "口语化"  # 新增：风格，默认口语化
     duration: str = "30秒"  # 新增：时长，默认30秒
+    bypass_cache: bool = False  # 为 True 时跳过结果缓存，强制重新生成
 
 # 数据模型：保存脚本请求
 class SaveScriptRequest(BaseModel):
@@ -273,12 +1446,18 @@ class SaveScriptRequest(BaseModel):
     duration: str
     content: str
 
+# 数据模型：批量生成脚本请求
+class BatchCreateScriptRequest(BaseModel):
+    items: List[CreateScriptRequest]
+
 class VideoGenerateRequest(BaseModel):
     user_id: str
     model: str = "2.0"
     digital_human: str = "default"
     voice_style: str = "female"
     script: str
+    bypass_cache: bool = False  # 为 True 时跳过视频结果缓存，强制重新生成
+    cache_hit_consumes_quota: Optional[bool] = None  # 命中缓存时是否扣减次数，不传时取 VIDEO_CACHE_HIT_CONSUMES_QUOTA
 
 class VideoRechargeRequest(BaseModel):
     user_id: str
@@ -306,65 +1485,20 @@ def _parse_time(value: Optional[str]) -> Optional[datetime]:
             continue
     return None
 
-def _ensure_video_membership_row(conn: sqlite3.Connection, user_id: str) -> None:
-    now = _now_str()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT OR IGNORE INTO video_memberships (user_id, is_member, member_expire_at, create_time, update_time) VALUES (?, 0, NULL, ?, ?)",
-        (user_id, now, now)
-    )
-    conn.commit()
-    cursor.close()
-
-def _get_membership_status(conn: sqlite3.Connection, user_id: str) -> Dict[str, Any]:
-    _ensure_video_membership_row(conn, user_id)
-
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT is_member, member_expire_at FROM video_memberships WHERE user_id = ?",
-        (user_id,)
-    )
-    row = cursor.fetchone()
-    cursor.close()
-
-    is_member = bool(row["is_member"]) if row else False
-    member_expire_at = row["member_expire_at"] if row else None
-
+def _effective_membership(is_member: Any, member_expire_at: Optional[str]) -> Dict[str, Any]:
+    """按 member_expire_at 即时判断是否到期，不依赖后台清理是否已执行"""
     expire_dt = _parse_time(member_expire_at)
-    if is_member and expire_dt and expire_dt <= datetime.now():
-        now = _now_str()
-        cursor = conn.cursor()
-        cursor.execute(
-            "UPDATE video_memberships SET is_member = 0, member_expire_at = NULL, update_time = ? WHERE user_id = ?",
-            (now, user_id)
-        )
-        conn.commit()
-        cursor.close()
-        is_member = False
-        member_expire_at = None
-
+    active = bool(is_member) and not (expire_dt and expire_dt <= datetime.now())
     return {
-        "is_member": is_member,
-        "member_expire_at": member_expire_at
+        "is_member": active,
+        "member_expire_at": member_expire_at if active else None
     }
 
 def _get_video_limits(is_member: bool) -> Dict[str, int]:
     return VIDEO_LIMITS_MEMBER if is_member else VIDEO_LIMITS_FREE
 
-def _get_video_quota_snapshot(conn: sqlite3.Connection, user_id: str) -> Dict[str, Any]:
-    membership = _get_membership_status(conn, user_id)
-    limits = _get_video_limits(membership["is_member"])
-    today = _today_str()
-
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT model, used_count FROM video_usage_daily WHERE user_id = ? AND usage_date = ?",
-        (user_id, today)
-    )
-    rows = cursor.fetchall()
-    cursor.close()
-
-    used_map = {row["model"]: int(row["used_count"]) for row in rows}
+def _build_video_quota_snapshot(user_id: str, usage_date: str, is_member: bool, member_expire_at: Optional[str], used_map: Dict[str, int]) -> Dict[str, Any]:
+    limits = _get_video_limits(is_member)
     models = {}
     for model in VIDEO_MODELS:
         used = used_map.get(model, 0)
@@ -377,72 +1511,260 @@ def _get_video_quota_snapshot(conn: sqlite3.Connection, user_id: str) -> Dict[st
 
     return {
         "user_id": user_id,
-        "usage_date": today,
-        "is_member": membership["is_member"],
-        "member_expire_at": membership["member_expire_at"],
+        "usage_date": usage_date,
+        "is_member": is_member,
+        "member_expire_at": member_expire_at,
         "models": models
     }
 
-def _consume_video_quota(conn: sqlite3.Connection, user_id: str, model: str) -> Dict[str, Any]:
-    normalized_model = _normalize_video_model(model)
-    current_quota = _get_video_quota_snapshot(conn, user_id)
-    model_quota = current_quota["models"].get(normalized_model)
-    if not model_quota:
-        raise HTTPException(status_code=400, detail=f"不支持的模型: {normalized_model}")
-    if model_quota["remaining"] <= 0:
-        raise HTTPException(status_code=400, detail=f"{normalized_model} 模型今日次数已用完，请升级会员或明天再试")
+# 一次查询读出会员状态与今日用量；没有会员记录的用户视为非会员，记录在首次充值时才创建
+VIDEO_QUOTA_SQL = """
+    SELECT m.is_member, m.member_expire_at, u.model, u.used_count
+    FROM (SELECT ? AS user_id) k
+    LEFT JOIN video_memberships m ON m.user_id = k.user_id
+    LEFT JOIN video_usage_daily u ON u.user_id = k.user_id AND u.usage_date = ?
+"""
+
+def _read_video_quota_snapshot(cursor: sqlite3.Cursor, user_id: str, today: str) -> Dict[str, Any]:
+    cursor.execute(VIDEO_QUOTA_SQL, (user_id, today))
+    rows = cursor.fetchall()
+    membership = _effective_membership(rows[0]["is_member"], rows[0]["member_expire_at"])
+    used_map = {row["model"]: int(row["used_count"]) for row in rows if row["model"]}
+    return _build_video_quota_snapshot(user_id, today, membership["is_member"], membership["member_expire_at"], used_map)
+
+# ------------------- 配额快照缓存（进程内 LRU，写入时同步更新） -------------------
+class QuotaSnapshotCache:
+    """
+    按用户缓存配额快照。扣减/充值在仍持有数据库写锁时写入新快照，更新顺序与提交顺序一致；
+    退还次数后写入失效标记。跨天、会员到期或超过 TTL 自动失效。
+    未命中时记下当前序号，回填前若该用户已有更新的写入则放弃，避免旧快照覆盖新快照。
+    快照只用于展示，能否扣减始终由 SQL 判断
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: int):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        # user_id -> (序号, 有效期, 快照)，快照为 None 表示失效标记
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._seq = 0
+        self._evicted_seq = 0
+        self._lock = threading.Lock()
+
+    def _valid_until(self, snapshot: Dict[str, Any]) -> datetime:
+        next_day = datetime.strptime(snapshot["usage_date"], "%Y-%m-%d") + timedelta(days=1)
+        valid_until = min(datetime.now() + timedelta(seconds=self.ttl_seconds), next_day)
+        expire_dt = _parse_time(snapshot["member_expire_at"])
+        return min(valid_until, expire_dt) if expire_dt else valid_until
+
+    @staticmethod
+    def _copy(snapshot: Dict[str, Any]) -> Dict[str, Any]:
+        return dict(snapshot, models={model: dict(item) for model, item in snapshot["models"].items()})
+
+    def get(self, user_id: str) -> tuple:
+        """返回 (快照, 序号)：命中时序号为 None，未命中时快照为 None，回填时带回序号"""
+        with self._lock:
+            entry = self.entries.get(user_id)
+            if entry and entry[2] is not None and entry[1] > datetime.now():
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return self._copy(entry[2]), None
+            self.misses += 1
+            return None, self._seq
+
+    def _store(self, user_id: str, snapshot: Optional[Dict[str, Any]]) -> None:
+        self._seq += 1
+        if snapshot is None:
+            self.entries[user_id] = (self._seq, datetime.min, None)
+        else:
+            self.entries[user_id] = (self._seq, self._valid_until(snapshot), self._copy(snapshot))
+        self.entries.move_to_end(user_id)
+        while len(self.entries) > self.max_entries:
+            _, (seq, _, _) = self.entries.popitem(last=False)
+            self._evicted_seq = max(self._evicted_seq, seq)
+
+    def fill(self, snapshot: Dict[str, Any], seq: int) -> None:
+        """查询未命中后回填"""
+        with self._lock:
+            if self.max_entries <= 0 or seq < self._evicted_seq:
+                return
+            entry = self.entries.get(snapshot["user_id"])
+            if entry and entry[0] > seq:
+                return
+            self._store(snapshot["user_id"], snapshot)
+
+    def put(self, snapshot: Dict[str, Any]) -> None:
+        """写入路径调用，须在提交事务前（仍持有写锁时）执行"""
+        with self._lock:
+            if self.max_entries > 0:
+                self._store(snapshot["user_id"], snapshot)
+
+    def invalidate(self, user_id: str) -> None:
+        with self._lock:
+            if self.max_entries > 0:
+                self._store(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            hits, misses, entries = self.hits, self.misses, len(self.entries)
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds
+        }
+
+quota_snapshot_cache = QuotaSnapshotCache(VIDEO_QUOTA_CACHE_MAX_ENTRIES, VIDEO_QUOTA_CACHE_TTL_SECONDS)
+
+def _get_video_quota_snapshot(user_id: str, conn: Optional[sqlite3.Connection] = None) -> Dict[str, Any]:
+    """只读：优先返回缓存快照，未命中才查库；调用方已持有连接时传入 conn，避免同一线程再借一个连接（连接池有上限，可能互相等待）"""
+    quota, seq = quota_snapshot_cache.get(user_id)
+    if quota is not None:
+        return quota
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        quota = _read_video_quota_snapshot(cursor, user_id, _today_str())
+        cursor.close()
+    finally:
+        if own_conn:
+            conn.close()
+    quota_snapshot_cache.fill(quota, seq)
+    return quota
 
+def _commit_quota_change(conn: sqlite3.Connection, quota: Dict[str, Any]) -> None:
+    # 仍持有写锁时写入缓存，保证缓存更新顺序与提交顺序一致；提交失败则作废
+    quota_snapshot_cache.put(quota)
+    try:
+        conn.commit()
+    except Exception:
+        quota_snapshot_cache.invalidate(quota["user_id"])
+        raise
+
+# 会员有效期内取会员额度，否则取免费额度（到期判断在 SQL 内完成，不依赖先读后写）
+VIDEO_LIMIT_SQL = """
+    COALESCE((
+        SELECT CASE
+            WHEN is_member = 1 AND (member_expire_at IS NULL OR member_expire_at > ?) THEN ?
+            ELSE ?
+        END
+        FROM video_memberships WHERE user_id = ?
+    ), ?)
+"""
+
+def _reserve_video_quota(conn: sqlite3.Connection, user_id: str, model: str) -> Dict[str, Any]:
+    """在写事务内扣减一次配额并返回最新快照，不提交；调用方可在同一事务内继续写入，再用 _commit_quota_change 提交"""
+    normalized_model = _normalize_video_model(model)
     now = _now_str()
     today = _today_str()
+    member_limit = VIDEO_LIMITS_MEMBER[normalized_model]
+    free_limit = VIDEO_LIMITS_FREE[normalized_model]
+    limit_params = (now, member_limit, free_limit, user_id, free_limit)
+
     cursor = conn.cursor()
-    cursor.execute(
-        """
-        INSERT INTO video_usage_daily (user_id, usage_date, model, used_count, create_time, update_time)
-        VALUES (?, ?, ?, 1, ?, ?)
-        ON CONFLICT(user_id, usage_date, model)
-        DO UPDATE SET used_count = used_count + 1, update_time = excluded.update_time
-        """,
-        (user_id, today, normalized_model, now, now)
-    )
-    conn.commit()
-    cursor.close()
-    return _get_video_quota_snapshot(conn, user_id)
+    try:
+        # 单条条件 upsert：仅在未达上限时 +1，并发请求不会超发
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute(
+            f"""
+            INSERT INTO video_usage_daily (user_id, usage_date, model, used_count, create_time, update_time)
+            SELECT ?, ?, ?, 1, ?, ? WHERE {VIDEO_LIMIT_SQL} > 0
+            ON CONFLICT(user_id, usage_date, model)
+            DO UPDATE SET used_count = used_count + 1, update_time = excluded.update_time
+            WHERE video_usage_daily.used_count < {VIDEO_LIMIT_SQL}
+            RETURNING used_count
+            """,
+            (user_id, today, normalized_model, now, now) + limit_params + limit_params
+        )
+        consumed = cursor.fetchone()
+        if consumed is None:
+            conn.rollback()
+            raise HTTPException(status_code=400, detail=f"{normalized_model} 模型今日次数已用完，请升级会员或明天再试")
 
-def _activate_membership(conn: sqlite3.Connection, user_id: str, months: int = 1) -> Dict[str, Any]:
-    clamped_months = max(1, min(int(months), 24))
-    current = _get_membership_status(conn, user_id)
+        # 同一事务内读回会员状态与今日用量，组装最新配额快照
+        return _read_video_quota_snapshot(cursor, user_id, today)
+    finally:
+        cursor.close()
 
-    now_dt = datetime.now()
-    base_dt = now_dt
-    current_expire_dt = _parse_time(current.get("member_expire_at"))
-    if current_expire_dt and current_expire_dt > now_dt:
-        base_dt = current_expire_dt
+def _consume_video_quota(conn: sqlite3.Connection, user_id: str, model: str) -> Dict[str, Any]:
+    quota = _reserve_video_quota(conn, user_id, model)
+    _commit_quota_change(conn, quota)
+    return quota
 
-    expire_dt = base_dt + timedelta(days=30 * clamped_months)
-    expire_str = expire_dt.strftime("%Y-%m-%d %H:%M:%S")
+def _activate_membership(conn: sqlite3.Connection, user_id: str, months: int = 1) -> Dict[str, Any]:
+    clamped_months = max(1, min(int(months), 24))
+    days = 30 * clamped_months
     now = _now_str()
+    expire_str = (datetime.now() + timedelta(days=days)).strftime("%Y-%m-%d %H:%M:%S")
 
+    # 首次充值时才创建会员记录；未到期则在原到期时间上顺延，在单条语句内完成，并发充值不会相互覆盖
     cursor = conn.cursor()
     cursor.execute(
         """
         INSERT INTO video_memberships (user_id, is_member, member_expire_at, create_time, update_time)
         VALUES (?, 1, ?, ?, ?)
         ON CONFLICT(user_id)
-        DO UPDATE SET is_member = 1, member_expire_at = excluded.member_expire_at, update_time = excluded.update_time
+        DO UPDATE SET
+            is_member = 1,
+            member_expire_at = CASE
+                WHEN video_memberships.member_expire_at > ? THEN datetime(video_memberships.member_expire_at, ?)
+                ELSE excluded.member_expire_at
+            END,
+            update_time = excluded.update_time
         """,
-        (user_id, expire_str, now, now)
+        (user_id, expire_str, now, now, now, f"+{days} days")
     )
-    conn.commit()
+    quota = _read_video_quota_snapshot(cursor, user_id, _today_str())
+    _commit_quota_change(conn, quota)
     cursor.close()
 
-    quota = _get_video_quota_snapshot(conn, user_id)
     quota["recharge_months"] = clamped_months
     quota["member_price"] = MEMBER_MONTHLY_PRICE
     return quota
 
-def _extract_video_result_fields(api_data: Dict[str, Any]) -> Dict[str, Any]:
-    def read_path(data: Dict[str, Any], *keys: str) -> Any:
-        node: Any = data
+def _sweep_expired_memberships(batch_size: int = 500) -> int:
+    """分批把已到期的会员记录改回非会员，返回处理条数；读取时已按到期时间判断，这里只保持表内状态一致"""
+    swept = 0
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        while True:
+            now = _now_str()
+            cursor.execute(
+                """
+                UPDATE video_memberships SET is_member = 0, member_expire_at = NULL, update_time = ?
+                WHERE rowid IN (
+                    SELECT rowid FROM video_memberships WHERE is_member = 1 AND member_expire_at <= ? LIMIT ?
+                )
+                """,
+                (now, now, batch_size)
+            )
+            conn.commit()
+            swept += cursor.rowcount
+            if cursor.rowcount < batch_size:
+                break
+        cursor.close()
+    finally:
+        conn.close()
+    return swept
+
+async def sweep_expired_memberships_periodically() -> None:
+    while True:
+        try:
+            await run_in_threadpool(_sweep_expired_memberships)
+        except Exception as e:
+            print(f"会员到期清理异常: {e}")
+        await asyncio.sleep(VIDEO_MEMBERSHIP_SWEEP_INTERVAL_SECONDS)
+
+def _extract_video_result_fields(api_data: Dict[str, Any]) -> Dict[str, Any]:
+    def read_path(data: Dict[str, Any], *keys: str) -> Any:
+        node: Any = data
         for key in keys:
             if not isinstance(node, dict) or key not in node:
                 return None
@@ -463,7 +1785,68 @@ def _extract_video_result_fields(api_data: Dict[str, Any]) -> Dict[str, Any]:
     )
     return {"video_url": video_url, "task_id": task_id}
 
-def _call_sedance_api(req: VideoGenerateRequest) -> Dict[str, Any]:
+VIDEO_URL_EXPIRE_FIELDS = ("url_expire_at", "expire_at", "expires_at", "expire_time")
+
+def _parse_expire_value(value: Any) -> Optional[datetime]:
+    """时间戳（秒/毫秒）或时间字符串 -> 本地时间"""
+    if isinstance(value, (int, float)) or (isinstance(value, str) and value.isdigit()):
+        timestamp = float(value)
+        return datetime.fromtimestamp(timestamp / 1000 if timestamp > 1e12 else timestamp)
+    if not isinstance(value, str) or not value:
+        return None
+    parsed = _parse_time(value)
+    if parsed:
+        return parsed
+    try:
+        parsed = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+def _video_url_expire_at(api_data: Dict[str, Any], video_url: str) -> datetime:
+    """
+    上游视频地址的失效时间：优先取返回中的过期字段，其次解析预签名地址参数
+    （Expires 或 X-Amz-/X-Tos- 的 Date + Expires），都没有时按 VIDEO_CACHE_URL_TTL_SECONDS 估计
+    """
+    for container in (api_data, api_data.get("data"), api_data.get("result"), api_data.get("output")):
+        if isinstance(container, dict):
+            for field in VIDEO_URL_EXPIRE_FIELDS:
+                expire_at = _parse_expire_value(container.get(field))
+                if expire_at:
+                    return expire_at
+
+    params = {key.lower(): value for key, value in parse_qsl(urlsplit(video_url).query)}
+    try:
+        for prefix in ("x-amz-", "x-tos-"):
+            if f"{prefix}date" in params and f"{prefix}expires" in params:
+                signed_at = datetime.strptime(params[f"{prefix}date"], "%Y%m%dT%H%M%SZ").replace(tzinfo=timezone.utc)
+                expire_at = signed_at + timedelta(seconds=int(params[f"{prefix}expires"]))
+                return expire_at.astimezone().replace(tzinfo=None)
+        if params.get("expires", "").isdigit():
+            return datetime.fromtimestamp(int(params["expires"]))
+    except (ValueError, OverflowError):
+        pass
+    return datetime.now() + timedelta(seconds=VIDEO_CACHE_URL_TTL_SECONDS)
+
+# Seedance 共享异步客户端，由视频任务 worker 使用
+sedance_client: Optional[httpx.AsyncClient] = None
+
+def get_sedance_client() -> httpx.AsyncClient:
+    global sedance_client
+    if sedance_client is None or sedance_client.is_closed:
+        sedance_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(SEDANCE_TIMEOUT_SECONDS, connect=DEEPSEEK_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=max(VIDEO_WORKER_COUNT, 1) * 2)
+        )
+    return sedance_client
+
+async def close_sedance_client() -> None:
+    global sedance_client
+    if sedance_client is not None:
+        await sedance_client.aclose()
+        sedance_client = None
+
+async def _call_sedance_api(req: VideoGenerateRequest) -> Dict[str, Any]:
     if SEDANCE_MOCK_MODE:
         return {
             "task_id": f"mock_{uuid.uuid4().hex[:12]}",
@@ -488,190 +1871,1532 @@ def _call_sedance_api(req: VideoGenerateRequest) -> Dict[str, Any]:
         "Authorization": f"Bearer {SEDANCE_API_KEY}"
     }
 
+    async def attempt() -> httpx.Response:
+        with _track_upstream("sedance", SEDANCE_REQUEST_SECONDS):
+            response = await get_sedance_client().post(
+                SEDANCE_API_URL,
+                headers=headers,
+                json=payload
+            )
+            response.raise_for_status()
+        return response
+
     try:
-        response = requests.post(
-            SEDANCE_API_URL,
-            headers=headers,
-            json=payload,
-            timeout=SEDANCE_TIMEOUT_SECONDS
-        )
-        response.raise_for_status()
-    except requests.exceptions.Timeout:
+        response = await _call_upstream("sedance", sedance_breaker, attempt, _sedance_retryable, SEDANCE_TIMEOUT_SECONDS)
+    except CircuitOpenError as e:
+        raise HTTPException(status_code=503, detail=f"Seedance 接口暂时不可用，请{e.retry_in:.0f}秒后重试")
+    except httpx.TimeoutException:
         raise HTTPException(status_code=500, detail="Seedance 接口超时，请稍后重试")
-    except requests.exceptions.RequestException as e:
-        body = ""
-        if e.response is not None:
-            body = (e.response.text or "")[:200]
+    except httpx.HTTPStatusError as e:
+        body = (e.response.text or "")[:200]
         raise HTTPException(status_code=500, detail=f"Seedance 接口请求失败: {str(e)} {body}".strip())
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=500, detail=f"Seedance 接口请求失败: {str(e)}")
 
     try:
         return response.json()
     except ValueError:
+        UPSTREAM_ERRORS.labels("sedance", "invalid_response").inc()
         raise HTTPException(status_code=500, detail="Seedance 接口返回了非 JSON 数据")
 
-# 新增：根据场景自动生成语料库的函数（带缓存优化）
-def generate_corpus_by_scene(scene):
-    # 先检查缓存
-    cached = get_cached_corpus(scene)
-    if cached:
-        return cached
-    
-    prompt = f"""
-    请为{scene}创作场景生成一份专业的语料库，包含以下内容：
-    1. 该场景常用的爆款词汇和表达（10-15个）
-    2. 该场景常用的句式和开场白（5-8个）
-    3. 该场景的情绪调动技巧和互动话术（5-8个）
-    4. 该场景的行业术语和常用说法
-
-    请直接输出内容，不要任何多余的格式。
-    """
-    try:
-        content = call_deepseek_api(prompt)
-        # 缓存结果
-        set_cached_corpus(scene, content)
+# ====================== 语料库缓存（内存 LRU + SQLite 持久化 + 合并并发请求）======================
+DEFAULT_CORPUS_CONTENT = "口语化表达，情绪饱满"
+
+class SceneCorpusCache:
+    """场景语料库缓存：内存层有界 LRU，持久层为数据目录下的 SQLite 表，同一场景的并发未命中只请求一次上游"""
+
+    def __init__(self, store: SQLiteResultCache, memory_entries: int, ttl_seconds: int):
+        self.store = store
+        self.memory_entries = memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.memory: "OrderedDict[str, Any]" = OrderedDict()
+        self.inflight: Dict[str, asyncio.Task] = {}
+        self.memory_hits = 0
+        self.coalesced = 0
+
+    def _remember(self, key: str, content: str) -> None:
+        self.memory[key] = (content, datetime.now() + timedelta(seconds=self.ttl_seconds))
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_entries:
+            self.memory.popitem(last=False)
+
+    def peek(self, scene: str) -> Optional[str]:
+        key = _normalize_cache_text(scene)
+        entry = self.memory.get(key)
+        if not entry:
+            return None
+        content, expire_at = entry
+        if expire_at <= datetime.now():
+            self.memory.pop(key, None)
+            return None
+        self.memory.move_to_end(key)
+        self.memory_hits += 1
         return content
-    except:
+
+    async def get(self, scene: str) -> Optional[str]:
+        content = self.peek(scene)
+        if content is not None:
+            return content
+        key = _normalize_cache_text(scene)
+        content = await run_in_threadpool(self.store.get, key)
+        if content:
+            self._remember(key, content)
+        return content
+
+    async def _load(self, scene: str) -> str:
+        content = await self.get(scene)
+        if content:
+            return content
+        content = await _request_scene_corpus(scene)
+        if content:
+            key = _normalize_cache_text(scene)
+            self._remember(key, content)
+            await run_in_threadpool(self.store.set, key, content)
+        return content
+
+    def _start(self, scene: str) -> asyncio.Task:
+        key = _normalize_cache_text(scene)
+        task = self.inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+            return task
+        task = asyncio.create_task(self._load(scene))
+        self.inflight[key] = task
+        task.add_done_callback(lambda _: self.inflight.pop(key, None))
+        return task
+
+    async def get_or_generate(self, scene: str) -> str:
+        content = self.peek(scene)
+        if content is not None:
+            return content
+        return await asyncio.shield(self._start(scene))
+
+    def schedule(self, scene: str) -> None:
+        """后台预取，不阻塞当前请求"""
+        self._start(scene)
+
+    def stats(self) -> Dict[str, Any]:
+        return dict(
+            self.store.stats(),
+            memory_hits=self.memory_hits,
+            memory_entries=len(self.memory),
+            memory_max_entries=self.memory_entries,
+            coalesced=self.coalesced,
+            inflight=len(self.inflight)
+        )
+
+scene_corpus_cache = SceneCorpusCache(
+    SQLiteResultCache("corpus_cache", CORPUS_CACHE_TTL_SECONDS, CORPUS_CACHE_MAX_ENTRIES),
+    CORPUS_CACHE_MEMORY_ENTRIES,
+    CORPUS_CACHE_TTL_SECONDS
+)
+
+async def _request_scene_corpus(scene) -> str:
+    try:
+        return await call_deepseek_api(build_corpus_messages(scene), {"purpose": "corpus", "scene": scene})
+    except Exception:
         return ""
 
+# 根据场景自动生成语料库（带缓存，同一场景并发请求只调用一次 AI）
+async def generate_corpus_by_scene(scene):
+    return await scene_corpus_cache.get_or_generate(scene)
+
+# 生成文案时读取语料库：仅使用已缓存内容，未命中则后台预取，本次使用默认语料，不增加生成延迟
+async def _get_corpus_for_prompt(scene) -> str:
+    if not CORPUS_ENABLED:
+        return DEFAULT_CORPUS_CONTENT
+    content = await scene_corpus_cache.get(scene)
+    if content:
+        return content
+    scene_corpus_cache.schedule(scene)
+    return DEFAULT_CORPUS_CONTENT
+
+def _get_top_scenes(limit: int) -> List[str]:
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT scene FROM scripts GROUP BY scene ORDER BY COUNT(*) DESC LIMIT ?",
+            (limit,)
+        )
+        scenes = [row["scene"] for row in cursor.fetchall()]
+        cursor.close()
+        return scenes
+    finally:
+        conn.close()
+
+async def prewarm_corpus_cache() -> None:
+    scenes = await run_in_threadpool(_get_top_scenes, CORPUS_PREWARM_TOP_N)
+    await asyncio.gather(*(generate_corpus_by_scene(scene) for scene in scenes), return_exceptions=True)
+
+# ====================== 脚本结构化解析 ======================
+# 兼容模型常见的格式偏差：Markdown 加粗/列表符号、全角数字与冒号（\d 可匹配全角数字）、"镜头 1" 中间带空格
+SCRIPT_LINE_PATTERN = re.compile(r"^(标题|镜头\s*(\d+)|台词\s*(\d+)|配乐建议|配乐)\s*[:：]\s*(.*)$")
+SCRIPT_LINE_MARKERS = " \t*#>-•·"
+
+def _match_script_line(line: str) -> Optional[Dict[str, Any]]:
+    cleaned = line.replace("**", "").strip(SCRIPT_LINE_MARKERS)
+    match = SCRIPT_LINE_PATTERN.match(cleaned)
+    if not match:
+        return None
+    label, shot_no, line_no, text = match.groups()
+    text = text.strip()
+    if shot_no:
+        return {"kind": "shot", "index": int(shot_no), "text": text}
+    if line_no:
+        return {"kind": "line", "index": int(line_no), "text": text}
+    return {"kind": "title" if label == "标题" else "music", "text": text}
+
+def _extract_script_title(content: Optional[str]) -> str:
+    for line in (content or "").splitlines():
+        item = _match_script_line(line)
+        if item and item["kind"] == "title":
+            return item["text"][:200]
+    return ""
+
+def _parse_script_content(content: Optional[str]) -> Dict[str, Any]:
+    """
+    将模型输出解析为结构化脚本：
+    {"title", "shots": [{"index", "shot", "line"}], "music", "notes", "warnings"}
+    无标签的续行追加到上一字段，无法归属的文本放入 notes，格式问题记录在 warnings
+    """
+    title = ""
+    music = ""
+    notes: List[str] = []
+    warnings: List[str] = []
+    shots: Dict[int, Dict[str, Any]] = {}
+    current: Optional[tuple] = None  # 续行归属的字段
+
+    for raw_line in (content or "").splitlines():
+        if not raw_line.strip():
+            current = None
+            continue
+        item = _match_script_line(raw_line)
+        if item is None:
+            text = raw_line.strip()
+            if current is None:
+                notes.append(text)
+            elif current[0] == "title":
+                title = f"{title}\n{text}" if title else text
+            elif current[0] == "music":
+                music = f"{music}\n{text}" if music else text
+            else:
+                shot = shots[current[1]]
+                shot[current[0]] = f"{shot[current[0]]}\n{text}" if shot[current[0]] else text
+            continue
+
+        kind = item["kind"]
+        if kind == "title":
+            if title:
+                warnings.append("重复的标题，已保留第一个")
+                current = None
+                continue
+            title = item["text"]
+            current = ("title",)
+        elif kind == "music":
+            music = f"{music}\n{item['text']}" if music else item["text"]
+            current = ("music",)
+        else:
+            field = "shot" if kind == "shot" else "line"
+            shot = shots.setdefault(item["index"], {"index": item["index"], "shot": "", "line": ""})
+            if shot[field]:
+                warnings.append(f"{'镜头' if field == 'shot' else '台词'}{item['index']}重复出现，已合并")
+                shot[field] = f"{shot[field]}\n{item['text']}"
+            else:
+                shot[field] = item["text"]
+            current = (field, item["index"])
+
+    ordered_shots = [shots[index] for index in sorted(shots)]
+    if not title:
+        warnings.append("缺少标题")
+    if not ordered_shots:
+        warnings.append("未解析到镜头")
+    for shot in ordered_shots:
+        if not shot["shot"]:
+            warnings.append(f"台词{shot['index']}缺少对应镜头")
+        if not shot["line"]:
+            warnings.append(f"镜头{shot['index']}缺少台词")
+    expected = list(range(1, len(ordered_shots) + 1))
+    if ordered_shots and [shot["index"] for shot in ordered_shots] != expected:
+        warnings.append("镜头编号不连续")
+
+    return {
+        "title": title,
+        "shots": ordered_shots,
+        "music": music,
+        "notes": notes,
+        "warnings": warnings
+    }
+
+def _parse_schemes_structured(schemes: List[str]) -> List[Dict[str, Any]]:
+    return [_parse_script_content(scheme) for scheme in schemes]
+
 # ------------------- 核心接口：生成文案/脚本 -------------------
-@app.post("/api/script/create", response_model=dict)
-def create_script(req: CreateScriptRequest):
-    # 跳过语料库生成，直接使用简化提示
-    corpus_content = "口语化表达，情绪饱满"
-    
-    # 2. 按时长匹配镜头数量
-    duration_map = {
-        "15秒": 3,
-        "30秒": 6,
-        "60秒": 12
+def _script_row(script_id: str, req: CreateScriptRequest, schemes: list, create_time: str, structured: Optional[list] = None) -> tuple:
+    if structured is None:
+        structured = _parse_schemes_structured(schemes)
+    title = structured[0]["title"][:200] if structured else ""
+    return (script_id, req.user_id, req.scene, req.key_info, req.style, req.duration, title, schemes, structured, create_time, create_time)
+
+# 多条记录在同一事务内写入
+def _save_script_records(rows: List[tuple]) -> None:
+    if not rows:
+        return
+    conn = get_db_conn()
+    cursor = conn.cursor()
+    records = []
+    for script_id, user_id, scene, key_info, style, duration, title, schemes, structured, create_time, update_time in rows:
+        content = schemes[0] if schemes else ""
+        # 单方案时正文与结构化结果只在 text_blobs 中存一份，schemes/structured 列留空
+        single = len(schemes) <= 1
+        content_hash = _store_text_blob(cursor, content, structured[0] if single and structured else None)
+        records.append((
+            script_id, user_id, scene, key_info, style, duration, title, "", content_hash,
+            None if single else json.dumps(schemes, ensure_ascii=False),
+            None if single else json.dumps(structured, ensure_ascii=False),
+            create_time, update_time
+        ))
+    cursor.executemany(
+        "INSERT INTO scripts (id, user_id, scene, key_info, style, duration, title, content, content_hash, schemes, structured, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        records
+    )
+    conn.commit()
+    cursor.close()
+    conn.close()
+
+def _save_script_record(script_id: str, req: CreateScriptRequest, schemes: list, create_time: str, structured: Optional[list] = None) -> None:
+    _save_script_records([_script_row(script_id, req, schemes, create_time, structured)])
+
+# 构造脚本生成提示词（普通接口与流式接口共用）：固定规则在 system 中，请求相关内容放在最后，便于命中上下文缓存
+def _build_script_prompt(req: CreateScriptRequest, corpus_content: str = DEFAULT_CORPUS_CONTENT) -> List[Dict[str, str]]:
+    return build_script_messages(req.scene, req.style, req.duration, req.key_info, corpus_content)
+
+def _script_usage_tags(req: CreateScriptRequest, script_id: str, purpose: str = "script") -> Dict[str, Any]:
+    return {"purpose": purpose, "user_id": req.user_id, "script_id": script_id, "scene": req.scene}
+
+# ====================== 输出长度控制（按镜头数估算 max_tokens，截断后只续写缺失镜头）======================
+script_token_estimator = ShotTokenEstimator(SCRIPT_TOKENS_PER_SHOT, margin=SCRIPT_TOKEN_BUDGET_MARGIN, max_tokens=SCRIPT_MAX_TOKENS_CAP)
+SCRIPT_CONTINUATIONS = metrics_registry.counter("script_continuations_total", "脚本输出被 max_tokens 截断后续写的次数", ("mode",))
+
+def _split_complete_shots(content: str) -> tuple:
+    """
+    截断的输出保留到最后一个完整的台词行（最后一行可能只写了一半，不计入），返回 (保留文本, 已完成镜头数)；
+    还没有完整台词时保留标题行
+    """
+    lines = content.split("\n")[:-1]
+    keep_until, completed = 0, 0
+    for n, line in enumerate(lines, 1):
+        item = _match_script_line(line)
+        if not item:
+            continue
+        if item["kind"] == "line":
+            keep_until, completed = n, max(completed, item["index"])
+        elif item["kind"] == "title" and completed == 0:
+            keep_until = n
+    return "\n".join(lines[:keep_until]).rstrip(), completed
+
+def _observe_script_tokens(finish_reason: Optional[str], usage: Optional[Dict[str, Any]], shot_count: int,
+                           content: str = "") -> None:
+    # 一次写完的结果校正每镜头 token 数；被截断的结果只是下界，按已完成的镜头数把估值往上推（续写结果不参与）
+    if not usage:
+        return
+    completion_tokens = int(usage.get("completion_tokens") or 0)
+    if finish_reason == "stop":
+        script_token_estimator.observe(completion_tokens, shot_count)
+    elif finish_reason == "length":
+        script_token_estimator.observe_truncated(completion_tokens, _split_complete_shots(content)[1])
+
+SCRIPT_TRUNCATED_MSG = "生成成功（输出超出长度上限，续写后仍不完整，建议重新生成）"
+
+def _join_continuation(partial: str, continuation: str) -> str:
+    return f"{partial}\n\n{continuation.lstrip()}" if partial else continuation
+
+async def _generate_script_text(req: CreateScriptRequest, prompt: List[Dict[str, str]], script_id: str) -> tuple:
+    """返回 (脚本文本, 是否仍被截断)：续写轮数用完后最后一轮仍是 length 时文本不完整"""
+    shot_count = shot_count_for(req.duration)
+    result = await call_deepseek_chat(prompt, _script_usage_tags(req, script_id), script_token_estimator.max_tokens(shot_count))
+    content = result["content"]
+    _observe_script_tokens(result["finish_reason"], result["usage"], shot_count, content)
+    finish_reason = result["finish_reason"]
+    rounds = 0
+    while finish_reason == "length" and rounds < SCRIPT_CONTINUATION_MAX_ROUNDS:
+        partial, completed = _split_complete_shots(content)
+        SCRIPT_CONTINUATIONS.labels("chat").inc()
+        result = await call_deepseek_chat(
+            build_continuation_messages(prompt, partial, completed + 1, shot_count),
+            _script_usage_tags(req, script_id, "continuation"),
+            script_token_estimator.max_tokens(shot_count - completed)
+        )
+        content = _join_continuation(partial, result["content"])
+        finish_reason = result["finish_reason"]
+        rounds += 1
+    return content, finish_reason == "length"
+
+def _script_cache_key(req: CreateScriptRequest) -> str:
+    normalized = {
+        "scene": _normalize_cache_text(req.scene),
+        "style": _normalize_cache_text(req.style),
+        "duration": _normalize_cache_text(req.duration),
+        "key_info": _normalize_cache_text(req.key_info)
     }
-    shot_count = duration_map.get(req.duration, 5)
-    
-    # 3. 风格提示词细化
-    style_prompt = {
-        "口语化": "语言极度口语化，像和朋友聊天，多用网络热词、语气词（比如：哇、绝了、家人们），节奏快",
-        "专业化": "语言专业、严谨，突出产品卖点和数据，适合品牌官方账号，避免口语化表达",
-        "搞笑风": "台词幽默搞笑，镜头有反差感、夸张动作，多用梗和段子，让用户笑出声",
-        "煽情风": "语言温暖、有感染力，能触动情绪，镜头慢节奏，背景音乐舒缓，适合情感类内容"
-    }.get(req.style, "语言口语化，有感染力，适合短视频拍摄")
-    
-    # 4. 构造AI提示词（生成1种高质量方案）
-    prompt = f"""
-    你是专业的{req.scene}短视频脚本创作师，请生成1种高质量的{req.duration}短视频文案方案。
-    严格遵守以下所有规则，一条都不能违反：
-
-    1. 必须包含核心信息：{req.key_info}
-    2. 参考该场景的专业语料库：{corpus_content}
-    3. 时长要求：严格控制在{req.duration}，镜头数量为{shot_count}个，每个镜头台词长度匹配时长,字数尽量多
-    4. 严禁使用广告违禁词：最、第一、顶级、绝对、全网第一、永久等。
-    5. 输出格式：
-
-    标题: 这里写视频标题，一定要足够吸睛
-    {"".join([f"镜头{i}: 镜头内容描述\n台词{i}: 台词内容（必须是博主说的话，不能空）\n\n" for i in range(1, shot_count+1)])}
-    配乐建议: 统一的背景音乐风格描述（整个视频使用同一首音乐）
-
-    要求：
-    - 使用{style_prompt}风格
-    - 镜头、台词的编号必须一一对应
-    - 每一行只写一项，不要把多个内容写在同一行
-    - 不要任何多余格式、表格、横线、星号、加粗符号
-    - 台词必须是口语化的句子，不能省略
-    - 配乐建议只在方案的最后统一输出一次
-    - 充分利用参考语料库中的爆款词汇和表达，让文案更符合该场景的特点
-    - 确保文案质量高，有吸引力，能够有效传达核心信息
+    raw = json.dumps(normalized, ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+async def _get_cached_script(req: CreateScriptRequest) -> Optional[str]:
+    if not SCRIPT_CACHE_ENABLED or req.bypass_cache:
+        return None
+    return await run_in_threadpool(script_result_cache.get, _script_cache_key(req))
+
+async def _store_cached_script(req: CreateScriptRequest, content: str) -> None:
+    if SCRIPT_CACHE_ENABLED and content:
+        await run_in_threadpool(script_result_cache.set, _script_cache_key(req), content)
+
+# ------------------- 近似请求复用（MinHash/LSH） -------------------
+class SimilarScriptMatcher:
     """
-    
-    # 5. 调用AI生成内容
-    script_content = call_deepseek_api(prompt)
+    从 scripts 表增量构建 LSH 索引，候选再用原文 Jaccard 相似度复核。
+    默认只在同一用户的脚本中查找；shared_across_users 时跨用户复用，但不返回其他用户的脚本 ID 与核心信息
+    """
+
+    def __init__(self, threshold: float, bands: int, rows: int, shared_across_users: bool = False):
+        self.threshold = threshold
+        self.shared_across_users = shared_across_users
+        self.index = MinHashLSHIndex(bands=bands, rows=rows)
+        self.last_rowid = 0
+        self.hits = 0
+        self.misses = 0
+        self._sync_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+
+    def group_key(self, user_id: Optional[str], scene: Optional[str], style: Optional[str], duration: Optional[str]) -> str:
+        owner = "" if self.shared_across_users else (user_id or "")
+        return "\x1f".join([owner] + [_normalize_cache_text(value) for value in (scene, style, duration)])
+
+    def sync(self, batch_size: int = 5000) -> int:
+        """把 rowid 大于上次位置的新脚本加入索引，返回新增条数"""
+        added = 0
+        with self._sync_lock:
+            conn = get_db_conn()
+            try:
+                cursor = conn.cursor()
+                while True:
+                    cursor.execute(
+                        "SELECT rowid, user_id, scene, style, duration, key_info FROM scripts WHERE rowid > ? ORDER BY rowid LIMIT ?",
+                        (self.last_rowid, batch_size)
+                    )
+                    rows = cursor.fetchall()
+                    if not rows:
+                        break
+                    added += self.index.add_many(
+                        (row[0], self.group_key(row["user_id"], row["scene"], row["style"], row["duration"]), shingles(row["key_info"]))
+                        for row in rows
+                    )
+                    self.last_rowid = rows[-1][0]
+                cursor.close()
+            finally:
+                conn.close()
+        return added
+
+    def find(self, req: CreateScriptRequest) -> Optional[Dict[str, Any]]:
+        self.sync()
+        group = self.group_key(req.user_id, req.scene, req.style, req.duration)
+        query_shingles = shingles(req.key_info)
+        candidates = self.index.query(group, query_shingles)
+
+        best = None
+        if candidates:
+            conn = get_db_conn()
+            try:
+                cursor = conn.cursor()
+                placeholders = ", ".join("?" for _ in candidates)
+                cursor.execute(
+                    f"""
+                    SELECT s.id, s.user_id, s.scene, s.style, s.duration, s.key_info, COALESCE(b.body, s.content) AS content, s.create_time
+                    FROM scripts s{BLOB_JOIN} WHERE s.rowid IN ({placeholders})
+                    """,
+                    candidates
+                )
+                rows = cursor.fetchall()
+                cursor.close()
+            finally:
+                conn.close()
+
+            best_score = 0.0
+            for row in rows:
+                if not row["content"] or self.group_key(row["user_id"], row["scene"], row["style"], row["duration"]) != group:
+                    continue
+                score = shingle_jaccard(query_shingles, shingles(row["key_info"]))
+                if score > best_score or (score == best_score and best is not None and row["create_time"] > best["create_time"]):
+                    best_score = score
+                    own = row["user_id"] == req.user_id
+                    best = {
+                        "script_id": row["id"] if own else None,
+                        "key_info": row["key_info"] if own else None,
+                        "content": row["content"],
+                        "create_time": row["create_time"],
+                        "similarity": round(score, 4)
+                    }
+            if best_score < self.threshold:
+                best = None
+
+        with self._stats_lock:
+            if best:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return best
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+            "threshold": self.threshold,
+            "shared_across_users": self.shared_across_users,
+            "indexed": len(self.index),
+            "pending_merge": self.index.pending,
+            "index_bytes": self.index.memory_bytes()
+        }
+
+similar_script_matcher = SimilarScriptMatcher(SCRIPT_SIMILAR_THRESHOLD, SCRIPT_SIMILAR_BANDS, SCRIPT_SIMILAR_ROWS,
+                                              SCRIPT_SIMILAR_SHARED_ACROSS_USERS)
+
+async def _get_reusable_script(req: CreateScriptRequest) -> Optional[str]:
+    """先查精确缓存，reuse 模式下再查近似请求"""
+    script_content = await _get_cached_script(req)
+    if script_content is not None:
+        return script_content
+    if SCRIPT_SIMILAR_ENABLED and SCRIPT_SIMILAR_MODE == "reuse" and not req.bypass_cache:
+        similar = await run_in_threadpool(similar_script_matcher.find, req)
+        if similar:
+            return similar["content"]
+    return None
+
+# 生成单条脚本内容（命中缓存或近似请求时直接复用），返回 (内容, 是否复用, 是否不完整)；不完整的内容不写入结果缓存
+async def _generate_script_content(req: CreateScriptRequest, script_id: str) -> tuple:
+    script_content = await _get_reusable_script(req)
+    if script_content is not None:
+        return script_content, True, False
+
+    corpus_content = await _get_corpus_for_prompt(req.scene)
+    prompt = _build_script_prompt(req, corpus_content)
+    script_content, truncated = await _generate_script_text(req, prompt, script_id)
+    if not truncated:
+        await _store_cached_script(req, script_content)
+    return script_content, False, truncated
+
+@app.post("/api/script/create", response_model=dict)
+async def create_script(req: CreateScriptRequest):
+    # 5. 调用AI生成内容（命中缓存时直接复用）；先分配脚本 ID，用量记录可关联到脚本
+    script_id = f"script_{uuid.uuid4().hex[:8]}"
+    script_content, from_cache, truncated = await _generate_script_content(req, script_id)
     
     # 6. 直接使用生成的内容作为单个方案
     schemes = [script_content]
     
-    # 7. 保存到数据库（保存所有方案）
-    script_id = f"script_{uuid.uuid4().hex[:8]}"
+    structured = _parse_schemes_structured(schemes)
+    
+    # 7. 保存到数据库（保存所有方案及其结构化结果）
     create_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    import json
-    conn = get_db_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        "INSERT INTO scripts (id, user_id, scene, key_info, style, duration, content, schemes, create_time, update_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (script_id, req.user_id, req.scene, req.key_info, req.style, req.duration, schemes[0] if schemes else "", json.dumps(schemes, ensure_ascii=False), create_time, create_time)
-    )
-    conn.commit()
-    cursor.close()
-    conn.close()
+    # SQLite 写入是阻塞调用，放到线程池执行，避免卡住事件循环
+    await run_in_threadpool(_save_script_record, script_id, req, schemes, create_time, structured)
     
     # 8. 返回结果
     return {
         "code": 200,
-        "msg": "生成成功",
+        "msg": SCRIPT_TRUNCATED_MSG if truncated else "生成成功",
         "data": {
             "script_id": script_id,
             "style": req.style,
             "duration": req.duration,
             "schemes": schemes,
-            "create_time": create_time
+            "structured": structured,
+            "create_time": create_time,
+            "cached": from_cache,
+            "truncated": truncated
         }
     }
 
+# ------------------- 近似请求查询：生成前提示可复用的已有脚本 -------------------
+@app.post("/api/script/similar", response_model=dict)
+async def find_similar_script(req: CreateScriptRequest):
+    if not SCRIPT_SIMILAR_ENABLED:
+        return {"code": 200, "msg": "未开启近似复用", "data": None}
+    similar = await run_in_threadpool(similar_script_matcher.find, req)
+    return {"code": 200, "msg": "获取成功", "data": similar}
+
+# ------------------- 流式接口：边生成边推送镜头（SSE） -------------------
+class ScriptStreamParser:
+    """按行增量解析模型输出，镜头N/台词N 成对完整后立即产出事件"""
+
+    def __init__(self):
+        self.buffer = ""
+        self.pending_shots: Dict[int, str] = {}
+
+    def discard_partial(self) -> None:
+        """输出被截断、准备续写时丢弃未完成的行与尚未配对的镜头，续写内容会重新给出"""
+        self.buffer = ""
+        self.pending_shots.clear()
+
+    def feed(self, delta: str) -> List[Dict[str, Any]]:
+        self.buffer += delta
+        events = []
+        while "\n" in self.buffer:
+            line, self.buffer = self.buffer.split("\n", 1)
+            events.extend(self._handle_line(line))
+        return events
+
+    def finish(self) -> List[Dict[str, Any]]:
+        line, self.buffer = self.buffer, ""
+        return self._handle_line(line)
+
+    def _handle_line(self, line: str) -> List[Dict[str, Any]]:
+        item = _match_script_line(line)
+        if not item:
+            return []
+        if item["kind"] == "shot":
+            self.pending_shots[item["index"]] = item["text"]
+            return []
+        if item["kind"] == "line":
+            return [{
+                "event": "shot",
+                "data": {
+                    "index": item["index"],
+                    "shot": self.pending_shots.pop(item["index"], ""),
+                    "line": item["text"]
+                }
+            }]
+        return [{"event": item["kind"], "data": {"text": item["text"]}}]
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/script/create/stream")
+async def create_script_stream(req: CreateScriptRequest):
+    corpus_content = await _get_corpus_for_prompt(req.scene)
+    prompt = _build_script_prompt(req, corpus_content)
+    script_id = f"script_{uuid.uuid4().hex[:8]}"
+
+    async def event_stream() -> AsyncIterator[str]:
+        parser = ScriptStreamParser()
+        chunks = []
+        try:
+            cached_content = await _get_reusable_script(req)
+            from_cache = cached_content is not None
+            truncated = False
+            if from_cache:
+                chunks.append(cached_content)
+                for item in parser.feed(cached_content):
+                    yield _sse_event(item["event"], item["data"])
+            else:
+                shot_count = shot_count_for(req.duration)
+                outcome: Dict[str, Any] = {}
+                async for delta in stream_deepseek_api(prompt, _script_usage_tags(req, script_id, "stream"),
+                                                       script_token_estimator.max_tokens(shot_count), outcome):
+                    chunks.append(delta)
+                    for item in parser.feed(delta):
+                        yield _sse_event(item["event"], item["data"])
+                _observe_script_tokens(outcome.get("finish_reason"), outcome.get("usage"), shot_count, "".join(chunks))
+
+                # 被 max_tokens 截断：已推送的完整镜头保留，只续写缺失的镜头，续写内容接着推送
+                rounds = 0
+                while outcome.get("finish_reason") == "length" and rounds < SCRIPT_CONTINUATION_MAX_ROUNDS:
+                    partial, completed = _split_complete_shots("".join(chunks))
+                    SCRIPT_CONTINUATIONS.labels("stream").inc()
+                    parser.discard_partial()
+                    chunks = [partial + "\n\n"] if partial else []
+                    outcome = {}
+                    continuation = build_continuation_messages(prompt, partial, completed + 1, shot_count)
+                    async for delta in stream_deepseek_api(continuation, _script_usage_tags(req, script_id, "continuation"),
+                                                           script_token_estimator.max_tokens(shot_count - completed), outcome):
+                        chunks.append(delta)
+                        for item in parser.feed(delta):
+                            yield _sse_event(item["event"], item["data"])
+                    rounds += 1
+                truncated = outcome.get("finish_reason") == "length"
+            for item in parser.finish():
+                yield _sse_event(item["event"], item["data"])
+
+            script_content = "".join(chunks).strip()
+            if not script_content:
+                raise HTTPException(status_code=500, detail="AI生成失败：返回内容为空")
+            if truncated:
+                yield _sse_event("warning", {"code": 200, "msg": SCRIPT_TRUNCATED_MSG})
+            elif not from_cache:
+                await _store_cached_script(req, script_content)
+
+            # 流结束后再落库，保证保存的是完整文本
+            schemes = [script_content]
+            structured = _parse_schemes_structured(schemes)
+            create_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            await run_in_threadpool(_save_script_record, script_id, req, schemes, create_time, structured)
+            yield _sse_event("done", {
+                "script_id": script_id,
+                "style": req.style,
+                "duration": req.duration,
+                "schemes": schemes,
+                "structured": structured,
+                "create_time": create_time,
+                "cached": from_cache,
+                "truncated": truncated
+            })
+        except HTTPException as e:
+            yield _sse_event("error", {"code": e.status_code, "msg": e.detail})
+        except Exception as e:
+            yield _sse_event("error", {"code": 500, "msg": f"生成失败: {str(e)}"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ------------------- 批量生成接口：受控并发 + 逐条推送结果（SSE） -------------------
+@app.post("/api/script/batch")
+async def create_scripts_batch(req: BatchCreateScriptRequest):
+    if not req.items:
+        return {"code": 400, "msg": "参数不全"}
+    if len(req.items) > SCRIPT_BATCH_MAX_ITEMS:
+        return {"code": 400, "msg": f"单次最多提交 {SCRIPT_BATCH_MAX_ITEMS} 条"}
+
+    semaphore = asyncio.Semaphore(max(SCRIPT_BATCH_CONCURRENCY, 1))
+
+    async def generate_item(index: int, item: CreateScriptRequest) -> Dict[str, Any]:
+        script_id = f"script_{uuid.uuid4().hex[:8]}"
+        async with semaphore:
+            try:
+                script_content, from_cache, truncated = await _generate_script_content(item, script_id)
+            except HTTPException as e:
+                return {"index": index, "code": e.status_code, "msg": e.detail}
+            except Exception as e:
+                return {"index": index, "code": 500, "msg": f"生成失败: {str(e)}"}
+        return {
+            "index": index,
+            "code": 200,
+            "msg": SCRIPT_TRUNCATED_MSG if truncated else "生成成功",
+            "script_id": script_id,
+            "style": item.style,
+            "duration": item.duration,
+            "schemes": [script_content],
+            "structured": _parse_schemes_structured([script_content]),
+            "create_time": _now_str(),
+            "cached": from_cache,
+            "truncated": truncated
+        }
+
+    async def event_stream() -> AsyncIterator[str]:
+        tasks = [asyncio.create_task(generate_item(i, item)) for i, item in enumerate(req.items)]
+        succeeded = 0
+        failed = 0
+        try:
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                results = [task.result() for task in done]
+                # 分组提交：同一时刻完成的条目（含上一次写库期间陆续完成的）合并为一个事务写入，
+                # 写入成功后再推送，客户端拿到的 script_id 一定能查到，中途断开或取消也不会丢失已完成的脚本
+                rows = [
+                    _script_row(result["script_id"], req.items[result["index"]], result["schemes"], result["create_time"], result["structured"])
+                    for result in results if result["code"] == 200
+                ]
+                if rows:
+                    try:
+                        await run_in_threadpool(_save_script_records, rows)
+                    except Exception as e:
+                        results = [
+                            {"index": result["index"], "code": 500, "msg": f"保存失败: {str(e)}"} if result["code"] == 200 else result
+                            for result in results
+                        ]
+                for result in results:
+                    if result["code"] == 200:
+                        succeeded += 1
+                    else:
+                        failed += 1
+                    yield _sse_event("item", result)
+
+            yield _sse_event("done", {"total": len(tasks), "succeeded": succeeded, "failed": failed})
+        except Exception as e:
+            yield _sse_event("error", {"code": 500, "msg": f"批量生成失败: {str(e)}"})
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# ------------------- 游标分页工具 -------------------
+MAX_PAGE_SIZE = 100
+
+def _encode_cursor(create_time: str, record_id: str) -> str:
+    raw = json.dumps([create_time, record_id], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str) -> tuple:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        create_time, record_id = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return str(create_time), str(record_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+def _fetch_page(table: str, fields: List[str], user_id: str, limit: int, cursor: Optional[str], include_archive: bool = False) -> tuple:
+    """按 (create_time, id) 倒序取一页，多取一条用于判断是否还有下一页；include_archive 时合并归档库中的同序记录"""
+    page_size = max(1, min(limit, MAX_PAGE_SIZE))
+    position = _decode_cursor(cursor) if cursor else None
+    columns, join = _select_columns(fields)
+    sql = f"SELECT {columns} FROM {table} s{join} WHERE s.user_id = ?"
+    params: list = [user_id]
+    if position:
+        sql += " AND (s.create_time, s.id) < (?, ?)"
+        params.extend(position)
+    sql += " ORDER BY s.create_time DESC, s.id DESC LIMIT ?"
+    params.append(page_size + 1)
+
+    conn = get_db_conn()
+    try:
+        db_cursor = conn.cursor()
+        db_cursor.execute(sql, params)
+        rows = db_cursor.fetchall()
+        if include_archive and ARCHIVE_ATTACHED:
+            rows = _merge_archived_rows(db_cursor, rows, fields, user_id, page_size + 1, position)
+        db_cursor.close()
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = _encode_cursor(rows[-1]["create_time"], rows[-1]["id"])
+    return rows, next_cursor
+
+# ------------------- 列表字段裁剪 / ETag / 压缩 -------------------
+SUMMARY_FIELDS = ["id", "title", "scene", "create_time"]
+SCRIPT_FIELDS = ["id", "title", "scene", "key_info", "style", "duration", "content", "schemes", "structured", "create_time"]
+FAVORITE_FIELDS = ["id", "title", "scene", "style", "duration", "key_info", "content", "scheme_index", "scheme_name", "create_time"]
+
+def _resolve_fields(fields: Optional[str], allowed: List[str]) -> List[str]:
+    """fields 为空或 full 返回全部字段，summary 返回摘要字段，也可逗号分隔指定字段"""
+    if not fields or fields == "full":
+        return list(allowed)
+    if fields == "summary":
+        return list(SUMMARY_FIELDS)
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"不支持的字段: {','.join(unknown)}")
+    # 游标分页依赖 id 与 create_time
+    return [field for field in allowed if field in requested or field in ("id", "create_time")]
+
+def _json_response(request: Request, payload: Dict[str, Any]) -> Response:
+    body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    etag = f'W/"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+
+    if_none_match = request.headers.get("if-none-match", "")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+
+    accept_encoding = request.headers.get("accept-encoding", "")
+    if len(body) >= RESPONSE_COMPRESS_MIN_BYTES:
+        if brotli is not None and "br" in accept_encoding:
+            body = brotli.compress(body, quality=5)
+            headers["Content-Encoding"] = "br"
+        elif "gzip" in accept_encoding:
+            body = gzip.compress(body, compresslevel=6)
+            headers["Content-Encoding"] = "gzip"
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def _parse_schemes(record: Dict[str, Any]) -> List[str]:
+    schemes = _load_json_list(record.get('schemes'))
+    if schemes:
+        return schemes
+    return [record.get('content', '')]
+
+def _parse_structured(record: Dict[str, Any]) -> List[Dict[str, Any]]:
+    # 多方案旧记录存在 scripts.structured，单方案的结构化结果随正文存放
+    structured = _load_json_list(record.get('structured'))
+    if structured:
+        return structured
+    try:
+        blob_structured = record.get('blob_structured')
+        if blob_structured:
+            return [json.loads(blob_structured)]
+    except ValueError:
+        pass
+    # 尚未回填的旧记录即时解析
+    return _parse_schemes_structured(_parse_schemes(record))
+
+def _script_record(row: sqlite3.Row, output_fields: List[str]) -> Dict[str, Any]:
+    record = dict(row)
+    if "structured" in output_fields:
+        record["structured"] = _parse_structured(record)
+    if "schemes" in output_fields:
+        record["schemes"] = _parse_schemes(record)
+    return {field: record.get(field) for field in output_fields}
+
+def _script_select_fields(output_fields: List[str]) -> List[str]:
+    # schemes/structured 需要时回退到 content/schemes，一并读取
+    select_fields = list(output_fields)
+    if "structured" in select_fields and "schemes" not in select_fields:
+        select_fields.append("schemes")
+    if ("schemes" in select_fields or "structured" in select_fields) and "content" not in select_fields:
+        select_fields.append("content")
+    return select_fields
+
+def _history_payload(user_id: str, limit: int = 20, cursor: Optional[str] = None, fields: Optional[str] = None) -> Dict[str, Any]:
+    output_fields = _resolve_fields(fields, SCRIPT_FIELDS)
+    rows, next_cursor = _fetch_page("scripts", _script_select_fields(output_fields), user_id, limit, cursor, include_archive=True)
+
+    return {
+        "code": 200,
+        "msg": "获取成功",
+        "data": [_script_record(row, output_fields) for row in rows],
+        "next_cursor": next_cursor
+    }
+
+def _backfill_script_fields(batch_size: int = 1000) -> int:
+    """
+    旧库升级后补齐正文存储、标题与结构化脚本：按 rowid 分批推进并逐批提交，避免长时间持有写锁。
+    结构化结果按正文解析，相同正文只解析一次
+    """
+    updated = 0
+    conn = get_db_conn()
+    try:
+        updated += _migrate_text_blobs(conn, batch_size)
+        cursor = conn.cursor()
+
+        last_rowid = 0
+        while True:
+            cursor.execute(
+                "SELECT rowid, body FROM text_blobs WHERE rowid > ? AND structured IS NULL ORDER BY rowid LIMIT ?",
+                (last_rowid, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "UPDATE text_blobs SET structured = ? WHERE rowid = ?",
+                [(json.dumps(_parse_script_content(row[1]), ensure_ascii=False), row[0]) for row in rows]
+            )
+            conn.commit()
+            updated += len(rows)
+            last_rowid = rows[-1][0]
+
+        last_rowid = 0
+        while True:
+            cursor.execute(
+                f"""
+                SELECT s.rowid, COALESCE(b.body, s.content) AS content, s.schemes, s.structured FROM scripts s{BLOB_JOIN}
+                WHERE s.rowid > ? AND (s.title IS NULL OR (s.schemes IS NOT NULL AND s.structured IS NULL))
+                ORDER BY s.rowid LIMIT ?
+                """,
+                (last_rowid, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            updates = []
+            for row in rows:
+                record = dict(row)
+                structured = _parse_structured(record)
+                title = structured[0]["title"][:200] if structured else ""
+                extra_structured = json.dumps(structured, ensure_ascii=False) if record["schemes"] else None
+                updates.append((title, extra_structured, row[0]))
+            cursor.executemany("UPDATE scripts SET title = ?, structured = ? WHERE rowid = ?", updates)
+            conn.commit()
+            updated += len(updates)
+            last_rowid = rows[-1][0]
+
+        last_rowid = 0
+        while True:
+            cursor.execute(
+                f"""
+                SELECT s.rowid, COALESCE(b.body, s.content) AS content FROM favorites s{BLOB_JOIN}
+                WHERE s.rowid > ? AND s.title IS NULL ORDER BY s.rowid LIMIT ?
+                """,
+                (last_rowid, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            cursor.executemany(
+                "UPDATE favorites SET title = ? WHERE rowid = ?",
+                [(_extract_script_title(row[1]), row[0]) for row in rows]
+            )
+            conn.commit()
+            updated += len(rows)
+            last_rowid = rows[-1][0]
+        cursor.close()
+    finally:
+        conn.close()
+    return updated
+
+# ------------------- 冷数据归档：旧脚本压缩后移入归档库 -------------------
+# 超过 SCRIPT_ARCHIVE_AFTER_DAYS 天的脚本整行移入归档库（ATTACH 为 archive），列表所需的短字段明文存放，
+# 正文/方案/结构化结果压缩为一个 payload；历史分页和详情接口透明读取，全文搜索只覆盖未归档的脚本
+ARCHIVE_PLAIN_FIELDS = ["id", "user_id", "scene", "style", "duration", "key_info", "title", "create_time", "update_time"]
+ARCHIVE_PAYLOAD_FIELDS = ("content", "schemes", "structured")
+
+if SCRIPT_ARCHIVE_CODEC not in ("zlib", "zstd") or (SCRIPT_ARCHIVE_CODEC == "zstd" and zstandard is None):
+    print(f"归档压缩方式 {SCRIPT_ARCHIVE_CODEC} 不可用（zstd 需安装 zstandard），改用 zlib")
+    SCRIPT_ARCHIVE_CODEC = "zlib"
+
+def _compress_payload(data: Dict[str, Any]) -> tuple:
+    """返回 (codec, 压缩数据, 原始字节数)"""
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if SCRIPT_ARCHIVE_CODEC == "zstd":
+        return "zstd", zstandard.ZstdCompressor(level=10).compress(raw), len(raw)
+    return "zlib", zlib.compress(raw, 9), len(raw)
+
+def _decompress_payload(codec: str, payload: bytes) -> Dict[str, Any]:
+    if codec == "zstd":
+        if zstandard is None:
+            raise HTTPException(status_code=500, detail="归档数据使用 zstd 压缩，请安装 zstandard")
+        raw = zstandard.ZstdDecompressor().decompress(payload)
+    else:
+        raw = zlib.decompress(payload)
+    return json.loads(raw)
+
+def _archive_columns(fields: List[str]) -> str:
+    columns = [field for field in fields if field in ARCHIVE_PLAIN_FIELDS]
+    # 只有需要正文时才读取并解压 payload，摘要列表不涉及解压
+    if any(field in ARCHIVE_PAYLOAD_FIELDS for field in fields):
+        columns.extend(["codec", "payload"])
+    return ", ".join(columns)
+
+def _inflate_archived_row(row: sqlite3.Row) -> Dict[str, Any]:
+    record = dict(row)
+    payload = record.pop("payload", None)
+    codec = record.pop("codec", None)
+    if payload is not None:
+        record.update(_decompress_payload(codec, payload))
+    return record
+
+def _merge_archived_rows(db_cursor: sqlite3.Cursor, rows: List[sqlite3.Row], fields: List[str], user_id: str,
+                         limit: int, position: Optional[tuple]) -> list:
+    """在同一游标位置之后再从归档库取 limit 条，与主库结果按 (create_time, id) 合并"""
+    sql = f"SELECT {_archive_columns(fields)} FROM archive.scripts_archive WHERE user_id = ?"
+    params: list = [user_id]
+    if position:
+        sql += " AND (create_time, id) < (?, ?)"
+        params.extend(position)
+    sql += " ORDER BY create_time DESC, id DESC LIMIT ?"
+    params.append(limit)
+    db_cursor.execute(sql, params)
+    archived = db_cursor.fetchall()
+    if not archived:
+        return rows
+    # 归档中途中断时同一脚本可能两边都有，以主库为准
+    hot_ids = {row["id"] for row in rows}
+    merged = [dict(row) for row in rows] + [row for row in archived if row["id"] not in hot_ids]
+    merged.sort(key=lambda row: (row["create_time"], row["id"]), reverse=True)
+    return [row if isinstance(row, dict) else _inflate_archived_row(row) for row in merged[:limit]]
+
+def _get_archived_script(db_cursor: sqlite3.Cursor, script_id: str, user_id: str, fields: List[str]) -> Optional[Dict[str, Any]]:
+    db_cursor.execute(
+        f"SELECT {_archive_columns(fields)} FROM archive.scripts_archive WHERE id = ? AND user_id = ?",
+        (script_id, user_id)
+    )
+    row = db_cursor.fetchone()
+    return _inflate_archived_row(row) if row else None
+
+def _archive_old_scripts(cutoff: str, batch_size: int = SCRIPT_ARCHIVE_BATCH_SIZE) -> int:
+    """
+    把 create_time 早于 cutoff 的脚本移入归档库，返回归档条数。
+    每批先提交归档库再删除主库记录：中途中断只会留下两边都有的记录，下次运行覆盖写入后补删
+    """
+    archived = 0
+    columns, join = _select_columns(ARCHIVE_PLAIN_FIELDS + list(ARCHIVE_PAYLOAD_FIELDS))
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        last_rowid = 0
+        while True:
+            cursor.execute(
+                f"SELECT s.rowid AS row_id, {columns} FROM scripts s{join} WHERE s.rowid > ? AND s.create_time < ? ORDER BY s.rowid LIMIT ?",
+                (last_rowid, cutoff, batch_size)
+            )
+            rows = cursor.fetchall()
+            if not rows:
+                break
+            archive_time = _now_str()
+            archive_rows = []
+            for row in rows:
+                record = dict(row)
+                content = record["content"] or ""
+                schemes = _parse_schemes(record)
+                codec, payload, raw_bytes = _compress_payload({
+                    "content": content,
+                    # 单方案脚本的 schemes 与正文相同，不重复存储
+                    "schemes": None if schemes == [content] else schemes,
+                    "structured": _parse_structured(record)
+                })
+                archive_rows.append(tuple(record[field] for field in ARCHIVE_PLAIN_FIELDS) + (codec, payload, raw_bytes, archive_time))
+            cursor.executemany(
+                f"""
+                INSERT OR REPLACE INTO archive.scripts_archive ({", ".join(ARCHIVE_PLAIN_FIELDS)}, codec, payload, raw_bytes, archive_time)
+                VALUES ({", ".join("?" for _ in range(len(ARCHIVE_PLAIN_FIELDS) + 4))})
+                """,
+                archive_rows
+            )
+            conn.commit()
+
+            rowids = [row["row_id"] for row in rows]
+            cursor.execute(
+                f"DELETE FROM scripts WHERE rowid IN ({', '.join('?' for _ in rowids)}) RETURNING content_hash",
+                rowids
+            )
+            _purge_text_blobs(cursor, [row[0] for row in cursor.fetchall()])
+            conn.commit()
+            archived += len(rows)
+            last_rowid = rowids[-1]
+        cursor.close()
+    finally:
+        conn.close()
+    return archived
+
+def _compact_database() -> Dict[str, Any]:
+    """
+    归档后整理主库，每一步都是短事务，不长时间阻塞写入：
+    清理无引用正文 -> 分步合并全文索引段（丢弃已删除记录）-> 分步归还空闲页 -> 更新查询规划统计。
+    旧库首次整理且空闲页比例超过 DB_VACUUM_FREE_RATIO 时整库 VACUUM 一次，同时切换为增量 VACUUM
+    """
+    result = {"purged_blobs": 0, "fts_merge_steps": 0, "freed_pages": 0, "vacuumed": False}
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        result["purged_blobs"] = _purge_text_blobs(cursor)
+        conn.commit()
+
+        if FTS_ENABLED:
+            for fts_table in FTS_TABLES.values():
+                # 页数取负值时不受 usermerge 限制，逐步把所有段合并为一个，效果等同 optimize
+                while True:
+                    changes = conn.total_changes
+                    cursor.execute(f"INSERT INTO {fts_table}({fts_table}, rank) VALUES ('merge', ?)", (-DB_MAINTENANCE_STEP_PAGES,))
+                    conn.commit()
+                    result["fts_merge_steps"] += 1
+                    if conn.total_changes - changes < 2:
+                        break
+
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        if cursor.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            while freelist_count > 0:
+                cursor.execute(f"PRAGMA incremental_vacuum({DB_MAINTENANCE_STEP_PAGES})").fetchall()
+                remaining = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+                if remaining >= freelist_count:
+                    break
+                result["freed_pages"] += freelist_count - remaining
+                freelist_count = remaining
+        elif page_count and freelist_count / page_count >= DB_VACUUM_FREE_RATIO:
+            cursor.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            cursor.execute("VACUUM")
+            result["freed_pages"] = freelist_count
+            result["vacuumed"] = True
+
+        cursor.execute("PRAGMA optimize")
+        cursor.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        cursor.close()
+    finally:
+        conn.close()
+    return result
+
+def _run_archive_maintenance() -> Dict[str, Any]:
+    cutoff = (datetime.now() - timedelta(days=SCRIPT_ARCHIVE_AFTER_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    archived = _archive_old_scripts(cutoff)
+    return dict(_compact_database(), archived=archived, cutoff=cutoff)
+
+async def archive_scripts_periodically() -> None:
+    while True:
+        try:
+            result = await run_in_threadpool(_run_archive_maintenance)
+            print(f"冷数据归档完成: {result}")
+        except Exception as e:
+            print(f"冷数据归档异常: {e}")
+        await asyncio.sleep(SCRIPT_ARCHIVE_INTERVAL_SECONDS)
+
 # ------------------- 新增接口：获取历史记录 -------------------
 @app.get("/api/scripts/history")
-def get_history(user_id: str, limit: int = 20):
-    import json
-    conn = get_db_conn()
-    cursor = conn.cursor()
+def get_history(request: Request, user_id: str, limit: int = 20, cursor: Optional[str] = None, fields: Optional[str] = None):
+    return _json_response(request, _history_payload(user_id, limit, cursor, fields))
+
+# ------------------- 新增接口：搜索历史记录/收藏 -------------------
+SEARCH_COLUMNS = {
+    "scripts": "s.id, s.title, s.scene, s.key_info, s.style, s.duration, s.create_time",
+    "favorites": "s.id, s.title, s.scene, s.key_info, s.style, s.duration, s.scheme_index, s.scheme_name, s.create_time"
+}
+
+def _split_search_terms(q: str) -> tuple:
+    """trigram 索引只能匹配不少于 3 个字符的片段，更短的词改用 LIKE 过滤"""
+    terms = [term for term in re.split(r"\s+", q.strip()) if term]
+    long_terms = [term for term in terms if len(term) >= 3]
+    short_terms = [term for term in terms if len(term) < 3]
+    return long_terms, short_terms
+
+def _fts_phrase(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+def _like_pattern(term: str) -> str:
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+def _probe_fts_matches(cursor: sqlite3.Cursor, fts_table: str, term: str) -> int:
+    """统计词项命中数，最多数到 SEARCH_FTS_MAX_CANDIDATES + 1，用于判断词项是否足够有区分度"""
     cursor.execute(
-        "SELECT id, scene, key_info, style, duration, content, schemes, create_time FROM scripts WHERE user_id = ? ORDER BY create_time DESC LIMIT ?",
-        (user_id, limit)
+        f"SELECT COUNT(*) FROM (SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH ? LIMIT ?)",
+        (_fts_phrase(term), SEARCH_FTS_MAX_CANDIDATES + 1)
     )
-    rows = cursor.fetchall()
-    
-    records = []
-    for row in rows:
-        record = dict(row)
-        try:
-            schemes_str = record.get('schemes')
-            if schemes_str:
-                record['schemes'] = json.loads(schemes_str)
-            else:
-                record['schemes'] = [record.get('content', '')]
-        except:
-            record['schemes'] = [record.get('content', '')]
-        records.append(record)
-    
-    cursor.close()
-    conn.close()
-    
+    return cursor.fetchone()[0]
+
+def _scan_window_start(cursor: sqlite3.Cursor, source: str, user_id: str) -> Optional[tuple]:
+    """按时间倒序扫描时只看该用户最近 SEARCH_SCAN_MAX_ROWS 条，返回窗口最早一条的 (create_time, id)；记录不足时返回 None"""
+    if SEARCH_SCAN_MAX_ROWS <= 0:
+        return None
+    cursor.execute(
+        f"SELECT create_time, id FROM {source} WHERE user_id = ? ORDER BY create_time DESC, id DESC LIMIT 1 OFFSET ?",
+        (user_id, SEARCH_SCAN_MAX_ROWS - 1)
+    )
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else None
+
+@app.get("/api/scripts/search")
+def search_scripts(user_id: str, q: str, source: str = "scripts", limit: int = 20, offset: int = 0):
+    if source not in FTS_TABLES:
+        return {"code": 400, "msg": f"不支持的搜索范围: {source}"}
+    if not q.strip():
+        return {"code": 400, "msg": "请输入搜索关键词"}
+
+    page_size = max(1, min(limit, MAX_PAGE_SIZE))
+    offset = max(0, offset)
+    long_terms, short_terms = _split_search_terms(q)
+    fts_table = FTS_TABLES[source]
+    columns = SEARCH_COLUMNS[source]
+
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+
+        # 查询规划：存在命中较少的词时走 FTS 并按 bm25 相关度排序；
+        # 所有词都是高频词时，命中很密集，按时间倒序扫描该用户的记录即可很快凑满一页。
+        # 命中数是全体用户的，对当前用户未必密集，扫描只覆盖最近 SEARCH_SCAN_MAX_ROWS 条，结果标记为 partial
+        use_fts = False
+        window_start = None
+        if FTS_ENABLED and long_terms:
+            probe_counts = [_probe_fts_matches(cursor, fts_table, term) for term in long_terms]
+            if min(probe_counts) == 0:
+                cursor.close()
+                return {"code": 200, "msg": "获取成功", "data": [], "next_offset": None, "order": "relevance", "partial": False}
+            use_fts = min(probe_counts) <= SEARCH_FTS_MAX_CANDIDATES
+
+        params: list = []
+        if use_fts:
+            sql = f"""
+                SELECT {columns},
+                       snippet({fts_table}, -1, '【', '】', '…', 24) AS snippet,
+                       bm25({fts_table}) AS rank
+                FROM {fts_table} JOIN {source} s ON s.rowid = {fts_table}.rowid{BLOB_JOIN}
+                WHERE {fts_table} MATCH ? AND s.user_id = ?
+            """
+            params.extend([" AND ".join(_fts_phrase(term) for term in long_terms), user_id])
+            like_terms = short_terms
+            order_by = "rank, s.create_time DESC"
+        else:
+            sql = f"""
+                SELECT {columns}, substr(COALESCE(b.body, s.content), 1, 80) AS snippet, 0 AS rank
+                FROM {source} s{BLOB_JOIN}
+                WHERE s.user_id = ?
+            """
+            params.append(user_id)
+            window_start = _scan_window_start(cursor, source, user_id)
+            if window_start:
+                sql += " AND (s.create_time, s.id) >= (?, ?)"
+                params.extend(window_start)
+            like_terms = long_terms + short_terms
+            order_by = "s.create_time DESC, s.id DESC"
+
+        for term in like_terms:
+            sql += " AND (s.key_info LIKE ? ESCAPE '\\' OR COALESCE(b.body, s.content) LIKE ? ESCAPE '\\')"
+            pattern = _like_pattern(term)
+            params.extend([pattern, pattern])
+
+        sql += f" ORDER BY {order_by} LIMIT ? OFFSET ?"
+        params.extend([page_size + 1, offset])
+
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+    finally:
+        conn.close()
+
+    next_offset = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_offset = offset + page_size
+
     return {
         "code": 200,
         "msg": "获取成功",
-        "data": records
+        "data": [dict(row) for row in rows],
+        "next_offset": next_offset,
+        "order": "relevance" if use_fts else "recent",
+        "partial": window_start is not None
     }
 
+# ------------------- 新增接口：获取单条脚本详情（列表摘要模式下按需加载正文） -------------------
+def _get_record(table: str, record_id: str, user_id: str, fields: List[str]) -> Optional[sqlite3.Row]:
+    columns, join = _select_columns(fields)
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            f"SELECT {columns} FROM {table} s{join} WHERE s.id = ? AND s.user_id = ?",
+            (record_id, user_id)
+        )
+        row = cursor.fetchone()
+        if row is None and table == "scripts" and ARCHIVE_ATTACHED:
+            row = _get_archived_script(cursor, record_id, user_id, fields)
+        cursor.close()
+        return row
+    finally:
+        conn.close()
+
+@app.get("/api/scripts/{script_id}")
+def get_script(request: Request, script_id: str, user_id: str):
+    row = _get_record("scripts", script_id, user_id, _script_select_fields(SCRIPT_FIELDS))
+    if not row:
+        return {"code": 404, "msg": "记录不存在"}
+    return _json_response(request, {"code": 200, "msg": "获取成功", "data": _script_record(row, SCRIPT_FIELDS)})
+
 # ------------------- 新增接口：删除历史记录 -------------------
 @app.delete("/api/scripts/{script_id}")
 def delete_script(script_id: str, user_id: str):
     conn = get_db_conn()
     cursor = conn.cursor()
     cursor.execute(
-        "DELETE FROM scripts WHERE id = ? AND user_id = ?",
+        "DELETE FROM scripts WHERE id = ? AND user_id = ? RETURNING content_hash",
         (script_id, user_id)
     )
+    # 触发器已扣减引用计数，正文无人引用时一并删除
+    _purge_text_blobs(cursor, [row[0] for row in cursor.fetchall()])
+    if ARCHIVE_ATTACHED:
+        cursor.execute("DELETE FROM archive.scripts_archive WHERE id = ? AND user_id = ?", (script_id, user_id))
     conn.commit()
     cursor.close()
     conn.close()
     return {"code": 200, "msg": "删除成功"}
 
-# ------------------- 视频配额/会员/生成接口 -------------------
-@app.get("/api/video/quota")
-def get_video_quota(user_id: str):
+# ------------------- 缓存统计接口 -------------------
+@app.get("/api/cache/stats")
+def get_cache_stats():
+    return {
+        "code": 200,
+        "msg": "获取成功",
+        "data": {
+            "script": dict(script_result_cache.stats(), enabled=SCRIPT_CACHE_ENABLED),
+            "corpus": dict(scene_corpus_cache.stats(), enabled=CORPUS_ENABLED),
+            "similar": dict(similar_script_matcher.stats(), enabled=SCRIPT_SIMILAR_ENABLED, mode=SCRIPT_SIMILAR_MODE),
+            "quota": quota_snapshot_cache.stats(),
+            "video": dict(video_result_cache.stats(), enabled=VIDEO_CACHE_ENABLED, hit_consumes_quota=VIDEO_CACHE_HIT_CONSUMES_QUOTA,
+                          shared_across_users=VIDEO_CACHE_SHARED_ACROSS_USERS)
+        }
+    }
+
+# ------------------- DeepSeek 调度池状态接口 -------------------
+@app.get("/api/deepseek/pool")
+def get_deepseek_pool_stats():
+    endpoints = deepseek_pool.stats()
+    return {
+        "code": 200,
+        "msg": "获取成功",
+        "data": {
+            "total": len(endpoints),
+            "available": sum(1 for item in endpoints if item["state"] == "available"),
+            "breaker": deepseek_breaker.stats(),
+            "endpoints": endpoints
+        }
+    }
+
+# ------------------- DeepSeek 用量与上下文缓存命中率 -------------------
+@app.get("/api/deepseek/usage")
+def get_deepseek_usage(days: int = 7, bucket: str = "day", purpose: Optional[str] = None):
+    # 按天或按小时汇总；包含尚在缓冲中的用量，查询前先落库
+    if bucket not in ("day", "hour"):
+        return {"code": 400, "msg": "bucket 只能为 day 或 hour"}
+    _flush_deepseek_usage()
+    since = (datetime.now() - timedelta(days=max(days, 1))).strftime("%Y-%m-%d %H:%M:%S")
+    period = "substr(create_time, 1, 10)" if bucket == "day" else "substr(create_time, 1, 13) || ':00'"
+    sql = f"""
+        SELECT {period} AS period, COUNT(*) AS calls,
+               SUM(prompt_tokens) AS prompt_tokens, SUM(prompt_cache_hit_tokens) AS cache_hit_tokens,
+               SUM(prompt_cache_miss_tokens) AS cache_miss_tokens, SUM(completion_tokens) AS completion_tokens,
+               SUM(finish_reason = 'length') AS truncated
+        FROM deepseek_usage WHERE create_time >= ?{" AND purpose = ?" if purpose else ""}
+        GROUP BY period ORDER BY period
+    """
     conn = get_db_conn()
     try:
-        quota = _get_video_quota_snapshot(conn, user_id)
-        return {"code": 200, "msg": "获取成功", "data": quota}
+        rows = [dict(row) for row in conn.execute(sql, (since, purpose) if purpose else (since,)).fetchall()]
     finally:
         conn.close()
 
+    def with_ratio(item: Dict[str, Any]) -> Dict[str, Any]:
+        prompt_tokens = item["prompt_tokens"] or 0
+        item["cache_hit_ratio"] = round((item["cache_hit_tokens"] or 0) / prompt_tokens, 4) if prompt_tokens else 0.0
+        return item
+
+    totals = {key: sum(row[key] or 0 for row in rows) for key in (
+        "calls", "prompt_tokens", "cache_hit_tokens", "cache_miss_tokens", "completion_tokens", "truncated")}
+    return {
+        "code": 200,
+        "msg": "获取成功",
+        "data": {"bucket": bucket, "since": since, "total": with_ratio(totals), "series": [with_ratio(row) for row in rows]}
+    }
+
+# ------------------- 运行指标接口（Prometheus 抓取） -------------------
+def _collect_runtime_metrics():
+    """抓取时读取缓存命中、线程池与队列状态，平时不产生任何开销"""
+    corpus = scene_corpus_cache.stats()
+    caches = {
+        "script": script_result_cache.stats(),
+        "corpus": dict(corpus, hits=corpus["hits"] + corpus["memory_hits"]),
+        "similar": similar_script_matcher.stats(),
+        "quota": quota_snapshot_cache.stats(),
+        "video": video_result_cache.stats()
+    }
+    yield "cache_hits_total", "counter", "缓存命中次数", [({"cache": name}, stats["hits"]) for name, stats in caches.items()]
+    yield "cache_misses_total", "counter", "缓存未命中次数", [({"cache": name}, stats["misses"]) for name, stats in caches.items()]
+    yield "cache_hit_ratio", "gauge", "进程启动以来的缓存命中率", [
+        ({"cache": name}, stats["hits"] / (stats["hits"] + stats["misses"]) if stats["hits"] + stats["misses"] else 0.0)
+        for name, stats in caches.items()
+    ]
+
+    # 同步接口与 run_in_threadpool 共用 anyio 默认线程池，排队数持续大于 0 说明线程池成了瓶颈
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    limiter_stats = limiter.statistics()
+    yield "threadpool_threads_busy", "gauge", "线程池中正在执行的任务数", [({}, limiter_stats.borrowed_tokens)]
+    yield "threadpool_tasks_waiting", "gauge", "等待线程池空闲线程的任务数", [({}, limiter_stats.tasks_waiting)]
+    yield "threadpool_threads_max", "gauge", "线程池容量", [({}, limiter.total_tokens)]
+    yield "db_pool_idle_connections", "gauge", "连接池中的空闲连接数", [({}, db_pool._idle.qsize())]
+    yield "db_pool_open_connections", "gauge", "连接池已打开的连接总数（含借出）", [({}, db_pool.opened)]
+    yield "video_jobs_queued", "gauge", "等待 worker 处理的视频任务数", [({}, video_job_queue.qsize() if video_job_queue is not None else 0)]
+    states = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+    yield "upstream_circuit_state", "gauge", "熔断状态：0 正常，1 探测中，2 熔断", [
+        ({"upstream": breaker.name}, states[breaker.state]) for breaker in (deepseek_breaker, sedance_breaker)
+    ]
+    yield "deepseek_hedge_delay_seconds", "gauge", "当前对冲请求触发时间（未开启或样本不足时为 0）", [({}, _deepseek_hedge_delay() or 0.0)]
+    yield "script_tokens_per_shot", "gauge", "估算 max_tokens 使用的每镜头 token 数（实测滑动平均）", [
+        ({}, script_token_estimator.stats()["tokens_per_shot"])
+    ]
+
+    pool = deepseek_pool.stats()
+    yield "deepseek_pool_endpoint_available", "gauge", "调度池成员当前是否可用（1 可用，0 限流/移出/超出预算）", [
+        ({"endpoint": item["name"]}, 1 if item["state"] == "available" else 0) for item in pool
+    ]
+    yield "deepseek_pool_inflight", "gauge", "调度池成员进行中的请求数", [({"endpoint": item["name"]}, item["inflight"]) for item in pool]
+    yield "deepseek_pool_utilization", "gauge", "近 60 秒 RPM/TPM 预算使用率（取较大者，未设预算的成员不输出）", [
+        ({"endpoint": item["name"]}, item["utilization"]) for item in pool if item["utilization"] is not None
+    ]
+    yield "deepseek_pool_latency_seconds", "gauge", "调度池成员近期耗时（chat 为整次调用，stream 为首个增量）", [
+        ({"endpoint": item["name"], "kind": kind}, value) for item in pool for kind, value in item["latency_seconds"].items()
+    ]
+    for field, help_text in (("requests_total", "调度池成员发起的请求数"), ("tokens_total", "调度池成员消耗的 token 数"),
+                             ("rate_limited_total", "调度池成员收到 429 的次数"), ("evictions_total", "调度池成员被暂时移出的次数")):
+        yield f"deepseek_pool_{field}", "counter", help_text, [({"endpoint": item["name"]}, item[field]) for item in pool]
+
+metrics_registry.add_collector(_collect_runtime_metrics)
+
+@app.get("/metrics")
+async def get_metrics():
+    # 在事件循环中渲染，读取线程池状态不需要占用工作线程
+    if not METRICS_ENABLED:
+        raise HTTPException(status_code=404, detail="未开启运行指标")
+    return Response(content=metrics_registry.render(), media_type=METRICS_CONTENT_TYPE)
+
+# ------------------- 性能分析文件：列出/下载最近的折叠栈 -------------------
+def _check_profiling_admin(request: Request) -> None:
+    if not PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="未开启性能分析")
+    if PROFILING_TOKEN and not hmac.compare_digest(
+        request.headers.get("X-Profile-Token", "").encode("utf-8"), PROFILING_TOKEN.encode("utf-8")
+    ):
+        raise HTTPException(status_code=403, detail="性能分析口令错误")
+
+@app.get("/api/admin/profiles")
+def list_profiles(request: Request, limit: int = 50):
+    _check_profiling_admin(request)
+    return {"code": 200, "msg": "获取成功", "data": request_profiler.list_profiles()[:max(limit, 0)]}
+
+@app.get("/api/admin/profiles/{name}")
+def download_profile(request: Request, name: str):
+    _check_profiling_admin(request)
+    path = request_profiler.profile_path(name)
+    if not path:
+        raise HTTPException(status_code=404, detail="分析文件不存在")
+    return FileResponse(path, media_type="text/plain; charset=utf-8", filename=os.path.basename(path))
+
+# ------------------- 存储统计接口 -------------------
+@app.get("/api/storage/stats")
+def get_storage_stats():
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        page_size = cursor.execute("PRAGMA page_size").fetchone()[0]
+        page_count = cursor.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = cursor.execute("PRAGMA freelist_count").fetchone()[0]
+        cursor.execute(
+            """
+            SELECT COUNT(*), COALESCE(SUM(LENGTH(CAST(body AS BLOB))), 0), COALESCE(SUM(ref_count), 0),
+                   COALESCE(SUM(MAX(ref_count - 1, 0) * LENGTH(CAST(body AS BLOB))), 0),
+                   COALESCE(SUM(ref_count <= 0), 0)
+            FROM text_blobs
+            """
+        )
+        blobs, blob_bytes, references, dedup_saved_bytes, orphans = cursor.fetchone()
+
+        archive = {"enabled": SCRIPT_ARCHIVE_ENABLED, "after_days": SCRIPT_ARCHIVE_AFTER_DAYS}
+        if ARCHIVE_ATTACHED:
+            archive_page_size = cursor.execute("PRAGMA archive.page_size").fetchone()[0]
+            archive_page_count = cursor.execute("PRAGMA archive.page_count").fetchone()[0]
+            cursor.execute("SELECT COUNT(*), COALESCE(SUM(raw_bytes), 0), COALESCE(SUM(LENGTH(payload)), 0) FROM archive.scripts_archive")
+            archived, raw_bytes, payload_bytes = cursor.fetchone()
+            archive.update({
+                "db_bytes": archive_page_size * archive_page_count,
+                "scripts": archived,
+                "raw_bytes": raw_bytes,
+                "compressed_bytes": payload_bytes,
+                "compress_ratio": round(payload_bytes / raw_bytes, 4) if raw_bytes else 0.0
+            })
+        cursor.close()
+    finally:
+        conn.close()
+
+    return {
+        "code": 200,
+        "msg": "获取成功",
+        "data": {
+            "db_bytes": page_size * page_count,
+            "free_bytes": page_size * freelist_count,
+            "text_blobs": blobs,
+            "text_blob_bytes": blob_bytes,
+            "text_references": references,
+            "dedup_saved_bytes": dedup_saved_bytes,
+            "orphan_blobs": orphans,
+            "archive": archive
+        }
+    }
+
+# ------------------- 视频配额/会员/生成接口 -------------------
+@app.get("/api/video/quota")
+def get_video_quota(user_id: str):
+    return {"code": 200, "msg": "获取成功", "data": _get_video_quota_snapshot(user_id)}
+
 @app.post("/api/video/recharge")
 def recharge_video_membership(req: VideoRechargeRequest):
     conn = get_db_conn()
@@ -685,40 +3410,308 @@ def recharge_video_membership(req: VideoRechargeRequest):
     finally:
         conn.close()
 
+# ------------------- 视频生成任务队列 -------------------
+VIDEO_JOB_DONE_STATUSES = ("succeeded", "failed")
+video_job_queue: Optional["asyncio.Queue[str]"] = None
+video_job_events: Dict[str, asyncio.Event] = {}
+
+def _video_job_to_dict(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job.pop("script", None)
+    raw_response = job.get("raw_response")
+    if raw_response:
+        try:
+            job["raw_response"] = json.loads(raw_response)
+        except ValueError:
+            pass
+    return job
+
+# ------------------- 视频结果缓存：相同脚本/模型/数字人/音色复用已生成的视频 -------------------
+def _video_cache_key(req: VideoGenerateRequest) -> str:
+    # 脚本只合并空白，不做大小写/全半角归一化，避免改变配音内容；模拟模式的结果与真实结果分开缓存
+    # 默认按用户隔离，视频地址不会泄露给其他用户；显式开启 VIDEO_CACHE_SHARED_ACROSS_USERS 时才跨用户复用
+    script = re.sub(r"\s+", " ", req.script or "").strip()
+    raw = json.dumps([
+        "" if VIDEO_CACHE_SHARED_ACROSS_USERS else req.user_id,
+        _normalize_video_model(req.model),
+        _normalize_cache_text(req.digital_human),
+        _normalize_cache_text(req.voice_style),
+        script,
+        SEDANCE_MOCK_MODE
+    ], ensure_ascii=False)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def _video_cache_fresh(value: str) -> bool:
+    """视频地址距失效不足 VIDEO_CACHE_URL_MIN_REMAINING_SECONDS 时视为过期，重新生成"""
+    try:
+        expire_dt = _parse_time(json.loads(value).get("url_expire_at"))
+    except (ValueError, AttributeError):
+        return False
+    return expire_dt is not None and expire_dt - timedelta(seconds=VIDEO_CACHE_URL_MIN_REMAINING_SECONDS) > datetime.now()
+
+def _get_cached_video(req: VideoGenerateRequest) -> Optional[Dict[str, Any]]:
+    if not VIDEO_CACHE_ENABLED or req.bypass_cache:
+        return None
+    value = video_result_cache.get(_video_cache_key(req), _video_cache_fresh)
+    return json.loads(value) if value else None
+
+def _store_cached_video(req: VideoGenerateRequest, job_id: str, api_result: Dict[str, Any]) -> None:
+    result_fields = _extract_video_result_fields(api_result)
+    video_url = result_fields.get("video_url")
+    if not video_url:
+        return
+    value = {
+        "video_url": video_url,
+        "task_id": result_fields.get("task_id"),
+        "url_expire_at": _video_url_expire_at(api_result, video_url).strftime("%Y-%m-%d %H:%M:%S"),
+        "source_job_id": job_id
+    }
+    video_result_cache.set(_video_cache_key(req), json.dumps(value, ensure_ascii=False))
+
+def _create_video_job(req: VideoGenerateRequest, cached: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    conn = get_db_conn()
+    try:
+        # 扣减配额与写入任务在同一事务内提交，任一步失败整体回滚，不会出现扣了次数却没有任务；命中缓存时按配置决定是否扣减
+        hit_consumes_quota = VIDEO_CACHE_HIT_CONSUMES_QUOTA if req.cache_hit_consumes_quota is None else req.cache_hit_consumes_quota
+        consumes_quota = cached is None or hit_consumes_quota
+        if consumes_quota:
+            quota = _reserve_video_quota(conn, req.user_id, req.model)
+        else:
+            quota = _get_video_quota_snapshot(req.user_id, conn)
+        job_id = f"vjob_{uuid.uuid4().hex[:12]}"
+        now = _now_str()
+        cursor = conn.cursor()
+        if cached is None:
+            cursor.execute(
+                """
+                INSERT INTO video_jobs (id, user_id, model, digital_human, voice_style, script, status, usage_date, create_time, update_time)
+                VALUES (?, ?, ?, ?, ?, ?, 'queued', ?, ?, ?)
+                """,
+                (job_id, req.user_id, req.model, req.digital_human, req.voice_style, req.script, quota["usage_date"], now, now)
+            )
+            status = "queued"
+        else:
+            # 命中缓存：直接记录为已完成的任务，前端照常按任务 ID 查询
+            cursor.execute(
+                """
+                INSERT INTO video_jobs (id, user_id, model, digital_human, voice_style, script, status, usage_date,
+                                        video_url, task_id, raw_response, cache_hit, create_time, update_time, finish_time)
+                VALUES (?, ?, ?, ?, ?, ?, 'succeeded', ?, ?, ?, ?, 1, ?, ?, ?)
+                """,
+                (job_id, req.user_id, req.model, req.digital_human, req.voice_style, req.script, quota["usage_date"],
+                 cached["video_url"], cached.get("task_id"), json.dumps(cached, ensure_ascii=False), now, now, now)
+            )
+            status = "succeeded"
+        cursor.close()
+        if consumes_quota:
+            _commit_quota_change(conn, quota)
+        else:
+            conn.commit()
+        return {"job_id": job_id, "status": status, "quota": quota}
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        conn.close()
+
+def _get_video_job(job_id: str, user_id: Optional[str] = None) -> Optional[sqlite3.Row]:
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        if user_id is None:
+            cursor.execute("SELECT * FROM video_jobs WHERE id = ?", (job_id,))
+        else:
+            cursor.execute("SELECT * FROM video_jobs WHERE id = ? AND user_id = ?", (job_id, user_id))
+        row = cursor.fetchone()
+        cursor.close()
+        return row
+    finally:
+        conn.close()
+
+def _mark_video_job_running(job_id: str) -> bool:
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "UPDATE video_jobs SET status = 'running', update_time = ? WHERE id = ? AND status = 'queued'",
+            (_now_str(), job_id)
+        )
+        claimed = cursor.rowcount == 1
+        conn.commit()
+        cursor.close()
+        return claimed
+    finally:
+        conn.close()
+
+def _fail_video_job(cursor: sqlite3.Cursor, job_id: str, error: str, now: str) -> List[str]:
+    """把任务标记为失败并退还受理时扣减的次数（不提交），返回被退还次数的用户，提交后由调用方作废其配额缓存"""
+    cursor.execute(
+        "UPDATE video_jobs SET status = 'failed', error = ?, update_time = ?, finish_time = ? WHERE id = ?",
+        (error, now, now, job_id)
+    )
+    cursor.execute(
+        """
+        UPDATE video_usage_daily SET used_count = used_count - 1, update_time = ?
+        WHERE used_count > 0 AND (user_id, usage_date, model) = (SELECT user_id, usage_date, model FROM video_jobs WHERE id = ?)
+        RETURNING user_id
+        """,
+        (now, job_id)
+    )
+    return [row["user_id"] for row in cursor.fetchall()]
+
+def _finish_video_job(job_id: str, api_result: Optional[Dict[str, Any]], error: Optional[str]) -> None:
+    now = _now_str()
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        if error is None:
+            result_fields = _extract_video_result_fields(api_result or {})
+            cursor.execute(
+                """
+                UPDATE video_jobs SET status = 'succeeded', video_url = ?, task_id = ?, raw_response = ?, update_time = ?, finish_time = ?
+                WHERE id = ?
+                """,
+                (result_fields.get("video_url"), result_fields.get("task_id"), json.dumps(api_result, ensure_ascii=False), now, now, job_id)
+            )
+        else:
+            # 任务失败时退还受理时扣减的次数
+            refunded = _fail_video_job(cursor, job_id, error, now)
+        conn.commit()
+        cursor.close()
+        if error is not None:
+            for user_id in refunded:
+                quota_snapshot_cache.invalidate(user_id)
+    finally:
+        conn.close()
+
+VIDEO_JOB_INTERRUPTED_ERROR = "服务重启时任务中断，已退还次数，请重新提交"
+
+def _recover_video_jobs() -> List[str]:
+    now = _now_str()
+    conn = get_db_conn()
+    try:
+        cursor = conn.cursor()
+        # 上次退出时仍在执行的任务可能已提交给 Seedance（提交不幂等且计费），不重新提交，按失败处理并退还次数；
+        # 仍在排队的任务尚未提交，重新排队
+        cursor.execute("SELECT id FROM video_jobs WHERE status = 'running'")
+        refunded = []
+        for row in cursor.fetchall():
+            refunded.extend(_fail_video_job(cursor, row["id"], VIDEO_JOB_INTERRUPTED_ERROR, now))
+        conn.commit()
+        for user_id in set(refunded):
+            quota_snapshot_cache.invalidate(user_id)
+        cursor.execute("SELECT id FROM video_jobs WHERE status = 'queued' ORDER BY create_time")
+        job_ids = [row["id"] for row in cursor.fetchall()]
+        cursor.close()
+        return job_ids
+    finally:
+        conn.close()
+
+def _notify_video_job(job_id: str) -> None:
+    event = video_job_events.pop(job_id, None)
+    if event is not None:
+        event.set()
+
+async def _run_video_job(job_id: str) -> None:
+    if not await run_in_threadpool(_mark_video_job_running, job_id):
+        return
+    row = await run_in_threadpool(_get_video_job, job_id)
+    req = VideoGenerateRequest(
+        user_id=row["user_id"],
+        model=row["model"],
+        digital_human=row["digital_human"],
+        voice_style=row["voice_style"],
+        script=row["script"]
+    )
+
+    api_result = None
+    error = None
+    try:
+        api_result = await _call_sedance_api(req)
+    except HTTPException as e:
+        error = str(e.detail)
+    except Exception as e:
+        error = f"生成失败: {str(e)}"
+    await run_in_threadpool(_finish_video_job, job_id, api_result, error)
+    if error is None and VIDEO_CACHE_ENABLED and isinstance(api_result, dict):
+        await run_in_threadpool(_store_cached_video, req, job_id, api_result)
+
+async def _video_worker() -> None:
+    while True:
+        job_id = await video_job_queue.get()
+        try:
+            await _run_video_job(job_id)
+        except Exception as e:
+            print(f"视频任务 {job_id} 执行异常: {e}")
+        finally:
+            _notify_video_job(job_id)
+            video_job_queue.task_done()
+
+async def start_video_workers() -> None:
+    global video_job_queue
+    video_job_queue = asyncio.Queue()
+    video_job_events.clear()
+    for job_id in await run_in_threadpool(_recover_video_jobs):
+        video_job_queue.put_nowait(job_id)
+    for _ in range(max(VIDEO_WORKER_COUNT, 1)):
+        _spawn_background(_video_worker())
+
 @app.post("/api/video/generate")
-def generate_video(req: VideoGenerateRequest):
+async def generate_video(req: VideoGenerateRequest):
     if not req.user_id or not req.script.strip():
         return {"code": 400, "msg": "参数不全"}
 
     try:
         normalized_model = _normalize_video_model(req.model)
         req.model = normalized_model
-        api_result = _call_sedance_api(req)
-
-        conn = get_db_conn()
-        try:
-            updated_quota = _consume_video_quota(conn, req.user_id, normalized_model)
-        finally:
-            conn.close()
-
-        result_fields = _extract_video_result_fields(api_result)
+        cached = await run_in_threadpool(_get_cached_video, req)
+        job = await run_in_threadpool(_create_video_job, req, cached)
+        if cached is None:
+            video_job_queue.put_nowait(job["job_id"])
+
+        data = {
+            "job_id": job["job_id"],
+            "status": job["status"],
+            "model": normalized_model,
+            "digital_human": req.digital_human,
+            "voice_style": req.voice_style,
+            "quota": job["quota"],
+            "cached": cached is not None
+        }
+        if cached is not None:
+            data["video_url"] = cached["video_url"]
+            data["task_id"] = cached.get("task_id")
         return {
             "code": 200,
-            "msg": "视频生成成功",
-            "data": {
-                "model": normalized_model,
-                "digital_human": req.digital_human,
-                "voice_style": req.voice_style,
-                "video_url": result_fields.get("video_url"),
-                "task_id": result_fields.get("task_id"),
-                "raw_response": api_result,
-                "quota": updated_quota
-            }
+            "msg": "视频已生成" if cached is not None else "视频任务已提交",
+            "data": data
         }
     except HTTPException as e:
         return {"code": e.status_code, "msg": e.detail}
     except Exception as e:
-        return {"code": 500, "msg": f"生成失败: {str(e)}"}
+        return {"code": 500, "msg": f"提交失败: {str(e)}"}
+
+# 查询视频任务状态；wait > 0 时长轮询，任务完成或超时后返回
+@app.get("/api/video/jobs/{job_id}")
+async def get_video_job(job_id: str, user_id: str, wait: int = 0):
+    row = await run_in_threadpool(_get_video_job, job_id, user_id)
+    if not row:
+        return {"code": 404, "msg": "任务不存在"}
+
+    wait_seconds = max(0, min(wait, VIDEO_JOB_MAX_WAIT_SECONDS))
+    if wait_seconds > 0 and row["status"] not in VIDEO_JOB_DONE_STATUSES:
+        event = video_job_events.setdefault(job_id, asyncio.Event())
+        # 注册等待后再读一次，避免任务恰好在两次读取之间完成而白等
+        row = await run_in_threadpool(_get_video_job, job_id, user_id)
+        if row["status"] not in VIDEO_JOB_DONE_STATUSES:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=wait_seconds)
+            except asyncio.TimeoutError:
+                pass
+            row = await run_in_threadpool(_get_video_job, job_id, user_id)
+
+    return {"code": 200, "msg": "获取成功", "data": _video_job_to_dict(row)}
 
 # ------------------- 收藏接口 -------------------
 # 添加收藏
@@ -729,9 +3722,11 @@ def add_favorite(user_id: str, scene: str, style: str, duration: str, key_info:
     
     conn = get_db_conn()
     cursor = conn.cursor()
+    # 收藏的正文通常与历史脚本相同，只引用同一份存储
+    content_hash = _store_text_blob(cursor, content)
     cursor.execute(
-        "INSERT INTO favorites (id, user_id, scene, style, duration, key_info, content, scheme_index, scheme_name, create_time) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
-        (fav_id, user_id, scene, style, duration, key_info, content, scheme_index, scheme_name, create_time)
+        "INSERT INTO favorites (id, user_id, scene, style, duration, key_info, title, content, content_hash, scheme_index, scheme_name, create_time) VALUES (?, ?, ?, ?, ?, ?, ?, '', ?, ?, ?, ?)",
+        (fav_id, user_id, scene, style, duration, key_info, _extract_script_title(content), content_hash, scheme_index, scheme_name, create_time)
     )
     conn.commit()
     cursor.close()
@@ -744,38 +3739,43 @@ def add_favorite(user_id: str, scene: str, style: str, duration: str, key_info:
     }
 
 # 获取收藏列表
-@app.get("/api/favorites/list", response_model=dict)
-def get_favorites(user_id: str, limit: int = 50):
-    conn = get_db_conn()
-    cursor = conn.cursor()
-    cursor.execute(
-        "SELECT id, scene, style, duration, key_info, content, scheme_index, scheme_name, create_time FROM favorites WHERE user_id = ? ORDER BY create_time DESC LIMIT ?",
-        (user_id, limit)
-    )
-    rows = cursor.fetchall()
+def _favorites_payload(user_id: str, limit: int = 50, cursor: Optional[str] = None, fields: Optional[str] = None) -> Dict[str, Any]:
+    output_fields = _resolve_fields(fields, FAVORITE_FIELDS)
+    rows, next_cursor = _fetch_page("favorites", output_fields, user_id, limit, cursor)
     
     favorites = []
     for row in rows:
         favorites.append(dict(row))
     
-    cursor.close()
-    conn.close()
-    
     return {
         "code": 200,
         "msg": "获取成功",
-        "data": favorites
+        "data": favorites,
+        "next_cursor": next_cursor
     }
 
+@app.get("/api/favorites/list", response_model=dict)
+def get_favorites(request: Request, user_id: str, limit: int = 50, cursor: Optional[str] = None, fields: Optional[str] = None):
+    return _json_response(request, _favorites_payload(user_id, limit, cursor, fields))
+
+# 获取单条收藏详情
+@app.get("/api/favorites/{favorite_id}", response_model=dict)
+def get_favorite(request: Request, favorite_id: str, user_id: str):
+    row = _get_record("favorites", favorite_id, user_id, FAVORITE_FIELDS)
+    if not row:
+        return {"code": 404, "msg": "记录不存在"}
+    return _json_response(request, {"code": 200, "msg": "获取成功", "data": dict(row)})
+
 # 删除收藏
 @app.delete("/api/favorites/{favorite_id}", response_model=dict)
 def delete_favorite(favorite_id: str, user_id: str):
     conn = get_db_conn()
     cursor = conn.cursor()
     cursor.execute(
-        "DELETE FROM favorites WHERE id = ? AND user_id = ?",
+        "DELETE FROM favorites WHERE id = ? AND user_id = ? RETURNING content_hash",
         (favorite_id, user_id)
     )
+    _purge_text_blobs(cursor, [row[0] for row in cursor.fetchall()])
     conn.commit()
     cursor.close()
     conn.close()
@@ -786,6 +3786,53 @@ def delete_favorite(favorite_id: str, user_id: str):
     }
 
 
+# ====================== 启动/关闭钩子 ======================
+background_tasks = set()
+
+def _seed_script_token_estimator(limit: int = 200) -> None:
+    """用最近一次写完的脚本生成用量校正每镜头 token 数，重启后不必从初始值重新收敛"""
+    conn = get_db_conn()
+    try:
+        rows = conn.execute(
+            "SELECT u.completion_tokens, s.duration FROM deepseek_usage u JOIN scripts s ON s.id = u.script_id "
+            "WHERE u.purpose IN ('script', 'stream') AND u.finish_reason = 'stop' ORDER BY u.id DESC LIMIT ?",
+            (limit,)
+        ).fetchall()
+    finally:
+        conn.close()
+    for row in reversed(rows):
+        script_token_estimator.observe(row["completion_tokens"], shot_count_for(row["duration"]))
+
+def _spawn_background(coro) -> None:
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+async def on_startup():
+    if PROFILING_ENABLED:
+        request_profiler.install(asyncio.get_running_loop())
+    get_deepseek_client()
+    await run_in_threadpool(_backfill_script_fields)
+    await run_in_threadpool(_seed_script_token_estimator)
+    if SCRIPT_SIMILAR_ENABLED:
+        _spawn_background(run_in_threadpool(similar_script_matcher.sync))
+    if CORPUS_ENABLED and CORPUS_PREWARM_TOP_N > 0:
+        _spawn_background(prewarm_corpus_cache())
+    if SCRIPT_ARCHIVE_ENABLED:
+        _spawn_background(archive_scripts_periodically())
+    if VIDEO_MEMBERSHIP_SWEEP_INTERVAL_SECONDS > 0:
+        _spawn_background(sweep_expired_memberships_periodically())
+    _spawn_background(flush_deepseek_usage_periodically())
+    await start_video_workers()
+
+async def on_shutdown():
+    for task in list(background_tasks):
+        task.cancel()
+    await close_deepseek_client()
+    await close_sedance_client()
+    # 写入缓冲中尚未落库的用量
+    await run_in_threadpool(_flush_deepseek_usage)
+    db_pool.close_all()
 
 # 启动服务
 if __name__ == "__main__":
@@ -0,0 +1,163 @@
+"""
+近似重复请求索引：对 (scene, style, duration) 分组内的 key_info 做 MinHash + LSH。
+
+- 签名只在计算分桶时使用，不常驻内存；每条记录仅保存每个分段的 32 位桶键
+- 桶键按分段存放在排好序的 array 中，二分查找候选；新增记录先进入增量字典，
+  积累到一定数量后再合并进有序数组，避免每次插入都重排
+- 候选只是“可能相似”，调用方需用 shingle_jaccard 对原文复核
+"""
+import bisect
+import hashlib
+import random
+import re
+import threading
+import unicodedata
+from array import array
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+MERSENNE_PRIME = (1 << 61) - 1
+MAX_HASH = (1 << 32) - 1
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def shingles(text: Optional[str]) -> Set[str]:
+    """
+    归一化后按词切分，每个词取字符二元组：
+    表情、标点被丢弃，调换词序不影响结果
+    """
+    normalized = unicodedata.normalize("NFKC", text or "").lower()
+    result: Set[str] = set()
+    for token in TOKEN_PATTERN.findall(normalized):
+        token = token.replace("_", "")
+        if len(token) < 2:
+            if token:
+                result.add(token)
+            continue
+        for i in range(len(token) - 1):
+            result.add(token[i:i + 2])
+    return result
+
+
+def shingle_jaccard(left: Set[str], right: Set[str]) -> float:
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+class MinHashLSHIndex:
+    """只追加的 MinHash/LSH 索引，线程安全"""
+
+    def __init__(self, bands: int = 10, rows: int = 4, merge_threshold: int = 50000,
+                 hash_cache_size: int = 200000, seed: int = 1):
+        self.bands = bands
+        self.rows = rows
+        self.merge_threshold = merge_threshold
+        self.hash_cache_size = hash_cache_size
+        self._hash_cache: Dict[str, array] = {}
+        rng = random.Random(seed)
+        self._perms = [
+            (rng.randrange(1, MERSENNE_PRIME), rng.randrange(0, MERSENNE_PRIME))
+            for _ in range(bands * rows)
+        ]
+        # 第 i 条记录对应的外部 ID（scripts 表 rowid）
+        self._ids = array("q")
+        # 每个分段：有序桶键 + 对应记录下标
+        self._keys = [array("I") for _ in range(bands)]
+        self._positions = [array("I") for _ in range(bands)]
+        # 尚未合并的增量：分段 -> 桶键 -> 记录下标列表
+        self._delta: List[Dict[int, List[int]]] = [{} for _ in range(bands)]
+        self._delta_size = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def _item_hashes(self, item: str) -> array:
+        # 字符二元组的取值空间有限，缓存每个 shingle 在全部置换下的哈希值
+        cached = self._hash_cache.get(item)
+        if cached is None:
+            value = int.from_bytes(hashlib.blake2b(item.encode("utf-8"), digest_size=8).digest(), "little")
+            cached = array("I", (((a * value + b) % MERSENNE_PRIME) & MAX_HASH for a, b in self._perms))
+            if len(self._hash_cache) >= self.hash_cache_size:
+                self._hash_cache.clear()
+            self._hash_cache[item] = cached
+        return cached
+
+    def _signature(self, items: Set[str]) -> List[int]:
+        hashes = [self._item_hashes(item) for item in items]
+        if len(hashes) == 1:
+            return list(hashes[0])
+        # 逐列取最小值，循环在 C 层完成
+        return list(map(min, *hashes))
+
+    def _band_keys(self, group: str, items: Set[str]) -> List[int]:
+        signature = self._signature(items)
+        group_hash = int.from_bytes(hashlib.blake2b(group.encode("utf-8"), digest_size=4).digest(), "little")
+        keys = []
+        for band in range(self.bands):
+            chunk = tuple(signature[band * self.rows:(band + 1) * self.rows])
+            keys.append(hash((group_hash, band, chunk)) & MAX_HASH)
+        return keys
+
+    def add_many(self, records: Iterable[Tuple[int, str, Set[str]]]) -> int:
+        """records: (外部 ID, 分组键, shingle 集合)，空集合跳过"""
+        prepared = [
+            (record_id, self._band_keys(group, items))
+            for record_id, group, items in records
+            if items
+        ]
+        with self._lock:
+            for record_id, keys in prepared:
+                position = len(self._ids)
+                self._ids.append(record_id)
+                for band, key in enumerate(keys):
+                    self._delta[band].setdefault(key, []).append(position)
+            self._delta_size += len(prepared)
+            # 增量超过已合并规模的一定比例才合并，批量构建时总代价仍是 O(n log n)
+            if self._delta_size >= max(self.merge_threshold, len(self._ids) // 4):
+                self._merge()
+        return len(prepared)
+
+    def _merge(self) -> None:
+        for band in range(self.bands):
+            pairs = list(zip(self._keys[band], self._positions[band]))
+            for key, positions in self._delta[band].items():
+                pairs.extend((key, position) for position in positions)
+            pairs.sort()
+            self._keys[band] = array("I", (key for key, _ in pairs))
+            self._positions[band] = array("I", (position for _, position in pairs))
+            self._delta[band] = {}
+        self._delta_size = 0
+
+    def query(self, group: str, items: Set[str], limit: int = 50, bucket_limit: int = 1000) -> List[int]:
+        """
+        返回候选外部 ID，至多 limit 个：命中分段越多（签名越接近）越靠前，同分按新到旧。
+        热门桶（共享常见词的大量记录）只取最新的 bucket_limit 条
+        """
+        if not items:
+            return []
+        keys = self._band_keys(group, items)
+        matched: Counter = Counter()
+        with self._lock:
+            for band, key in enumerate(keys):
+                sorted_keys = self._keys[band]
+                start = bisect.bisect_left(sorted_keys, key)
+                end = bisect.bisect_right(sorted_keys, key, start)
+                matched.update(self._positions[band][max(start, end - bucket_limit):end])
+                matched.update(self._delta[band].get(key, [])[-bucket_limit:])
+            ordered = sorted(matched, key=lambda position: (matched[position], position), reverse=True)[:limit]
+            return [self._ids[position] for position in ordered]
+
+    @property
+    def pending(self) -> int:
+        return self._delta_size
+
+    def memory_bytes(self) -> int:
+        """已合并数组的占用字节数（不含尚未合并的增量）"""
+        with self._lock:
+            total = self._ids.itemsize * len(self._ids)
+            for band in range(self.bands):
+                total += self._keys[band].itemsize * len(self._keys[band])
+                total += self._positions[band].itemsize * len(self._positions[band])
+            return total
@@ -0,0 +1,266 @@
+"""
+按请求开启的采样分析：只有带指定请求头的请求才会被采样，输出 flame graph 通用的折叠栈格式
+（每行 "帧1;帧2;...;帧N 次数"，可直接用 flamegraph.pl、speedscope、inferno 打开）。
+
+- 采样线程按固定间隔读取各线程当前栈，只记录属于被分析请求的部分：
+  [loop]       事件循环正在执行该请求的任务（含其创建的子任务，如流式响应）
+  [await]      该请求的任务挂起等待中（等待上游响应、线程池结果等），记录其协程调用链
+  [threadpool] 线程池中正在替该请求执行的代码（由调用方在借出/归还资源时 attach/detach）
+- 同一时刻的多个分区分别计数，所以 [await] 与 [threadpool] 可能对应同一段时间
+- 未开启时不安装任务工厂、不挂中间件，调用方只需判断一次开关
+"""
+import asyncio
+import hmac
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+PROFILE_SUFFIX = ".folded"
+
+_active_session: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+
+
+class ProfileSession:
+    def __init__(self, task: Optional[asyncio.Task], loop: asyncio.AbstractEventLoop):
+        self.id = uuid.uuid4().hex[:12]
+        self.loop = loop
+        self.loop_thread = threading.get_ident()
+        self.tasks = {task} if task is not None else set()
+        self.threads: Counter = Counter()
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.started_at = datetime.now()
+
+
+class RequestProfiler:
+    def __init__(self, output_dir: str, interval: float = 0.005, max_files: int = 100, max_active: int = 4):
+        self.output_dir = output_dir
+        self.interval = interval
+        self.max_files = max_files
+        self.max_active = max_active
+        self._sessions: List[ProfileSession] = []
+        self._lock = threading.Lock()
+        self._sampler: Optional[threading.Thread] = None
+        self._labels: Dict[Any, str] = {}
+
+    # ------------------- 任务与线程归属 -------------------
+    def install(self, loop: asyncio.AbstractEventLoop) -> None:
+        """安装任务工厂：被分析请求中创建的子任务也计入该请求"""
+        previous = loop.get_task_factory()
+
+        def task_factory(loop, coro, **kwargs):
+            if previous is not None:
+                task = previous(loop, coro, **kwargs)
+            else:
+                task = asyncio.Task(coro, loop=loop, **kwargs)
+            context = kwargs.get("context")
+            session = context.get(_active_session) if context is not None else _active_session.get()
+            if session is not None:
+                with self._lock:
+                    session.tasks.add(task)
+            return task
+
+        loop.set_task_factory(task_factory)
+
+    def attach_thread(self) -> None:
+        """线程池中的代码开始替当前请求工作时调用（上下文变量会随 run_in_threadpool 复制到工作线程）"""
+        session = _active_session.get()
+        if session is not None and threading.get_ident() != session.loop_thread:
+            with self._lock:
+                session.threads[threading.get_ident()] += 1
+
+    def detach_thread(self) -> None:
+        session = _active_session.get()
+        if session is not None and threading.get_ident() != session.loop_thread:
+            with self._lock:
+                ident = threading.get_ident()
+                session.threads[ident] -= 1
+                if session.threads[ident] <= 0:
+                    del session.threads[ident]
+
+    # ------------------- 会话开始/结束 -------------------
+    def start(self) -> Optional[tuple]:
+        """在请求所在的任务中调用；同时进行的会话已满时返回 None，请求照常处理但不采样"""
+        with self._lock:
+            if len(self._sessions) >= self.max_active:
+                return None
+            session = ProfileSession(asyncio.current_task(), asyncio.get_running_loop())
+            self._sessions.append(session)
+            if self._sampler is None or not self._sampler.is_alive():
+                self._sampler = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+                self._sampler.start()
+        return session, _active_session.set(session)
+
+    def stop(self, session: ProfileSession, token, label: str) -> str:
+        _active_session.reset(token)
+        with self._lock:
+            self._sessions.remove(session)
+        elapsed_ms = int((time.perf_counter() - session.started) * 1000)
+        safe_label = re.sub(r"[^0-9A-Za-z]+", "_", label).strip("_") or "request"
+        name = f"{session.started_at.strftime('%Y%m%d_%H%M%S')}_{safe_label}_{elapsed_ms}ms_{session.id}{PROFILE_SUFFIX}"
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, name), "w", encoding="utf-8") as f:
+            for stack, count in session.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        self._prune()
+        return name
+
+    # ------------------- 采样 -------------------
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            # co_qualname 自 Python 3.11 起才有，旧版本退回函数名
+            label = f"{getattr(code, 'co_qualname', code.co_name)} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ",")
+            self._labels[code] = label
+        return label
+
+    def _frame_stack(self, frame) -> List[str]:
+        stack = []
+        while frame is not None:
+            stack.append(self._label(frame.f_code))
+            frame = frame.f_back
+        stack.reverse()
+        return stack
+
+    def _await_stack(self, coro) -> List[str]:
+        """挂起中的协程：沿 await 链逐层取帧（Task.get_stack 对挂起协程只返回最外层一帧）"""
+        stack = []
+        while coro is not None:
+            frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None) or getattr(coro, "ag_frame", None)
+            if frame is None:
+                break
+            stack.append(self._label(frame.f_code))
+            coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None) or getattr(coro, "ag_await", None)
+        return stack
+
+    def _run(self) -> None:
+        try:
+            while True:
+                # 整轮采样持有锁：会话结束时拿到锁即可安全地写出结果，未被分析的请求不会争用这把锁
+                with self._lock:
+                    if not self._sessions:
+                        self._sampler = None
+                        return
+                    frames = sys._current_frames()
+                    for session in self._sessions:
+                        self._sample(session, frames)
+                    del frames
+                time.sleep(self.interval)
+        except Exception as e:
+            print(f"性能分析采样线程异常退出: {e}")
+        finally:
+            # 异常退出时清掉引用，下一个会话开始时重新启动采样线程，不会一直指向已退出的线程
+            with self._lock:
+                if self._sampler is threading.current_thread():
+                    self._sampler = None
+
+    def _sample(self, session: ProfileSession, frames: Dict[int, Any]) -> None:
+        current = asyncio.current_task(session.loop)
+        for task in list(session.tasks):
+            if task.done():
+                continue
+            if task is current:
+                frame = frames.get(session.loop_thread)
+                if frame is not None:
+                    session.stacks[";".join(["[loop]"] + self._frame_stack(frame))] += 1
+            else:
+                coroutine_frames = self._await_stack(task.get_coro())
+                if coroutine_frames:
+                    session.stacks[";".join(["[await]"] + coroutine_frames)] += 1
+        for ident in session.threads:
+            frame = frames.get(ident)
+            if frame is not None:
+                session.stacks[";".join(["[threadpool]"] + self._frame_stack(frame))] += 1
+        session.samples += 1
+
+    # ------------------- 文件管理 -------------------
+    def _prune(self) -> None:
+        profiles = self.list_profiles()
+        for item in profiles[self.max_files:]:
+            try:
+                os.remove(os.path.join(self.output_dir, item["name"]))
+            except OSError:
+                pass
+
+    def list_profiles(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.output_dir):
+            return []
+        profiles = []
+        for name in os.listdir(self.output_dir):
+            if not name.endswith(PROFILE_SUFFIX):
+                continue
+            stat = os.stat(os.path.join(self.output_dir, name))
+            match = re.match(r"^(\d{8}_\d{6})_(.*)_(\d+)ms_([0-9a-f]+)$", name[:-len(PROFILE_SUFFIX)])
+            profiles.append({
+                "name": name,
+                "id": match.group(4) if match else "",
+                "route": match.group(2) if match else "",
+                "duration_ms": int(match.group(3)) if match else None,
+                "size": stat.st_size,
+                "create_time": datetime.fromtimestamp(stat.st_mtime).strftime("%Y-%m-%d %H:%M:%S")
+            })
+        profiles.sort(key=lambda item: item["name"], reverse=True)
+        return profiles
+
+    def profile_path(self, name: str) -> Optional[str]:
+        """按文件名或 X-Profile-Id 查找，只允许访问输出目录下的折叠栈文件"""
+        if re.fullmatch(r"[0-9a-f]{12}", name):
+            name = next((item["name"] for item in self.list_profiles() if item["id"] == name), "")
+        if not name or os.path.basename(name) != name or not name.endswith(PROFILE_SUFFIX):
+            return None
+        path = os.path.join(self.output_dir, name)
+        return path if os.path.isfile(path) else None
+
+
+class ProfilingMiddleware:
+    """
+    纯 ASGI 中间件：请求头 header 的值与 token 一致（未配置 token 时为任意非空值）才采样，
+    结束后把文件名写入响应头 X-Profile-Id。
+    """
+
+    def __init__(self, app, profiler: RequestProfiler, header: str = "x-profile", token: str = ""):
+        self.app = app
+        self.profiler = profiler
+        self.header = header.lower().encode("latin-1")
+        self.token = token
+
+    def _requested(self, scope) -> bool:
+        for key, value in scope.get("headers") or ():
+            if key == self.header:
+                value = value.decode("latin-1").strip()
+                if self.token:
+                    return hmac.compare_digest(value.encode("utf-8"), self.token.encode("utf-8"))
+                return value not in ("", "0")
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        started = self.profiler.start()
+        if started is None:
+            await self.app(scope, receive, send)
+            return
+        session, token = started
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers") or [])
+                headers.append((b"x-profile-id", session.id.encode("latin-1")))
+                message = dict(message, headers=headers)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            route = getattr(scope.get("route"), "path", None) or scope.get("path", "")
+            self.profiler.stop(session, token, f"{scope['method']}_{route}")
@@ -0,0 +1,170 @@
+"""
+提示词模板：静态规则在前、请求相关的内容在后。
+
+DeepSeek 等接口按输入前缀命中上下文缓存（命中部分按缓存价计费，且首 token 更快），
+因此每条提示词都拆成两段：
+- system：固定的角色、规则与输出格式，所有请求逐字相同
+- user：按变化频率从低到高排列——场景、语料库、风格、时长、核心信息
+修改 system 文本会让线上缓存整体失效一次，调整规则时尽量集中修改。
+
+输出被 max_tokens 截断时，续写提示词沿用原消息并附上已完成的部分，前缀同样可以命中缓存。
+ShotTokenEstimator 按实测的每镜头 token 数给出 max_tokens，短脚本不再写到固定上限，长脚本不再中途截断。
+"""
+import math
+import threading
+from typing import Any, Dict, List
+
+# 时长对应的镜头数量
+DURATION_SHOT_COUNTS = {
+    "15秒": 3,
+    "30秒": 6,
+    "60秒": 12
+}
+DEFAULT_SHOT_COUNT = 5
+
+STYLE_GUIDES = {
+    "口语化": "语言极度口语化，像和朋友聊天，多用网络热词、语气词（比如：哇、绝了、家人们），节奏快",
+    "专业化": "语言专业、严谨，突出产品卖点和数据，适合品牌官方账号，避免口语化表达",
+    "搞笑风": "台词幽默搞笑，镜头有反差感、夸张动作，多用梗和段子，让用户笑出声",
+    "煽情风": "语言温暖、有感染力，能触动情绪，镜头慢节奏，背景音乐舒缓，适合情感类内容"
+}
+DEFAULT_STYLE_GUIDE = "语言口语化，有感染力，适合短视频拍摄"
+
+SCRIPT_SYSTEM_PROMPT = """你是专业的短视频脚本创作师，根据用户给出的场景、语料库、风格、时长和核心信息，生成1种高质量的短视频文案方案。
+严格遵守以下所有规则，一条都不能违反：
+
+1. 必须包含用户给出的核心信息
+2. 参考用户给出的该场景专业语料库，充分利用其中的爆款词汇和表达，让文案更符合该场景的特点
+3. 时长要求：严格控制在用户要求的时长内，镜头数量与用户要求完全一致，每个镜头台词长度匹配时长,字数尽量多
+4. 严禁使用广告违禁词：最、第一、顶级、绝对、全网第一、永久等。
+5. 输出格式（镜头、台词从1开始连续编号，直到用户要求的镜头数量）：
+
+标题: 这里写视频标题，一定要足够吸睛
+镜头1: 镜头内容描述
+台词1: 台词内容（必须是博主说的话，不能空）
+
+镜头2: 镜头内容描述
+台词2: 台词内容（必须是博主说的话，不能空）
+
+（依此类推，直到最后一个镜头）
+
+配乐建议: 统一的背景音乐风格描述（整个视频使用同一首音乐）
+
+要求：
+- 按用户要求的风格写作
+- 镜头、台词的编号必须一一对应
+- 每一行只写一项，不要把多个内容写在同一行
+- 不要任何多余格式、表格、横线、星号、加粗符号
+- 台词必须是口语化的句子，不能省略
+- 配乐建议只在方案的最后统一输出一次
+- 确保文案质量高，有吸引力，能够有效传达核心信息"""
+
+CORPUS_SYSTEM_PROMPT = """你是短视频行业的文案策划，请为用户给出的创作场景生成一份专业的语料库，包含以下内容：
+1. 该场景常用的爆款词汇和表达（10-15个）
+2. 该场景常用的句式和开场白（5-8个）
+3. 该场景的情绪调动技巧和互动话术（5-8个）
+4. 该场景的行业术语和常用说法
+
+请直接输出内容，不要任何多余的格式。"""
+
+
+def shot_count_for(duration: str) -> int:
+    return DURATION_SHOT_COUNTS.get(duration, DEFAULT_SHOT_COUNT)
+
+
+def build_script_messages(scene: str, style: str, duration: str, key_info: str, corpus_content: str) -> List[Dict[str, str]]:
+    shot_count = shot_count_for(duration)
+    user_prompt = (
+        f"场景：{scene}\n"
+        f"参考语料库：{corpus_content}\n"
+        f"风格：{style}（{STYLE_GUIDES.get(style, DEFAULT_STYLE_GUIDE)}）\n"
+        f"时长：{duration}，镜头数量：{shot_count}个（镜头1 ~ 镜头{shot_count}）\n"
+        f"核心信息：{key_info}"
+    )
+    return [
+        {"role": "system", "content": SCRIPT_SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt}
+    ]
+
+
+def build_corpus_messages(scene: str) -> List[Dict[str, str]]:
+    return [
+        {"role": "system", "content": CORPUS_SYSTEM_PROMPT},
+        {"role": "user", "content": f"创作场景：{scene}"}
+    ]
+
+
+def build_continuation_messages(messages: List[Dict[str, str]], partial_content: str, next_shot: int,
+                                shot_count: int) -> List[Dict[str, str]]:
+    """输出被截断后只续写缺失的部分：已完成的镜头作为 assistant 消息，要求从 next_shot 开始接着写"""
+    if not partial_content:
+        return messages
+    if next_shot <= shot_count:
+        instruction = (f"上面的方案在镜头{next_shot}处中断了。请从镜头{next_shot}开始，继续输出镜头{next_shot} ~ 镜头{shot_count}"
+                       f"以及最后的配乐建议，不要重复已经输出的标题和镜头，格式与上面完全一致。")
+    else:
+        instruction = "上面的方案缺少最后的配乐建议，请只输出配乐建议这一行，格式与上面完全一致。"
+    return messages + [
+        {"role": "assistant", "content": partial_content},
+        {"role": "user", "content": instruction}
+    ]
+
+
+class ShotTokenEstimator:
+    """
+    按镜头数估算 max_tokens：标题与配乐建议按固定开销计，每个镜头（镜头描述 + 台词）的 token 数
+    取完整生成（finish_reason 为 stop）的实测值做指数滑动平均，再乘以余量系数。
+    被截断（finish_reason 为 length）的结果只给出下界：估值低于下界时直接抬到下界，且每次截断至少上调 growth 倍，
+    初始值偏低时也能很快收敛，不会一直截断、一直没有完整样本。
+    中文在 DeepSeek 分词下约 0.6 token/字，初始值按每镜头约 200 字计。
+    """
+
+    def __init__(self, initial_per_shot: float = 120.0, overhead: int = 80, margin: float = 1.3,
+                 alpha: float = 0.1, min_tokens: int = 256, max_tokens: int = 8192, growth: float = 1.25):
+        self.per_shot = initial_per_shot
+        self.overhead = overhead
+        self.margin = margin
+        self.alpha = alpha
+        self.min_tokens = min_tokens
+        self.max_tokens_cap = max_tokens
+        self.growth = growth
+        self.samples = 0
+        self.truncations = 0
+        self._lock = threading.Lock()
+
+    def observe(self, completion_tokens: int, shots: int) -> None:
+        if shots <= 0 or completion_tokens <= 0:
+            return
+        measured = max((completion_tokens - self.overhead) / shots, 1.0)
+        with self._lock:
+            # 样本较少时用算术平均，尽快摆脱初始值
+            weight = max(self.alpha, 1.0 / (self.samples + 1))
+            self.per_shot += weight * (measured - self.per_shot)
+            self.samples += 1
+
+    def observe_truncated(self, completion_tokens: int, completed_shots: int) -> None:
+        """截断时输出已写满 completion_tokens，却只完成了 completed_shots 个镜头（其后还有半个），按此推算每镜头至少多少 token"""
+        if completion_tokens <= 0:
+            return
+        lower_bound = completion_tokens / max(completed_shots, 1)
+        with self._lock:
+            self.per_shot = max(self.per_shot * self.growth, lower_bound)
+            self.truncations += 1
+
+    def max_tokens(self, shots: int, include_overhead: bool = True) -> int:
+        with self._lock:
+            per_shot = self.per_shot
+        estimate = (self.overhead if include_overhead else 0) + max(shots, 0) * per_shot
+        return max(self.min_tokens, min(self.max_tokens_cap, math.ceil(estimate * self.margin)))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "tokens_per_shot": round(self.per_shot, 1),
+                "samples": self.samples,
+                "truncations": self.truncations,
+                "overhead_tokens": self.overhead,
+                "margin": self.margin,
+                "min_tokens": self.min_tokens,
+                "max_tokens": self.max_tokens_cap
+            }
@@ -0,0 +1,184 @@
+"""
+上游调用的容错组件：退避重试、熔断、对冲请求。
+
+- RetryPolicy：指数退避 + 全抖动，服务端给出 Retry-After 时至少等待该时长，超过上限则放弃重试
+- CircuitBreaker：连续失败达到阈值后熔断，冷却期内直接失败；冷却结束放行一个探测请求，成功即恢复
+- LatencyTracker：保留最近若干次成功调用的耗时，用于估算对冲触发时间（如 p95）
+- hedged：首个请求超过给定时长仍未返回时再发一个，取先成功的结果并取消另一个
+"""
+import asyncio
+import math
+import random
+import threading
+import time
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class CircuitOpenError(Exception):
+    def __init__(self, name: str, retry_in: float):
+        # 向上取整且至少 1 秒，提示给用户的等待时间不会出现“0 秒后重试”
+        retry_in = max(math.ceil(retry_in), 1)
+        super().__init__(f"{name} 熔断中，{retry_in} 秒后重试")
+        self.name = name
+        self.retry_in = retry_in
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 可以是秒数或 HTTP 日期"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max((when - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+
+class RetryPolicy:
+    def __init__(self, max_attempts: int = 3, base_delay: float = 0.5, max_delay: float = 8.0,
+                 max_retry_after: float = 30.0):
+        self.max_attempts = max(max_attempts, 1)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_retry_after = max_retry_after
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> Optional[float]:
+        """第 attempt 次（从 0 开始）失败后的等待时间；返回 None 表示不应再重试"""
+        if attempt + 1 >= self.max_attempts:
+            return None
+        if retry_after is not None:
+            if retry_after > self.max_retry_after:
+                return None
+            # 在服务端要求的时间之后再加一点抖动，避免所有客户端同时重试
+            return retry_after + random.uniform(0, self.base_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, recovery_seconds: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_seconds = recovery_seconds
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened_count = 0
+        self.rejected = 0
+        self._probing = False
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> None:
+        """熔断中抛出 CircuitOpenError；冷却结束后只放行一个探测请求"""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            remaining = self.opened_at + self.recovery_seconds - time.monotonic()
+            if self.state == self.OPEN and remaining <= 0:
+                self.state = self.HALF_OPEN
+            now = time.monotonic()
+            # 探测请求被取消时不会回报结果，超过一个冷却期仍未回报就允许再探测一次
+            if self.state == self.HALF_OPEN and (not self._probing or now - self._probe_started > self.recovery_seconds):
+                self._probing = True
+                self._probe_started = now
+                return
+            self.rejected += 1
+            if self.state == self.HALF_OPEN:
+                # 探测请求尚未回报：最迟到探测超时（再放行下一个探测）时就能重试
+                remaining = self._probe_started + self.recovery_seconds - now
+            raise CircuitOpenError(self.name, remaining)
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probing = False
+            self.state = self.CLOSED
+
+    def record_failure(self) -> None:
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened_count += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "opened_count": self.opened_count,
+                "rejected": self.rejected,
+                "failure_threshold": self.failure_threshold,
+                "recovery_seconds": self.recovery_seconds
+            }
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 200):
+        self.samples: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float) -> None:
+        with self._lock:
+            self.samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        with self._lock:
+            if len(self.samples) < max(min_samples, 1):
+                return None
+            ordered = sorted(self.samples)
+        return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+async def hedged(attempt: Callable[[], Awaitable[Any]], hedge_after: Optional[float],
+                 on_event: Optional[Callable[[str], None]] = None) -> Any:
+    """
+    hedge_after 为 None 时等同于直接 await attempt()。
+    否则首个请求超过 hedge_after 秒未完成时再发起一个，返回先成功的结果；两者都失败时抛出后失败的异常。
+    on_event 依次收到 "fired"（发出了对冲请求）与 "won"（对冲请求先返回）。
+    """
+    if hedge_after is None:
+        return await attempt()
+
+    first = asyncio.ensure_future(attempt())
+    pending = {first}
+    try:
+        done, _ = await asyncio.wait(pending, timeout=hedge_after)
+        if done:
+            return first.result()
+        second = asyncio.ensure_future(attempt())
+        pending.add(second)
+        if on_event:
+            on_event("fired")
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second and on_event:
+                        on_event("won")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()